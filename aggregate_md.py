@@ -4,11 +4,14 @@ from datetime import datetime
 import os
 ts_db = f"{datetime.now().strftime('%Y-%m-%d %H:%M')}"
 ts_time = f"{datetime.now().strftime('%H:%M:%S')}"
-print(f"\n---------- {ts_time} starting {os.path.basename(__file__)}")
+# Only announce when run directly, not when imported by the crawlers (or their worker processes)
+if __name__ == '__main__':
+    print(f"\n---------- {ts_time} starting {os.path.basename(__file__)}")
 import time
 start_time = time.time()
 
 import os
+import json
 from pathlib import Path
 
 # GLOBALS
@@ -20,13 +23,16 @@ count_row = 0
 count_total = 0
 count = 0
 
-def aggregate_md_files(folder_path: str, output_file: str = None, website_url: str = None) -> str:
+PAGE_RANK_FILE = ".page_rank.json"  # {relative .md path: {"url", "rank", "in_degree"}}, written by website2md.py
+
+def aggregate_md_files(folder_path: str, output_file: str = None, website_url: str = None, by_importance: bool = True) -> str:
     """
     Aggregate all .md files in a folder (and subfolders) into a single .md file.
     
     Args:
         folder_path: Path to folder containing .md files
         output_file: Output path (default: {folder_name}.md in parent dir)
+        by_importance: Order pages by link rank when the folder has a PAGE_RANK_FILE (else by path)
     
     Returns:
         str: Path to combined .md file
@@ -63,6 +69,13 @@ def aggregate_md_files(folder_path: str, output_file: str = None, website_url: s
     if not md_files:
         print(f"⚠️ No .md files found in {folder_path}")
         return None
+
+    rank_file = folder / PAGE_RANK_FILE
+    if by_importance and rank_file.exists():
+        ranks = json.loads(rank_file.read_text(encoding="utf-8"))
+        # Most linked-to pages first; stable sort keeps path order for ties and unranked pages
+        md_files.sort(key=lambda f: -ranks.get(f.relative_to(folder).as_posix(), {}).get("rank", 0.0))
+        print(f"📊 Ordering pages by link importance ({rank_file.name})")
     
     print(f"📁 Found {len(md_files)} .md files in {folder.name}/")
 
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+bench_website2md_parse.py
+
+Compares the per-page CPU cost of website2md's HTML processing:
+  - legacy:  two BeautifulSoup(html.parser) parses (links + main content), then markdownify
+             re-parses the serialised main content
+  - current: convert_page(), one parse on the fastest available backend (lxml), links and
+             markdown produced from the same tree
+
+Usage:
+  python bench_website2md_parse.py https://corp.kaltura.com/ page.html [...] [-n 20]
+"""
+
+import argparse
+import re
+import statistics
+import time
+from urllib.parse import urlparse
+
+import requests
+from bs4 import BeautifulSoup
+from markdownify import markdownify as md
+
+import website2md as w
+
+
+def legacy_path(html: str, url: str, domain: str) -> dict:
+    links = w.links_from_soup(BeautifulSoup(html, "html.parser"), url, domain)
+    main_content = w.main_content_from_soup(BeautifulSoup(html, "html.parser"))
+    markdown = md(str(main_content) if main_content else "", heading_style="ATX", strip=["a"])
+    markdown = re.sub(r"\n{3,}", "\n\n", markdown).strip()
+    return {"markdown": markdown, "links": links}
+
+
+def load(source: str) -> tuple[str, str]:
+    """Return (html, base_url) for a URL or a local .html file."""
+    if source.startswith(("http://", "https://")):
+        resp = requests.get(source, timeout=30, headers={"User-Agent": w.HTTP_USER_AGENT})
+        resp.encoding = resp.apparent_encoding
+        return resp.text, source
+    with open(source, encoding="utf-8", errors="ignore") as f:
+        return f.read(), "https://example.com/"
+
+
+def time_it(fn, html: str, url: str, domain: str, runs: int) -> float:
+    """Median wall time in ms over runs."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(html, url, domain)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark website2md page parsing: legacy vs single-pass')
+    parser.add_argument('sources', nargs='+', help='URLs or local .html files')
+    parser.add_argument('-n', '--runs', type=int, default=10, help='Runs per page (median is reported)')
+    args = parser.parse_args()
+
+    print(f"Parser backend: {w.HTML_PARSER}\n")
+    print(f"{'page':<50} {'KB':>7} {'legacy ms':>10} {'current ms':>11} {'speedup':>8}  same output")
+    total_legacy = total_current = 0.0
+    for source in args.sources:
+        html, url = load(source)
+        domain = urlparse(url).netloc
+        legacy_ms = time_it(legacy_path, html, url, domain, args.runs)
+        current_ms = time_it(w.convert_page, html, url, domain, args.runs)
+        total_legacy += legacy_ms
+        total_current += current_ms
+        old, new = legacy_path(html, url, domain), w.convert_page(html, url, domain)
+        same = "yes" if old["links"] == new["links"] and old["markdown"] == new["markdown"] else "differs"
+        print(f"{source[-50:]:<50} {len(html) / 1024:>7.0f} {legacy_ms:>10.1f} {current_ms:>11.1f} {legacy_ms / current_ms:>7.1f}x  {same}")
+
+    print(f"\nTotal: legacy {total_legacy:.1f}ms, current {total_current:.1f}ms ({total_legacy / total_current:.1f}x)")
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+# Long-running headless Chromium shared by the crawlers (website2md.py, website2md_chrome.py)
+
+from datetime import datetime
+import os
+ts_db = f"{datetime.now().strftime('%Y-%m-%d %H:%M')}"
+ts_time = f"{datetime.now().strftime('%H:%M:%S')}"
+# Only announce when run directly, not when imported by the crawlers
+if __name__ == '__main__':
+    print(f"\n---------- {ts_time} starting {os.path.basename(__file__)}")
+import time
+start_time = time.time()
+
+"""
+Start once (e.g. from a login item or the Alfred `web2md` workflow) and leave it running:
+
+  python browser_daemon.py            # start in the foreground, Ctrl-C to stop
+  python browser_daemon.py --status   # is it up, and where
+  python browser_daemon.py --stop     # stop a running daemon
+
+It launches one Chromium with a persistent profile (so the HTTP disk cache survives across crawl
+runs), exposes the Chrome DevTools Protocol on 127.0.0.1:DAEMON_PORT and keeps WARM_PAGES blank
+tabs open so renderer processes are ready. Crawlers call open_browser(): it connects over CDP
+when the daemon answers and launches a private browser otherwise. The browser is relaunched if
+it crashes. The crawlers' request blocking (browser_page.install_request_blocking) uses
+Chromium's URL blocking instead of Playwright routing, which would turn the cache off, so the
+site's documents and scripts come from the disk cache on the next run.
+"""
+
+import asyncio
+import json
+import signal
+import sys
+import urllib.request
+from pathlib import Path
+
+from playwright.async_api import async_playwright
+
+# GLOBALS
+
+USE_BROWSER_DAEMON = True  # False = crawlers always launch their own browser
+DAEMON_PORT = 9222  # CDP port, bound to 127.0.0.1 only
+DAEMON_DIR = Path.home() / ".cache" / "website2md-browser"  # profile + disk cache + state file
+DAEMON_CACHE_MB = 1024  # Chromium disk cache size
+WARM_PAGES = 2  # blank tabs kept open so renderer processes are already running
+DAEMON_PROBE_TIMEOUT = 1.0  # seconds to wait for the CDP endpoint before launching instead
+DAEMON_RESTART_DELAY = 2  # seconds before relaunching a crashed browser
+
+def state_file() -> Path:
+    return DAEMON_DIR / "daemon.json"
+
+def daemon_endpoint() -> str | None:
+    """CDP URL of the running daemon, or None if it is not up (or not answering)."""
+    try:
+        state = json.loads(state_file().read_text(encoding="utf-8"))
+        os.kill(state["pid"], 0)
+        endpoint = f"http://127.0.0.1:{state['port']}"
+        with urllib.request.urlopen(f"{endpoint}/json/version", timeout=DAEMON_PROBE_TIMEOUT) as resp:
+            json.load(resp)
+        return endpoint
+    except (OSError, ValueError, KeyError):
+        return None
+
+def daemon_pid() -> int | None:
+    """PID of the running daemon process (its Chromium runs as a child), or None."""
+    try:
+        return json.loads(state_file().read_text(encoding="utf-8"))["pid"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+async def open_browser(playwright, launch_opts: dict = None):
+    """
+    (browser, shared_context) for a crawl. With the daemon up, browser is connected over CDP and
+    shared_context is its persistent default context (warm, disk cache), which other runs may be
+    using at the same time, so callers must scope routes and listeners to their own pages there.
+    Otherwise a private browser is launched with launch_opts and shared_context is None.
+    Either way close_browser() releases it.
+    """
+    launch_opts = launch_opts or {"headless": True}
+    # A proxy is a launch option of the whole browser, so proxied runs always get their own
+    endpoint = daemon_endpoint() if USE_BROWSER_DAEMON and "proxy" not in launch_opts else None
+    if endpoint:
+        try:
+            browser = await playwright.chromium.connect_over_cdp(endpoint, timeout=10000)
+            print(f"♻️  Using browser daemon at {endpoint}")
+            return browser, browser.contexts[0]
+        except Exception as e:
+            print(f"⚠️  Browser daemon at {endpoint} not usable ({e}), launching a browser")
+    return await playwright.chromium.launch(**launch_opts), None
+
+async def close_browser(browser, shared_context=None, pages: list = None) -> None:
+    """Close our own tabs in the daemon's context and disconnect, or close a launched browser."""
+    if shared_context is not None:
+        for page in pages or []:
+            if page.context == shared_context and not page.is_closed():
+                await page.close()
+    # Over CDP this only drops the contexts we created and disconnects; the daemon keeps running
+    await browser.close()
+
+# DAEMON
+
+async def run_daemon() -> None:
+    DAEMON_DIR.mkdir(parents=True, exist_ok=True)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    args = [
+        f"--remote-debugging-port={DAEMON_PORT}",
+        "--remote-debugging-address=127.0.0.1",
+        f"--disk-cache-dir={DAEMON_DIR / 'cache'}",
+        f"--disk-cache-size={DAEMON_CACHE_MB * 1024 * 1024}",
+    ]
+    async with async_playwright() as p:
+        while not stop.is_set():
+            context = await p.chromium.launch_persistent_context(str(DAEMON_DIR / "profile"), headless=True, args=args)
+            for _ in range(max(0, WARM_PAGES - len(context.pages))):
+                await context.new_page()
+            state_file().write_text(json.dumps({"pid": os.getpid(), "port": DAEMON_PORT,
+                                                "started": datetime.now().isoformat(timespec="seconds")}), encoding="utf-8")
+            print(f"🌐 Browser daemon up: CDP on http://127.0.0.1:{DAEMON_PORT}, profile {DAEMON_DIR}")
+
+            closed = asyncio.Event()
+            context.on("close", lambda _: closed.set())
+            waiters = [asyncio.create_task(stop.wait()), asyncio.create_task(closed.wait())]
+            await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in waiters:
+                waiter.cancel()
+            if stop.is_set():
+                await context.close()
+                break
+            print(f"⚠️  Browser exited, relaunching in {DAEMON_RESTART_DELAY}s")
+            await asyncio.sleep(DAEMON_RESTART_DELAY)
+
+    state_file().unlink(missing_ok=True)
+    print("🛑 Browser daemon stopped")
+
+def stop_daemon() -> bool:
+    pid = daemon_pid()
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except (OSError, TypeError):
+        return False
+    return True
+
+########################################################################################################
+
+if __name__ == '__main__':
+    if "--status" in sys.argv:
+        endpoint = daemon_endpoint()
+        print(f"🌐 Browser daemon up at {endpoint}" if endpoint else "💤 Browser daemon not running")
+    elif "--stop" in sys.argv:
+        print("🛑 Stop signal sent" if stop_daemon() else "💤 Browser daemon not running")
+    elif daemon_endpoint():
+        print(f"🌐 Browser daemon already running at {daemon_endpoint()}")
+    else:
+        asyncio.run(run_daemon())
+
+    run_time = round((time.time() - start_time), 3)
+    if run_time < 1:
+        print(f'\n{os.path.basename(__file__)} finished in {round(run_time*1000)}ms at {datetime.now().strftime("%H:%M:%S")}.\n')
+    elif run_time < 60:
+        print(f'\n{os.path.basename(__file__)} finished in {round(run_time)}s at {datetime.now().strftime("%H:%M:%S")}.\n')
+    elif run_time < 3600:
+        print(f'\n{os.path.basename(__file__)} finished in {round(run_time/60)}mns at {datetime.now().strftime("%H:%M:%S")}.\n')
+    else:
+        print(f'\n{os.path.basename(__file__)} finished in {round(run_time/3600, 2)}hrs at {datetime.now().strftime("%H:%M:%S")}.\n')
@@ -0,0 +1,296 @@
+# Page helpers shared by the crawlers (website2md.py, website2md_chrome.py, website2md_browserbase.py)
+
+import asyncio
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+# GLOBALS
+
+# Adaptive render wait (replaces the fixed 3 s sleep after domcontentloaded)
+RENDER_QUIET_MS = 250  # network and main-content DOM must be quiet this long
+RENDER_MAX_WAIT_MS = 3000  # hard ceiling per page
+RENDER_LONG_REQUEST_MS = 1500  # pending requests older than this are ignored (long-polling, analytics)
+
+# Request interception: sub-requests the crawl never needs (we only keep text)
+BLOCK_RESOURCE_TYPES = {"image", "media", "font", "stylesheet"}
+BLOCK_ALL_THIRD_PARTY = False  # True = abort every request to another site unless allow-listed
+THIRD_PARTY_ALLOW_DOMAINS = set()  # always let through, e.g. {"cdn.jsdelivr.net"} for SPAs needing a CDN
+THIRD_PARTY_DENY_DOMAINS = {
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "facebook.net", "connect.facebook.net", "hotjar.com", "segment.io", "segment.com",
+    "hs-analytics.net", "hs-scripts.com", "hubspot.com", "linkedin.com", "licdn.com",
+    "clarity.ms", "bing.com", "mixpanel.com", "fullstory.com", "intercom.io", "drift.com",
+    "optimizely.com", "cookielaw.org", "onetrust.com", "cookiebot.com", "newrelic.com", "nr-data.net",
+}
+# URL extensions of those resource types, for blocking by URL pattern (see install_request_blocking())
+BLOCK_EXTENSIONS = {
+    "image": {".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif", ".svg", ".ico", ".bmp"},
+    "media": {".mp4", ".webm", ".mov", ".mp3", ".ogg", ".wav", ".m4a", ".m3u8"},
+    "font": {".woff", ".woff2", ".ttf", ".otf", ".eot"},
+    "stylesheet": {".css"},
+}
+# Typical transfer sizes, used to estimate bytes saved (aborted requests are never downloaded)
+EST_RESOURCE_BYTES = {
+    "image": 60_000, "media": 800_000, "font": 40_000, "stylesheet": 30_000,
+    "script": 50_000, "xhr": 5_000, "fetch": 5_000, "other": 10_000,
+}
+
+# Injected after domcontentloaded: resolves once the main content container has had no DOM
+# mutations for quietMs (or maxMs elapsed). Returns the time spent waiting in the page.
+DOM_QUIET_JS = """
+([quietMs, maxMs]) => new Promise(resolve => {
+    const root = document.querySelector("main, article, [role='main'], #main, #content")
+        || document.body || document.documentElement;
+    const start = performance.now();
+    if (!root) { resolve(0); return; }
+    let last = start;
+    const obs = new MutationObserver(() => { last = performance.now(); });
+    obs.observe(root, {childList: true, subtree: true, characterData: true});
+    const check = () => {
+        const now = performance.now();
+        if (now - last >= quietMs || now - start >= maxMs) {
+            obs.disconnect();
+            resolve(Math.round(now - start));
+        } else {
+            setTimeout(check, Math.min(50, quietMs));
+        }
+    };
+    setTimeout(check, Math.min(50, quietMs));
+})
+"""
+
+# Requests that never "finish" in a useful sense and must not hold up readiness
+IGNORED_RESOURCE_TYPES = {"websocket", "eventsource", "ping", "beacon"}
+
+def track_network(page) -> dict:
+    """
+    Attach request listeners to a page and return a live {request: start_time} dict of in-flight
+    requests, used by wait_for_render() for network-quiet detection. Returns None if the page
+    does not support event listeners.
+    """
+    inflight = {}
+
+    def _on_request(request):
+        if request.resource_type not in IGNORED_RESOURCE_TYPES:
+            inflight[request] = time.monotonic()
+
+    def _on_done(request):
+        inflight.pop(request, None)
+
+    try:
+        page.on("request", _on_request)
+        page.on("requestfinished", _on_done)
+        page.on("requestfailed", _on_done)
+    except Exception:
+        return None
+    return inflight
+
+async def wait_for_render(page, inflight: dict = None, nav_start: float = None) -> int:
+    """
+    Adaptive replacement for a fixed post-load sleep. Waits until:
+      - the network is quiet: nothing started after nav_start is still pending (requests pending
+        longer than RENDER_LONG_REQUEST_MS are treated as long-polling/analytics and ignored)
+      - the main content container has stopped mutating for RENDER_QUIET_MS
+    or RENDER_MAX_WAIT_MS has elapsed. Returns the measured wait in ms.
+    """
+    start = time.monotonic()
+    nav_start = nav_start or start
+    if inflight is not None:
+        # Drop requests left over from previous navigations of this page
+        for request in [r for r, t in inflight.items() if t < nav_start]:
+            inflight.pop(request, None)
+    deadline = start + RENDER_MAX_WAIT_MS / 1000
+
+    while True:
+        now = time.monotonic()
+        remaining_ms = int((deadline - now) * 1000)
+        if remaining_ms <= 0:
+            break
+        try:
+            await page.evaluate(DOM_QUIET_JS, [RENDER_QUIET_MS, remaining_ms])
+        except Exception:
+            # Execution context replaced (client-side redirect) - let the loop re-check
+            await asyncio.sleep(0.05)
+            continue
+        if inflight is None:
+            break
+        now = time.monotonic()
+        recent = [t for t in inflight.values() if t >= nav_start and now - t < RENDER_LONG_REQUEST_MS / 1000]
+        if not recent:
+            break
+        await asyncio.sleep(0.05)
+
+    return round((time.monotonic() - start) * 1000)
+
+# In-page port of website2md.main_content_from_soup(), run on a detached clone of the rendered DOM so only the
+# main content HTML and the raw link hrefs cross the CDP connection instead of page.content().
+# When the semantic containers hold little text, falls back to a Readability-style pick: the
+# element whose direct <p> children carry the most text (half credit to the grandparent). The
+# caller passes the rules: tag lists, regex sources for the boilerplate / main-content attribute
+# matches and min_text (see website2md.EXTRACT_RULES).
+EXTRACT_MAIN_JS = """
+(rules) => {
+    const page = document.documentElement;
+    const attrs = (selector, attr) => Array.from(page.querySelectorAll(selector), el => el.getAttribute(attr));
+    const result = {
+        links: attrs("a[href]", "href"),
+        canonical: page.querySelector("link[rel~='canonical'][href]")?.getAttribute("href") || null,
+        lang: page.getAttribute("lang"),
+        alternates: Array.from(page.querySelectorAll("link[rel~='alternate'][hreflang][href]"),
+                               el => [el.getAttribute("hreflang"), el.getAttribute("href")]),
+        dom_chars: page.outerHTML.length,
+    };
+    const doc = page.cloneNode(true);
+    const matching = (root, attr, pattern) => {
+        const re = new RegExp(pattern, "i");
+        return Array.from(root.querySelectorAll(`[${attr}]`)).filter(el => re.test(el.getAttribute(attr)));
+    };
+    const remove = els => els.forEach(el => el.remove());
+
+    remove(doc.querySelectorAll(rules.junk.concat(rules.layout).join(",")));
+    remove(matching(doc, "id", rules.boilerplate_id));
+    remove(matching(doc, "class", rules.boilerplate_class));
+    remove(matching(doc, "role", rules.boilerplate_role));
+    remove(matching(doc, "data-section", rules.data_section));
+
+    const text = el => (el ? el.textContent.replace(/\\s+/g, " ").trim().length : 0);
+    let main = doc.querySelector("main") || doc.querySelector("article")
+        || matching(doc, "id", rules.main_id)[0] || matching(doc, "class", rules.main_class)[0]
+        || doc.querySelector("[role='main']") || doc.querySelector("body");
+
+    if (text(main) < rules.min_text) {
+        const scores = new Map();
+        for (const p of doc.querySelectorAll("p")) {
+            const chars = text(p);
+            if (chars < 25 || !p.parentElement) continue;
+            scores.set(p.parentElement, (scores.get(p.parentElement) || 0) + chars);
+            const grand = p.parentElement.parentElement;
+            if (grand) scores.set(grand, (scores.get(grand) || 0) + chars / 2);
+        }
+        let best = null, bestScore = 0;
+        for (const [el, score] of scores) if (score > bestScore) { best = el; bestScore = score; }
+        if (best && text(best) > text(main)) main = best;
+    }
+
+    if (main) remove(matching(main, "class", rules.inner_nav_class));
+    result.html = main ? main.outerHTML : "";
+    return result;
+}
+"""
+def is_same_site(host: str, site_host: str) -> bool:
+    """True if host is the crawled site or one of its subdomains (cdn.example.com for www.example.com)."""
+    base = site_host.lower().removeprefix("www.")
+    host = (host or "").lower()
+    return host == base or host.endswith("." + base)
+
+def _host_matches(host: str, domains: set) -> bool:
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+def block_reason(url: str, resource_type: str, site_host: str) -> str | None:
+    """
+    Decide whether a sub-request should be aborted. Returns the reason (used as report bucket)
+    or None to let it through. The allow list always wins, then resource type; the crawled site
+    itself is never a tracker (crawling hubspot.com must not abort its own pages), then domain lists.
+    """
+    host = (urlparse(url).hostname or "").lower()
+    if _host_matches(host, THIRD_PARTY_ALLOW_DOMAINS):
+        return None
+    if resource_type in BLOCK_RESOURCE_TYPES:
+        return resource_type
+    if is_same_site(host, site_host):
+        return None
+    if _host_matches(host, THIRD_PARTY_DENY_DOMAINS):
+        return "tracker"
+    if BLOCK_ALL_THIRD_PARTY and resource_type != "document":
+        return "third-party"
+    return None
+
+def blocked_url_patterns(site_host: str) -> list[str] | None:
+    """
+    Chromium URL patterns (CDP Network.setBlockedURLs, * = wildcard) for the blocking settings: the
+    BLOCK_EXTENSIONS of BLOCK_RESOURCE_TYPES and the tracker domains other than the crawled site.
+    None when the settings need a per-request decision (BLOCK_ALL_THIRD_PARTY, an allow list).
+    """
+    if BLOCK_ALL_THIRD_PARTY or THIRD_PARTY_ALLOW_DOMAINS:
+        return None
+    patterns = []
+    for kind in sorted(BLOCK_RESOURCE_TYPES):
+        for ext in sorted(BLOCK_EXTENSIONS.get(kind, ())):
+            patterns += [f"*{ext}", f"*{ext}?*"]
+    for domain in sorted(THIRD_PARTY_DENY_DOMAINS):
+        if not is_same_site(domain, site_host) and not is_same_site(site_host, domain):
+            patterns += [f"*://{domain}/*", f"*://*.{domain}/*"]
+    return patterns
+
+async def install_request_blocking(page, site_host: str) -> dict:
+    """
+    Abort the sub-requests of a page that the blocking settings reject. Returns a live stats dict
+    (blocked counts per reason, estimated bytes saved, bytes actually downloaded) for
+    print_blocking_report().
+
+    Blocking goes through Chromium's own URL blocking (blocked_url_patterns()) rather than
+    Playwright routing, because routing turns the HTTP cache off for the whole page: this way the
+    site's documents and scripts still come from the browser's disk cache (browser_daemon.py).
+    URL patterns only see extensions, so an image served without one gets through. Settings that
+    need block_reason() per request fall back to routing every request, without the cache.
+    """
+    stats = {"blocked": defaultdict(int), "bytes_saved": 0, "allowed": 0, "bytes_downloaded": 0}
+
+    def _blocked(request, reason: str) -> None:
+        stats["blocked"][reason] += 1
+        stats["bytes_saved"] += EST_RESOURCE_BYTES.get(request.resource_type, EST_RESOURCE_BYTES["other"])
+
+    def _on_response(response):
+        try:
+            stats["bytes_downloaded"] += int(response.headers.get("content-length", 0))
+        except ValueError:
+            pass
+
+    page.on("response", _on_response)
+    patterns = blocked_url_patterns(site_host)
+    if patterns is not None:
+        def _on_request(request):
+            stats["allowed"] += 1
+
+        def _on_failed(request):
+            # Chromium fails requests it blocked itself with net::ERR_BLOCKED_BY_INSPECTOR
+            if "inspector" in (request.failure or "").lower():
+                stats["allowed"] -= 1
+                _blocked(request, block_reason(request.url, request.resource_type, site_host) or request.resource_type)
+
+        page.on("request", _on_request)
+        page.on("requestfailed", _on_failed)
+        cdp = await page.context.new_cdp_session(page)
+        await cdp.send("Network.enable")
+        await cdp.send("Network.setBlockedURLs", {"urls": patterns})
+        return stats
+
+    async def _route(route):
+        request = route.request
+        reason = block_reason(request.url, request.resource_type, site_host)
+        if reason is None:
+            stats["allowed"] += 1
+            await route.continue_()
+            return
+        _blocked(request, reason)
+        await route.abort()
+
+    await page.route("**/*", _route)
+    return stats
+
+def print_blocking_report(stats_list: list[dict]) -> None:
+    """Print blocked requests per reason, bytes downloaded and the estimated bandwidth saved across all pages."""
+    blocked = defaultdict(int)
+    for stats in stats_list:
+        for reason, n in stats["blocked"].items():
+            blocked[reason] += n
+    if not blocked:
+        return
+    saved = sum(s["bytes_saved"] for s in stats_list)
+    downloaded = sum(s["bytes_downloaded"] for s in stats_list)
+    allowed = sum(s["allowed"] for s in stats_list)
+    breakdown = ", ".join(f"{reason} {n:,}" for reason, n in sorted(blocked.items(), key=lambda x: -x[1]))
+    print(f"🚫 Blocked {sum(blocked.values()):,} requests ({breakdown}); allowed {allowed:,}")
+    print(f"   {downloaded / 1024 / 1024:.1f} MB downloaded; blocking saved roughly {saved / 1024 / 1024:.1f} MB "
+          f"(not measured: blocked requests times typical sizes, EST_RESOURCE_BYTES)")
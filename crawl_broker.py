@@ -0,0 +1,122 @@
+# Message transport between the coordinator and the worker nodes of a distributed crawl (website2md.py --broker)
+
+"""
+The coordinator puts leases (a batch of URLs for one worker) on the task queue and reads back a
+"taken" acknowledgement and per-URL results from the result queue; a "finished" flag tells idle
+workers the crawl is over. Both queues must be FIFO: the coordinator counts the tasks still
+queued (pending_tasks()) to tell which unacknowledged leases a worker has taken.
+Messages are JSON dicts on both brokers, so a crawl that works in-process works over the wire.
+
+  memory://                    InProcessBroker: coordinator and workers in one process (testing)
+  redis://host:6379/0          RedisBroker: any Redis-compatible server (Redis, Valkey, KeyDB, ...)
+"""
+
+import asyncio
+import json
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+BROKER_PREFIX = "website2md"  # key prefix on a shared server: one distributed crawl per prefix
+
+class InProcessBroker:
+    """asyncio queues standing in for a server, for a coordinator and workers on one event loop."""
+
+    def __init__(self):
+        self.url = "memory://"
+        self.tasks = asyncio.Queue()
+        self.results = asyncio.Queue()
+        self.done = asyncio.Event()
+
+    async def _get(self, queue: asyncio.Queue, timeout: float, until_done: bool = False) -> dict | None:
+        getter = asyncio.ensure_future(queue.get())
+        waiters = [getter, asyncio.ensure_future(self.done.wait())] if until_done else [getter]
+        await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        for waiter in waiters[1:]:
+            waiter.cancel()
+        if getter.done():
+            return json.loads(getter.result())
+        getter.cancel()
+        return None
+
+    async def reset(self) -> None:
+        self.tasks, self.results = asyncio.Queue(), asyncio.Queue()
+        self.done.clear()
+
+    async def put_task(self, task: dict) -> None:
+        await self.tasks.put(json.dumps(task))
+
+    async def get_task(self, timeout: float) -> dict | None:
+        return await self._get(self.tasks, timeout, until_done=True)
+
+    async def pending_tasks(self) -> int:
+        return self.tasks.qsize()
+
+    async def put_result(self, result: dict) -> None:
+        await self.results.put(json.dumps(result))
+
+    async def get_result(self, timeout: float) -> dict | None:
+        return await self._get(self.results, timeout)
+
+    async def finish(self) -> None:
+        self.done.set()
+
+    async def finished(self) -> bool:
+        return self.done.is_set()
+
+    async def close(self) -> None:
+        pass
+
+class RedisBroker:
+    """Two lists (LPUSH / BRPOP, so FIFO) and a flag key under BROKER_PREFIX on a Redis-compatible server."""
+
+    def __init__(self, url: str, prefix: str = BROKER_PREFIX):
+        if aioredis is None:
+            raise RuntimeError(f"{url} needs the redis package (pip install redis)")
+        self.url = url
+        self.redis = aioredis.from_url(url)
+        self.tasks_key = f"{prefix}:tasks"
+        self.results_key = f"{prefix}:results"
+        self.done_key = f"{prefix}:finished"
+
+    async def _pop(self, key: str, timeout: float) -> dict | None:
+        # BRPOP takes whole seconds on older servers; 0 would block forever
+        popped = await self.redis.brpop(key, timeout=max(1, round(timeout)))
+        return json.loads(popped[1]) if popped else None
+
+    async def reset(self) -> None:
+        await self.redis.delete(self.tasks_key, self.results_key, self.done_key)
+
+    async def put_task(self, task: dict) -> None:
+        await self.redis.lpush(self.tasks_key, json.dumps(task))
+
+    async def get_task(self, timeout: float) -> dict | None:
+        return await self._pop(self.tasks_key, timeout)
+
+    async def pending_tasks(self) -> int:
+        return await self.redis.llen(self.tasks_key)
+
+    async def put_result(self, result: dict) -> None:
+        await self.redis.lpush(self.results_key, json.dumps(result))
+
+    async def get_result(self, timeout: float) -> dict | None:
+        return await self._pop(self.results_key, timeout)
+
+    async def finish(self) -> None:
+        await self.redis.set(self.done_key, "1")
+
+    async def finished(self) -> bool:
+        return bool(await self.redis.exists(self.done_key))
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+def make_broker(url: str):
+    """Broker for a --broker URL (see the module docstring)."""
+    if url in ("memory", "memory://"):
+        return InProcessBroker()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url)
+    raise ValueError(f"Unsupported broker URL {url!r} (use memory:// or redis://host:port/db)")
@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+
+import website2md
+from crawl_broker import InProcessBroker, make_broker
+from website2md import CrawlPipeline, CrawlState, convert_page
+
+DOMAIN = "example.com"
+PAGE = "<html><body><main><h1>{title}</h1><p>Some text about {title}.</p></main></body></html>"
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    """A distributed-crawl coordinator with short leases and no retry backoff (started by start())."""
+    monkeypatch.setattr(website2md, "OUT_DIR", str(tmp_path))
+    monkeypatch.setattr(website2md, "LEASE_BATCH", 2)
+    monkeypatch.setattr(website2md, "LEASE_SECONDS", 0.2)
+    monkeypatch.setattr(website2md, "RETRY_BACKOFF", 0)
+    state = CrawlState(str(tmp_path / "state.sqlite"))
+    yield CrawlPipeline(state, DOMAIN, None, {})
+    state.close()
+
+
+def start(pipeline: CrawlPipeline) -> InProcessBroker:
+    broker = InProcessBroker()
+    pipeline.start_remote(broker)
+    return broker
+
+
+async def until(condition, timeout: float = 3) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def result(task: dict, url: str) -> dict:
+    converted = convert_page(PAGE.format(title=url.rsplit("/", 1)[-1]), url, DOMAIN)
+    converted["links"] = sorted(converted["links"])
+    outcome = {"tier": "http", "final_url": url, "etag": None, "last_modified": None, "converted": converted}
+    return {"lease": task["lease"], "url": url, "worker": "w1", "outcome": outcome}
+
+
+def status(pipeline: CrawlPipeline, url: str) -> str:
+    return pipeline.state.db.execute("SELECT status FROM pages WHERE url = ?", (url,)).fetchone()[0]
+
+
+def test_broker_queues_are_fifo():
+    async def main():
+        broker = make_broker("memory://")
+        for i in range(3):
+            await broker.put_task({"n": i})
+        assert await broker.pending_tasks() == 3
+        assert [(await broker.get_task(timeout=1))["n"] for _ in range(3)] == [0, 1, 2]
+        assert await broker.get_task(timeout=0.01) is None
+        await broker.finish()
+        assert await broker.finished()
+        assert await broker.get_task(timeout=5) is None  # returns at once once the crawl is over
+
+    asyncio.run(main())
+
+
+def test_lease_ack_and_results(pipeline):
+    urls = [f"https://{DOMAIN}/a", f"https://{DOMAIN}/b"]
+
+    async def main():
+        broker = start(pipeline)
+        for url in urls:
+            pipeline.add(url, 1)
+        task = await broker.get_task(timeout=1)
+        assert [entry["url"] for entry in task["urls"]] == urls
+        lease = pipeline.leases[task["lease"]]
+        assert lease["deadline"] is None  # queued, not taken yet
+
+        await broker.put_result({"lease": task["lease"], "worker": "w1", "taken": True})
+        await until(lambda: lease["deadline"] is not None)
+
+        for url in urls:
+            await broker.put_result(result(task, url))
+        await asyncio.wait_for(pipeline.drain(), 3)
+        assert task["lease"] not in pipeline.leases
+        assert [status(pipeline, url) for url in urls] == ["ok", "ok"]
+        assert pipeline.worker_counts["w1"] == 2
+        await pipeline.stop()
+
+    asyncio.run(main())
+
+
+def test_unacknowledged_lease_expires_only_once_taken(pipeline):
+    urls = [f"https://{DOMAIN}/{name}" for name in "abcd"]
+
+    async def main():
+        broker = start(pipeline)
+        for url in urls:
+            pipeline.add(url, 1)
+        await until(lambda: len(pipeline.leases) == 2)
+        # A worker takes the first lease and dies before acknowledging it; the second stays queued
+        first = await broker.get_task(timeout=1)
+        await until(lambda: pipeline.lease_counts["expired"] == 1)
+        assert first["lease"] not in pipeline.leases
+        second, = pipeline.leases.values()
+        assert second["deadline"] is None
+        assert [status(pipeline, entry["url"]) for entry in first["urls"]] == ["retry", "retry"]
+
+        # The retried URLs are leased again, after the queued lease (FIFO)
+        for entry in first["urls"]:
+            pipeline.add(entry["url"], 1, retry=True)
+        queued = await broker.get_task(timeout=1)
+        assert [entry["url"] for entry in queued["urls"]] == urls[2:]
+        again = await broker.get_task(timeout=1)
+        assert [entry["url"] for entry in again["urls"]] == urls[:2]
+
+        # A result for the expired lease arrives late and is ignored
+        await broker.put_result(result(first, urls[0]))
+        await until(lambda: pipeline.lease_counts["stale"] == 1)
+        await pipeline.stop()
+
+    asyncio.run(main())
+
+
+def test_results_renew_the_lease(pipeline):
+    urls = [f"https://{DOMAIN}/a", f"https://{DOMAIN}/b"]
+
+    async def main():
+        broker = start(pipeline)
+        for url in urls:
+            pipeline.add(url, 1)
+        task = await broker.get_task(timeout=1)
+        await broker.put_result({"lease": task["lease"], "worker": "w1", "taken": True})
+        # Slower than LEASE_SECONDS overall, but each result arrives within it
+        for url in urls:
+            await asyncio.sleep(0.12)
+            await broker.put_result(result(task, url))
+        await asyncio.wait_for(pipeline.drain(), 3)
+        assert pipeline.lease_counts["expired"] == 0
+        assert [status(pipeline, url) for url in urls] == ["ok", "ok"]
+        await pipeline.stop()
+
+    asyncio.run(main())
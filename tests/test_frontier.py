@@ -0,0 +1,62 @@
+import asyncio
+
+from website2md import Frontier
+
+
+def drain(frontier: Frontier) -> list[tuple[str, int]]:
+    async def main():
+        return [await frontier.get() for _ in range(frontier.qsize())]
+    return asyncio.run(main())
+
+
+def test_highest_score_first_and_fifo_on_ties():
+    frontier = Frontier(lambda url, depth: -depth)
+    for url, depth in [("a", 2), ("b", 1), ("c", 2), ("d", 1)]:
+        frontier.put(url, depth)
+    assert drain(frontier) == [("b", 1), ("d", 1), ("a", 2), ("c", 2)]
+
+
+def test_reprioritize_moves_a_url_up_and_skips_its_stale_entry():
+    frontier = Frontier(lambda url, depth: -depth)
+    for url in "abc":
+        frontier.put(url, 3)
+    frontier.reprioritize("c", 1)  # found again at a shallower depth
+    frontier.reprioritize("b", 5)  # deeper than before: keeps depth 3
+    assert len(frontier.heap) == 4
+    assert drain(frontier) == [("c", 1), ("a", 3), ("b", 3)]
+    assert frontier.qsize() == 0
+
+
+def test_rescore_applies_new_scores():
+    boost = {}
+    frontier = Frontier(lambda url, depth: -depth + boost.get(url, 0))
+    for url in "abc":
+        frontier.put(url, 1)
+    boost["c"] = 5  # e.g. a PageRank update
+    frontier.rescore()
+    assert len(frontier.heap) == 3
+    assert [url for url, _ in drain(frontier)] == ["c", "a", "b"]
+
+
+def test_heap_is_compacted_when_stale_entries_pile_up():
+    inlinks = {}
+    frontier = Frontier(lambda url, depth: inlinks.get(url, 0))
+    frontier.put("a", 1)
+    frontier.put("b", 1)
+    for n in range(1, 1100):
+        inlinks["a"] = n
+        frontier.reprioritize("a", 1)
+    assert len(frontier.heap) <= 2 * frontier.qsize() + 1000
+    assert drain(frontier) == [("a", 1), ("b", 1)]
+
+
+def test_get_waits_for_a_put():
+    async def main():
+        frontier = Frontier(lambda url, depth: 0)
+        getter = asyncio.create_task(frontier.get())
+        await asyncio.sleep(0.01)
+        assert not getter.done()
+        frontier.put("a", 0)
+        return await asyncio.wait_for(getter, 1)
+
+    assert asyncio.run(main()) == ("a", 0)
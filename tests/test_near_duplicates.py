@@ -0,0 +1,36 @@
+import random
+
+from website2md import SimHashIndex, simhash
+
+VOCABULARY = [f"word{i}" for i in range(3000)]
+
+
+def words(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(n))
+
+
+def test_boilerplate_shifted_copy_is_a_near_duplicate():
+    rng = random.Random(4)
+    article = words(rng, 500)
+    # The same article in a print view: a breadcrumb above and a share bar below (5 bits apart)
+    print_view = f"{words(rng, 15)} {article} {words(rng, 15)}"
+    index = SimHashIndex()
+    index.add("https://example.com/a", simhash(article))
+    assert index.find(simhash(print_view)) == "https://example.com/a"
+
+
+def test_different_pages_are_not_near_duplicates():
+    rng = random.Random(8)
+    index = SimHashIndex()
+    for i in range(50):
+        index.add(f"https://example.com/{i}", simhash(words(rng, 300)))
+    assert index.find(simhash(words(rng, 300))) is None
+
+
+def test_short_pages_have_no_simhash():
+    assert simhash("only a few words here") is None
+
+
+def test_simhash_ignores_case_and_punctuation():
+    text = words(random.Random(9), 200)
+    assert simhash(text) == simhash(text.upper().replace(" ", ", "))
@@ -0,0 +1,59 @@
+import pytest
+
+from website2md import ShardCoordinator, shard_of
+
+URLS = [f"https://example.com/{i}" for i in range(20)]
+
+
+@pytest.fixture
+def coordinator(tmp_path):
+    coordinator = ShardCoordinator(str(tmp_path / "shards.sqlite"), 2, reset=True)
+    yield coordinator
+    coordinator.close()
+
+
+def test_urls_are_queued_once_for_their_shard(coordinator):
+    coordinator.push([(url, 1) for url in URLS])
+    coordinator.push([(URLS[0], 0)])  # already queued
+    assert coordinator.pending() == len(URLS)
+    for shard in range(2):
+        claimed = coordinator.claim(shard, limit=len(URLS))
+        assert {row[0] for row in claimed} == {url for url in URLS if shard_of(url, 2) == shard}
+    assert coordinator.pending() == 0
+
+
+def test_claim_is_shallowest_first(coordinator):
+    owned = [url for url in URLS if shard_of(url, 2) == 0][:3]
+    coordinator.push([(owned[0], 3), (owned[1], 1), (owned[2], 2)])
+    assert [row[:2] for row in coordinator.claim(0)] == [(owned[1], 1), (owned[2], 2), (owned[0], 3)]
+
+
+def test_finished_only_when_every_shard_is_idle_and_nothing_is_pending(coordinator):
+    coordinator.push([(URLS[0], 1)])
+    owner = shard_of(URLS[0], 2)
+    coordinator.set_idle(0, True)
+    coordinator.set_idle(1, True)
+    assert not coordinator.finished()  # a URL is still pending
+    assert coordinator.claim(owner)
+    assert not coordinator.finished()  # claiming made its shard busy in the same transaction
+    coordinator.set_idle(owner, True)
+    assert coordinator.finished()
+
+
+def test_release_and_abandon(coordinator):
+    coordinator.push([(url, 1) for url in URLS])
+    claimed = coordinator.claim(0, limit=len(URLS))
+    coordinator.release(0)  # shard 0 restarted: its rows are pending again
+    assert len(coordinator.claim(0, limit=len(URLS))) == len(claimed)
+    dropped = coordinator.abandon(1)  # shard 1 keeps crashing
+    assert dropped == len(URLS) - len(claimed)
+    coordinator.set_idle(0, True)
+    assert coordinator.finished()
+
+
+def test_stats_and_meta(coordinator):
+    coordinator.put_stats(1, {"complete": True, "pages": 3})
+    coordinator.set_meta("languages", "en")
+    assert coordinator.all_stats() == {1: {"complete": True, "pages": 3}}
+    assert coordinator.get_meta("languages") == "en"
+    assert coordinator.get_meta("missing") is None
@@ -0,0 +1,39 @@
+import pytest
+
+import website2md
+from website2md import CrawlState
+
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+    monkeypatch.setattr(website2md, "RETRY_BACKOFF", 60)
+    state = CrawlState(str(tmp_path / "state.sqlite"))
+    yield state
+    state.close()
+
+
+def test_resume_frontier_leaves_retries_to_their_backoff(tmp_path, monkeypatch):
+    monkeypatch.setattr(website2md, "RETRY_BACKOFF", 60)
+    state = CrawlState(str(tmp_path / "state.sqlite"))
+    for url in ("https://example.com/a", "https://example.com/b", "https://example.com/c"):
+        state.enqueue(url, 1)
+    state.mark_fetching("https://example.com/b")
+    state.mark_fetching("https://example.com/c")
+    assert state.mark_failed("https://example.com/c", "timeout")
+    state.close()
+
+    resumed = CrawlState(str(tmp_path / "state.sqlite"), resume=True)
+    assert resumed.frontier() == [("https://example.com/a", 1), ("https://example.com/b", 1)]
+    assert resumed.retry_urls() == ["https://example.com/c"]
+    due, wait = resumed.due_retries()
+    assert due == [] and 55 < wait <= 60
+    resumed.close()
+
+
+def test_retries_give_up_after_max_retries(state, monkeypatch):
+    monkeypatch.setattr(website2md, "RETRY_BACKOFF", 0)
+    state.enqueue("https://example.com/a", 1)
+    outcomes = [state.mark_failed("https://example.com/a", "timeout") for _ in range(website2md.MAX_RETRIES)]
+    assert outcomes == [True] * (website2md.MAX_RETRIES - 1) + [False]
+    assert state.counts() == {"failed": 1}
+    assert state.due_retries() == ([], None)
@@ -0,0 +1,32 @@
+from website2md import TRAP_DUPLICATE_SAMPLE, TrapDetector
+
+LISTING = "Events on {day}: no events are scheduled for this day. " * 3
+
+
+def queue(traps: TrapDetector, urls: list[str]) -> None:
+    for url in urls:
+        assert traps.check(url) is None
+
+
+def test_repeated_listing_makes_its_template_a_trap():
+    traps = TrapDetector()
+    urls = [f"https://example.com/calendar/2024-01-{day:02}" for day in range(1, TRAP_DUPLICATE_SAMPLE + 1)]
+    queue(traps, urls)
+    tipped = [traps.record_content(url, LISTING.format(day=i)) for i, url in enumerate(urls)]
+    assert tipped[-1] and not any(tipped[:-1])
+    assert traps.check("https://example.com/calendar/2024-02-01") == "duplicate content"
+
+
+def test_empty_pages_do_not_make_a_trap():
+    traps = TrapDetector()
+    urls = [f"https://example.com/product/{n}" for n in range(3 * TRAP_DUPLICATE_SAMPLE)]
+    queue(traps, urls)
+    assert not any(traps.record_content(url, "") for url in urls)
+    assert not any(traps.record_content(url, "Loading...") for url in urls)
+    assert traps.check("https://example.com/product/999") is None
+
+
+def test_deep_and_repeating_paths_are_pruned():
+    traps = TrapDetector()
+    assert traps.check("https://example.com/" + "/".join(f"s{i}" for i in range(20))) == "deep path"
+    assert traps.check("https://example.com/a/b/a/b/a/b") == "repeating segments"
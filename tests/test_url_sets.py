@@ -0,0 +1,37 @@
+import website2md
+from website2md import BloomFilter, UrlFingerprintSet
+
+
+def test_fingerprint_set_grows_and_keeps_members():
+    urls = [f"https://example.com/page/{i}" for i in range(1000)]
+    fingerprints = UrlFingerprintSet(capacity=16)
+    for url in urls:
+        fingerprints.add(url)
+    assert len(fingerprints) == 1000
+    assert len(fingerprints.table) >= 2000  # kept at most half full
+    assert all(url in fingerprints for url in urls)
+    assert "https://example.com/page/1000" not in fingerprints
+
+
+def test_fingerprint_set_ignores_repeated_adds():
+    fingerprints = UrlFingerprintSet(capacity=16)
+    for _ in range(3):
+        for i in range(20):
+            fingerprints.add(f"https://example.com/{i}")
+    assert len(fingerprints) == 20
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom = BloomFilter(capacity=10_000, fp_rate=0.01)
+    for i in range(10_000):
+        bloom.add(f"https://example.com/seen/{i}")
+    assert all(f"https://example.com/seen/{i}" in bloom for i in range(10_000))  # no false negatives
+    false_positives = sum(f"https://example.com/unseen/{i}" in bloom for i in range(20_000))
+    assert false_positives / 20_000 < 0.02
+
+
+def test_make_url_set_modes(monkeypatch):
+    for mode, kind in (("hash", UrlFingerprintSet), ("bloom", BloomFilter), ("set", set)):
+        monkeypatch.setattr(website2md, "URL_SET_MODE", mode)
+        monkeypatch.setattr(website2md, "BLOOM_CAPACITY", 1000)
+        assert isinstance(website2md.make_url_set(), kind)
@@ -0,0 +1,57 @@
+import pytest
+
+from website2md import canonicalize_url, is_ancestor_url, url_template
+
+DOMAIN = "example.com"
+
+
+@pytest.mark.parametrize("url, canonical", [
+    # Scheme and host case, default port, www., user info and fragment
+    ("HTTP://WWW.Example.COM:80/a#top", "http://example.com/a"),
+    ("https://user:pw@example.com:443/a", "https://example.com/a"),
+    ("https://example.com:8080/a", "https://example.com:8080/a"),
+    # Dot segments, duplicate and trailing slashes, index files
+    ("https://example.com/a/./b/../c//d/", "https://example.com/a/c/d"),
+    ("https://example.com/docs/index.html", "https://example.com/docs"),
+    ("https://example.com", "https://example.com/"),
+    # Session path parameters and percent-escapes
+    ("https://example.com/a;jsessionid=ABC123/b", "https://example.com/a/b"),
+    ("https://example.com/%7euser/%2f", "https://example.com/~user/%2F"),
+    # Only KEEP_QUERY_PARAMS, sorted
+    ("https://example.com/a?utm_source=x&p=2&id=1&gclid=y", "https://example.com/a?id=1&p=2"),
+    # Other hosts keep their own host; non-http(s) URLs are left alone
+    ("https://Other.com/x/", "https://other.com/x"),
+    ("mailto:someone@example.com", "mailto:someone@example.com"),
+])
+def test_canonicalize_url(url, canonical):
+    assert canonicalize_url(url, DOMAIN) == canonical
+
+
+def test_canonicalize_url_folds_the_scheme_of_the_site():
+    assert canonicalize_url("http://www.example.com/a", DOMAIN, "https") == "https://example.com/a"
+    assert canonicalize_url("http://other.com/a", DOMAIN, "https") == "http://other.com/a"
+
+
+@pytest.mark.parametrize("url, template", [
+    ("https://example.com/blog/2024/05/page/3?p=9&q=", "/blog/{n}/{n}/page/{n}?p={v}&q={v}"),
+    ("https://example.com/item/3f2b8c1d-1a2b-4c3d-9e8f-0123456789ab", "/item/{id}"),
+    ("https://example.com/docs/v2/intro", "/docs/v{n}/intro"),
+    ("https://example.com/about", "/about"),
+])
+def test_url_template(url, template):
+    assert url_template(url) == template
+
+
+@pytest.mark.parametrize("target, url, ancestor", [
+    ("https://example.com/", "https://example.com/docs/a", True),
+    ("https://example.com/docs", "https://example.com/docs/a", True),
+    ("https://example.com/docs/", "https://example.com/docs/a/b", True),
+    ("https://example.com/docs/a", "https://example.com/docs/a", False),  # the page itself
+    ("https://example.com/doc", "https://example.com/docs/a", False),  # a prefix, not a parent
+    ("https://example.com/docs/b", "https://example.com/docs/a", False),  # a sibling
+    ("https://example.com/print/a", "https://example.com/a", False),
+    ("https://example.com/?p=1", "https://example.com/a", False),
+    ("https://other.com/", "https://example.com/a", False),
+])
+def test_is_ancestor_url(target, url, ancestor):
+    assert is_ancestor_url(target, url) is ancestor
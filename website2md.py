@@ -4,7 +4,9 @@ from datetime import datetime
 import os
 ts_db = f"{datetime.now().strftime('%Y-%m-%d %H:%M')}"
 ts_time = f"{datetime.now().strftime('%H:%M:%S')}"
-print(f"\n---------- {ts_time} starting {os.path.basename(__file__)}")
+_running_as_cli = __name__ == '__main__'
+if _running_as_cli:
+    print(f"\n---------- {ts_time} starting {os.path.basename(__file__)}")
 import time
 start_time = time.time()
 
@@ -40,7 +42,12 @@ Requirements:
   playwright install
 
 Usage:
-  python playwright_site_to_markdown.py https://corp.kaltura.com ./out
+  python website2md.py                    # crawl the site of the active Chrome tab
+  python website2md.py --url https://corp.kaltura.com
+  python website2md.py --resume           # continue an interrupted crawl of the same site
+  python website2md.py --incremental      # weekly re-run: only re-write pages that changed
+  python website2md.py --archive          # also keep the fetched HTML in <OUT_DIR>.warc.gz
+  python website2md.py --reconvert        # rebuild the .md files from that archive, no fetching
 """
 
 """
@@ -62,14 +69,39 @@ import asyncio
 import sys
 import os
 import re
-from urllib.parse import urljoin, urlparse, unquote
+import argparse
+import hashlib
+import sqlite3
+import multiprocessing
+import heapq
+import math
+import json
+import resource
+import gzip
+import zlib
+import uuid
+import glob
+import socket
+import contextlib
+from datetime import timezone
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from urllib.robotparser import RobotFileParser
+from urllib.parse import urljoin, urlparse, urlsplit, urlunsplit, unquote, parse_qsl, urlencode
 import subprocess
+from collections import defaultdict
 
 from playwright.async_api import async_playwright
+import numpy as np
+import psutil
 from bs4 import BeautifulSoup
-from markdownify import markdownify as md
+from markdownify import MarkdownConverter
 
-from aggregate_md import aggregate_md_files
+from aggregate_md import aggregate_md_files, PAGE_RANK_FILE
+import browser_daemon
+import browser_page
+from browser_daemon import open_browser, close_browser
+from browser_page import track_network, wait_for_render, install_request_blocking, print_blocking_report, EXTRACT_MAIN_JS
+from crawl_broker import make_broker, InProcessBroker
 
 # Define a set of file extensions to skip (non-HTML resources).
 SKIP_EXTENSIONS = {
@@ -81,37 +113,118 @@ SKIP_EXTENSIONS = {
 import requests
 import xml.etree.ElementTree as ET
 
-def get_sitemap_urls(base_url: str, domain: str) -> set[str]:
-    urls = set()
-    sitemap_locations = [
-        f"{base_url}/sitemap.xml",
-        f"{base_url}/sitemap_index.xml",
-        f"{base_url}/sitemap/sitemap.xml",
+def _xml_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+def load_robots(session, origin: str) -> RobotFileParser:
+    """Parsed robots.txt of origin (fetched through the pooled session). Missing or unreadable = allow all."""
+    robots = RobotFileParser(f"{origin}/robots.txt")
+    try:
+        resp = session.get(robots.url, timeout=SITEMAP_TIMEOUT)
+        lines = resp.text.splitlines() if resp.status_code == 200 else []
+    except Exception:
+        lines = []
+    robots.parse(lines)
+    return robots
+
+def parse_sitemap(session, sitemap_url: str, domain: str, scheme: str) -> tuple[list[str], dict[str, dict]]:
+    """
+    Stream one sitemap (plain or gzipped) with iterparse, clearing each element once read, so
+    memory stays flat however large the file. Returns (child sitemap URLs of an index,
+    {url: {"lastmod", "priority"}} of same-domain pages).
+    """
+    children, urls = [], {}
+    resp = session.get(sitemap_url, timeout=SITEMAP_TIMEOUT, stream=True)
+    try:
+        if resp.status_code != 200:
+            return children, urls
+        resp.raw.decode_content = True  # undoes Content-Encoding: gzip
+        stream = resp.raw
+        encoding = resp.headers.get("content-encoding", "")
+        if "gzip" not in encoding and (urlparse(sitemap_url).path.endswith(".gz") or "gzip" in resp.headers.get("content-type", "")):
+            stream = gzip.GzipFile(fileobj=resp.raw)
+        root = None
+        for event, elem in ET.iterparse(stream, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                continue
+            name = _xml_name(elem.tag)
+            if name not in ("url", "sitemap"):
+                continue
+            loc = lastmod = priority = None
+            for child in elem:
+                child_name = _xml_name(child.tag)
+                if child_name == "loc":
+                    loc = (child.text or "").strip()
+                elif child_name == "lastmod":
+                    lastmod = (child.text or "").strip() or None
+                elif child_name == "priority":
+                    try:
+                        priority = float(child.text)
+                    except (TypeError, ValueError):
+                        pass
+            if loc and name == "sitemap":
+                children.append(loc)
+            elif loc:
+                loc = canonicalize_url(loc, domain, scheme)
+                if urlparse(loc).netloc == domain:
+                    urls[loc] = {"lastmod": lastmod, "priority": priority}
+            root.clear()  # drop the entries read so far
+    finally:
+        resp.close()
+    return children, urls
+
+def get_sitemap_urls(base_url: str, domain: str, session=None, robots: RobotFileParser = None) -> dict[str, dict]:
+    """
+    Return {url: {"lastmod", "priority"}} for every same-domain page listed in the site's
+    sitemaps (lastmod may be None, priority is the <priority> float or None). Sitemaps come from
+    robots.txt Sitemap: lines plus the usual locations; they are fetched SITEMAP_WORKERS at a
+    time over a pooled session, and sitemap indexes are followed up to SITEMAP_MAX_DEPTH levels.
+    """
+    start = time.time()
+    session = session or make_http_session()
+    parsed = urlparse(base_url)
+    origin = f"{parsed.scheme}://{parsed.netloc}"
+    urls = {}
+    seen = set()
+    fetched = 0
+
+    robots = robots or load_robots(session, origin)
+    roots = (robots.site_maps() or []) + [
+        f"{origin}/sitemap.xml",
+        f"{origin}/sitemap_index.xml",
+        f"{origin}/sitemap/sitemap.xml",
     ]
-    req_proxies = {
-        "http": SCRAPE_PROXY,
-        "https": SCRAPE_PROXY,
-    } if SCRAPE_PROXY else None
+    with ThreadPoolExecutor(max_workers=SITEMAP_WORKERS, thread_name_prefix="sitemap") as pool:
+        futures = {}
+
+        def submit(sitemap_url: str, level: int) -> None:
+            if sitemap_url not in seen and level <= SITEMAP_MAX_DEPTH:
+                seen.add(sitemap_url)
+                futures[pool.submit(parse_sitemap, session, sitemap_url, domain, parsed.scheme)] = (sitemap_url, level)
+
+        for sitemap_url in roots:
+            submit(sitemap_url, 0)
+        while futures:
+            future = next(as_completed(futures))
+            sitemap_url, level = futures.pop(future)
+            try:
+                children, entries = future.result()
+            except Exception as e:
+                if verbose:
+                    print(f"  ! Sitemap {sitemap_url}: {e}")
+                continue
+            if children or entries:
+                fetched += 1
+            urls.update(entries)
+            for child in children:
+                submit(child, level + 1)
 
-    for sitemap_url in sitemap_locations:
-        try:
-            resp = requests.get(sitemap_url, timeout=10, proxies=req_proxies)
-            if resp.status_code == 200:
-                root = ET.fromstring(resp.content)
-                # Handle both sitemap index and regular sitemaps
-                for elem in root.iter():
-                    if elem.tag.endswith('loc'):
-                        url = elem.text.strip()
-                        if urlparse(url).netloc == domain:
-                            urls.add(url)
-        except:
-            continue
-    
-    print(f"📍 Found {len(urls)} URLs from sitemaps")
+    print(f"📍 Found {len(urls):,} URLs in {fetched} sitemap(s) in {time.time() - start:.1f}s")
     return urls
 
-
-
+SKIP_EXTENSIONS_RE = re.compile(r"\.(" + "|".join(re.escape(ext.lstrip(".")) for ext in SKIP_EXTENSIONS) + r")(\?|$)")
 
 def should_skip_url(url: str) -> bool:
     """Return True if URL points to a non-HTML resource (e.g. PDF, video, doc)."""
@@ -121,10 +234,72 @@ def should_skip_url(url: str) -> bool:
         if path.endswith(ext):
             return True
     # Some URLs might include filetype with query string (e.g. /file.pdf?download=1)
-    if re.search(r"\.(" + "|".join(re.escape(ext.lstrip(".")) for ext in SKIP_EXTENSIONS) + r")(\?|$)", path):
+    if SKIP_EXTENSIONS_RE.search(path):
         return True
     return False
 
+# ---------------------------------------------------------------------------
+# URL canonicalization
+# ---------------------------------------------------------------------------
+
+PERCENT_ESCAPE_RE = re.compile(r"%([0-9A-Fa-f]{2})")
+SESSION_PATH_PARAM_RE = re.compile(r";(jsessionid|phpsessid|sid)=[^/]*", re.I)
+
+def _normalize_escape(match) -> str:
+    # Unreserved characters never need escaping (RFC 3986 6.2.2.2), the rest use upper-case hex
+    char = chr(int(match.group(1), 16))
+    if char.isascii() and (char.isalnum() or char in "-._~"):
+        return char
+    return "%" + match.group(1).upper()
+
+def _bare_host(host: str) -> str:
+    return host[4:] if host.startswith("www.") else host
+
+def canonicalize_url(url: str, domain: str, scheme: str = None) -> str:
+    """
+    Canonical form of a URL, so aliases of one page are queued, fetched and written once:
+    - scheme and host lower-cased, default port, user info and fragment dropped
+    - www. and bare host of the site folded onto domain, using scheme (the scheme of the page
+      the link was found on) so http/https variants collapse too
+    - dot segments, duplicate slashes, trailing slash, index files (INDEX_FILES) and
+      ;jsessionid-style path parameters removed, percent-escapes normalised
+    - only KEEP_QUERY_PARAMS kept, sorted
+    URLs that are not http(s) are returned unchanged.
+    """
+    parts = urlsplit(url.strip())
+    url_scheme = parts.scheme.lower()
+    if url_scheme not in ("http", "https"):
+        return url
+    host = (parts.hostname or "").rstrip(".")
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and (url_scheme, port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{port}"
+    if _bare_host(host) == _bare_host(domain):
+        host = domain
+        url_scheme = scheme or url_scheme
+
+    path = PERCENT_ESCAPE_RE.sub(_normalize_escape, SESSION_PATH_PARAM_RE.sub("", parts.path))
+    segments = []
+    for segment in path.split("/"):
+        if segment in ("", "."):
+            continue
+        if segment == "..":
+            if segments:
+                segments.pop()
+            continue
+        segments.append(segment)
+    if segments and segments[-1].lower() in INDEX_FILES:
+        segments.pop()
+
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() in KEEP_QUERY_PARAMS
+    ))
+    return urlunsplit((url_scheme, host, "/" + "/".join(segments), query, ""))
+
 # FUNCTIONS
 
 def get_chrome_active_tab_url():
@@ -146,11 +321,125 @@ def get_chrome_active_tab_url():
 # MAIN
 
 # START_URL = input(f"\nEnter URL: ")
-START_URL = get_chrome_active_tab_url()
+START_URL = None  # set in __main__: --url or the active Chrome tab
 
 FULL_SCRAPE = False  # False = home page + pages linked from it only; True = full recursive crawl
 MAX_PAGES = 10000  # safety limit
 
+PAGE_POOL_SIZE = 4  # browser pages fetching concurrently (global concurrency cap)
+CONVERT_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # processes for HTML -> Markdown conversion
+CONVERT_QUEUE_SIZE = CONVERT_WORKERS * 2  # fetched pages allowed to wait for conversion
+WRITE_QUEUE_SIZE = 64  # converted pages allowed to wait for the writer thread
+LINKS_QUEUE_SIZE = 256  # pages' link sets allowed to wait for dedup into the frontier
+CONVERT_STAGE_WORKERS = CONVERT_QUEUE_SIZE  # convert-stage tasks (each awaits the process pool)
+WRITE_WORKERS = 1  # write-stage tasks (all share the single writer thread)
+LINK_WORKERS = 1  # link-discovery tasks
+STAGE_REPORT_EVERY = 30  # seconds between pipeline queue/throughput reports (0 = only at the end)
+CONTEXT_POOL_SIZE = 1  # browser contexts the page pool is spread across
+MAX_PER_HOST = 4  # concurrent fetches allowed against a single host
+
+# Browser recycling: pages and contexts are replaced before Chromium memory creeps up (see BrowserPool)
+RECYCLE_PAGE_AFTER = 200  # navigations before a page is closed and replaced (0 = never)
+RECYCLE_CONTEXT_AFTER = 1000  # navigations before a whole context is replaced (0 = never)
+RENDERER_RSS_MB_MAX = 2048  # total Chromium renderer RSS that makes every context recycle (0 = no watermark; not watched on the shared daemon)
+RSS_CHECK_EVERY = 20  # navigations between renderer RSS measurements
+
+# Multi-process crawl (--processes N): URLs sharded by hash across N crawl processes (see ShardCoordinator)
+CRAWL_PROCESSES = 1  # 1 = the whole crawl runs in this process
+SHARD_CLAIM_BATCH = 200  # URLs a process takes from the coordinator at a time
+SHARD_POLL_SECONDS = 0.5  # seconds between coordinator exchanges
+SHARD_MAX_RESTARTS = 3  # crashed crawl processes restarted (resuming from their state file) before giving up
+HOST_RATE_SHARE = 1.0  # share of each host's rate and robots.txt limits this process may use (1/N in a sharded crawl)
+
+# Distributed crawl (--broker URL): a coordinator leases URL batches to worker nodes (--worker) via crawl_broker.py
+BROKER_URL = None  # e.g. "redis://crawl-box:6379/0"; "memory://" runs the coordinator and one worker in this process
+LEASE_BATCH = 10  # URLs per lease
+LEASE_MAX_OUTSTANDING = 32  # leases out with workers at a time (the coordinator's fetch concurrency)
+LEASE_SECONDS = 120  # a lease taken by a worker with no result for this long is taken back and its URLs retried
+WORKER_POLL_SECONDS = 5  # how long a worker waits for a lease before checking whether the crawl is over
+
+# Sitemap discovery (robots.txt Sitemap: lines + usual locations, indexes followed recursively)
+SITEMAP_WORKERS = 8  # sitemaps fetched in parallel
+SITEMAP_MAX_DEPTH = 3  # nested sitemap index levels followed
+SITEMAP_TIMEOUT = 30  # seconds per sitemap request
+
+# Politeness: robots.txt rules and an adaptive per-host request rate (see HostThrottle)
+RESPECT_ROBOTS = True  # skip URLs robots.txt disallows for ROBOTS_AGENT, honour Crawl-delay / Request-rate
+ROBOTS_AGENT = "*"
+RATE_START = 2.0  # requests per second per host to begin with
+RATE_MIN = 0.2
+RATE_MAX = 20.0  # ceiling (lowered further by Crawl-delay / Request-rate)
+RATE_INCREASE = 0.5  # additive increase: about this many req/s more per second of healthy responses
+RATE_DECREASE = 0.5  # multiplicative decrease on 429/503 or rising latency (at most once per second)
+RATE_LATENCY_FACTOR = 2.0  # smoothed latency above this multiple of the best seen = back off
+THROTTLE_STATUSES = {429, 503}  # "slow down" answers: back off and retry the URL later
+
+# URL canonicalization (frontier, visited set and output paths all use canonical URLs)
+KEEP_QUERY_PARAMS = {"p", "page_id", "id"}  # query params that select different content; all others (utm_*, gclid, sessions, sorting...) are dropped
+INDEX_FILES = {"index.html", "index.htm", "index.php", "default.htm", "default.aspx"}  # /docs/index.html == /docs
+FOLLOW_CANONICAL = True  # pages redirecting or declaring <link rel="canonical"> elsewhere are written once, under the canonical URL
+
+# Frontier order: highest frontier_score() first, so a MAX_PAGES budget goes to the most important pages
+FRONTIER_WEIGHTS = {"depth": 1.0, "sitemap": 1.0, "inlinks": 0.5, "pagerank": 1.0, "path": 1.0}  # 0 disables a signal (all 0 = FIFO)
+PATH_PRIORITY = {}  # path prefix -> weight, longest prefix wins, e.g. {"/docs": 2, "/blog": -1, "/tag": -3}
+PAGERANK_EVERY = 100  # pages added to the link graph between PageRank updates (and frontier re-scoring)
+PAGERANK_DAMPING = 0.85
+LINK_GRAPH = True  # False = no link graph (saves memory on huge crawls; no PageRank priority or .page_rank.json). It keeps every URL as a string, whatever URL_SET_MODE
+
+# Language variants (see LanguageFilter): translated copies of the site are pruned before fetching
+LANGUAGE_FILTER = True
+WANTED_LANGUAGES = None  # primary language subtags to keep, e.g. {"en", "de"}; None = the start page's language
+# /de/..., /fr-ca/... path prefixes recognised as languages (more are learned from hreflang). Codes that
+# usually mean something else on corporate sites (/uk/ United Kingdom, /hr/ careers, /ar/ Argentina,
+# /id/, /my/) are left out: they only count once an hreflang alternate confirms them.
+LANGUAGE_PATH_CODES = {
+    "bg", "cs", "da", "de", "el", "en", "es", "et", "fi", "fr", "he", "hi", "hu", "it", "ja",
+    "ko", "lt", "lv", "nb", "nl", "pl", "pt", "ro", "ru", "sk", "sl", "sr", "sv", "th", "tr", "vi", "zh",
+}
+
+# Crawl-trap detection (see TrapDetector): pruned URLs are never queued
+TRAP_MAX_PATH_DEPTH = 12  # path segments
+TRAP_MAX_SEGMENT_REPEATS = 2  # same segment more often than this in one path (/a/b/a/b/a/b/...)
+TRAP_MAX_PER_TEMPLATE = 500  # URLs per template (numbers and ids wildcarded, e.g. /events/{n}-{n}-{n}), 0 = no cap; sitemap URLs are exempt
+TRAP_DUPLICATE_SAMPLE = 10  # pages of a template fetched before its content is judged
+TRAP_DUPLICATE_RATIO = 0.8  # share of duplicate pages (ignoring digits) that marks a template as a trap
+TRAP_MIN_WORDS = 20  # shorter pages (empty renders, failed extractions) are left out of the duplicate count
+
+# Near-duplicate pages (see simhash / SimHashIndex): recorded as aliases of the first copy, not written
+NEAR_DUP_DETECTION = True
+NEAR_DUP_MAX_BITS = 7  # SimHash bits (of 64) two pages may differ in and still count as the same page (unrelated pages differ in ~20+)
+NEAR_DUP_MIN_WORDS = 50  # shorter pages are never treated as duplicates
+NEAR_DUP_EXPAND_LINKS = False  # True = still follow the links of a near-duplicate page
+
+# Site-wide boilerplate learning after the crawl (see strip_site_boilerplate)
+BOILERPLATE_LEARNING = True
+BOILERPLATE_MIN_SHARE = 0.5  # a markdown block on at least this share of pages is boilerplate (CTA bars, newsletter boxes...)
+BOILERPLATE_MIN_PAGES = 5  # ... and on at least this many pages
+
+# Visited / seen URL sets (see make_url_set)
+URL_SET_MODE = "hash"  # "hash" = exact set of 64-bit URL fingerprints, "bloom" = fixed-size Bloom filter, "set" = Python set of strings
+BLOOM_CAPACITY = 5_000_000  # "bloom": URLs the filter is sized for
+BLOOM_FP_RATE = 0.001  # "bloom": false-positive rate at capacity (a false positive is a page that is never fetched)
+
+# Main-content extraction (render wait and request blocking settings: RENDER_*, BLOCK_* in browser_page.py)
+EXTRACT_IN_BROWSER = False  # True = strip rendered pages to their main content inside Chromium and ship only that (see EXTRACT_MAIN_JS)
+
+# HTTP-first tier: plain keep-alive GET, escalate to the browser only when the page needs JS
+HTTP_FIRST = True
+HTTP_TIMEOUT = 20  # seconds
+HTTP_USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+JS_MIN_TEXT_CHARS = 200  # less main-content text than this in the raw HTML = needs JS
+HOST_LEARN_AFTER = 10  # consistent results per host before the check (or the HTTP attempt) is skipped
+
+# Crawl state persisted next to OUT_DIR (see CrawlState)
+CHECKPOINT_EVERY = 50  # state updates between SQLite commits
+CHECKPOINT_SECONDS = 30  # ... or at least this often
+MAX_RETRIES = 3  # attempts per URL before it is marked failed
+RETRY_BACKOFF = 30  # seconds before the first retry, doubled on each further attempt
+INCREMENTAL = False  # True (or --incremental) = only re-render and re-write pages that changed since the last run
+INCREMENTAL_DELETE_REMOVED = True  # --incremental: delete .md files of pages gone from the site
+ARCHIVE_HTML = False  # True (or --archive) = keep fetched HTML in <OUT_DIR>.warc.gz so --reconvert can rebuild the .md files
+
 count = 0
 count_total = 0
 
@@ -187,182 +476,2895 @@ def clean_filepath(url: str) -> str:
     """
     parsed = urlparse(url)
     path = parsed.path.strip("/")
+    # Kept query params (see KEEP_QUERY_PARAMS) select different pages, so they go in the name
+    suffix = "__" + re.sub(r"[^\w\-]", "_", unquote(parsed.query)) if parsed.query else ""
     if not path:
-        return "index.md"
+        return f"index{suffix}.md"
     # If ends with "/", treat as folder: add index.md
     if path.endswith("/"):
         folder = safe_path(path)
-        return os.path.join(folder, "index.md")
+        return os.path.join(folder, f"index{suffix}.md")
     # If no extension, treat as folder: add index.md
     if "." not in os.path.basename(path):
         folder = safe_path(path)
-        return os.path.join(folder, "index.md")
+        return os.path.join(folder, f"index{suffix}.md")
     # else preserve subfolders, but .ext → .md
     folder, filename = os.path.split(path)
     filename_root = os.path.splitext(filename)[0]
-    filename_md = re.sub(r"[^\w\-]", "_", unquote(filename_root)) + ".md"
+    filename_md = re.sub(r"[^\w\-]", "_", unquote(filename_root)) + suffix + ".md"
     if folder:
         return os.path.join(safe_path(folder), filename_md)
     else:
         return filename_md
 
-def extract_links(html: str, base_url: str, domain: str) -> set[str]:
-    soup = BeautifulSoup(html, "html.parser")
+# Parser backend: lxml's C parser is several times faster than the pure-Python html.parser
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# Boilerplate selectors, compiled once instead of on every page
+JUNK_TAGS = ["script", "style", "noscript", "svg", "iframe"]
+LAYOUT_TAGS = ["header", "footer", "nav"]
+BOILERPLATE_ID_RE = re.compile(r"(header|footer|nav|menu|sidebar|cookie|banner)", re.I)
+BOILERPLATE_CLASS_RE = re.compile(r"(header|footer|nav|menu|sidebar|cookie|banner|top-bar|bottom-bar)", re.I)
+BOILERPLATE_ROLE_RE = re.compile(r"(banner|navigation|contentinfo)", re.I)
+DATA_SECTION_RE = re.compile(r"(header|footer)", re.I)
+MAIN_ID_RE = re.compile(r"(main|content|primary)", re.I)
+MAIN_CLASS_RE = re.compile(r"(main-content|page-content|entry-content|post-content)", re.I)
+INNER_NAV_CLASS_RE = re.compile(r"(breadcrumb|pagination|share|social)", re.I)
+EXCESS_NEWLINES_RE = re.compile(r"\n{3,}")
+
+MD_CONVERTER = MarkdownConverter(heading_style="ATX", strip=["a"])
+
+def site_url(href: str, base_url: str, domain: str) -> str | None:
+    """Canonical absolute form of href (relative to base_url) if it is on the site, else None."""
+    url = canonicalize_url(urljoin(base_url, href.strip()), domain, urlparse(base_url).scheme)
+    return url if urlparse(url).netloc == domain else None
+
+def links_from_hrefs(hrefs, base_url: str, domain: str) -> set[str]:
     links = set()
 
-    for a in soup.find_all("a", href=True):
-        href = a["href"].strip()
+    for href in hrefs:
+        href = href.strip()
         if href.startswith(("mailto:", "tel:", "#", "javascript:")):
             continue
 
-        abs_url = urljoin(base_url, href)
-        parsed = urlparse(abs_url)
-
         # Only follow links on the same domain
-        if parsed.netloc == domain:
-            # Skip links to files we don't want to download (PDFs, videos, etc)
-            if should_skip_url(abs_url):
-                continue
-            links.add(parsed.scheme + "://" + parsed.netloc + parsed.path)
+        abs_url = site_url(href, base_url, domain)
+        # Skip links to files we don't want to download (PDFs, videos, etc)
+        if abs_url and not should_skip_url(abs_url):
+            links.add(abs_url)
 
     return links
 
-def extract_main_content(html: str) -> str:
-    soup = BeautifulSoup(html, "html.parser")
+def links_from_soup(soup, base_url: str, domain: str) -> set[str]:
+    return links_from_hrefs((a["href"] for a in soup.find_all("a", href=True)), base_url, domain)
+
+def canonical_from_soup(soup, base_url: str, domain: str) -> str | None:
+    """Canonical URL the page declares with <link rel="canonical">, if it is on the site."""
+    tag = soup.find("link", rel="canonical", href=True)
+    if not tag or not tag["href"].strip():
+        return None
+    return site_url(tag["href"], base_url, domain)
 
+def main_content_from_soup(soup):
+    """Strip boilerplate from soup in place and return the main content element (or None)."""
     # Remove junk tags
-    for tag in soup(["script", "style", "noscript", "svg", "iframe"]):
+    for tag in soup(JUNK_TAGS):
         tag.decompose()
 
     # Remove header/footer/nav elements
-    for tag in soup.find_all(["header", "footer", "nav"]):
+    for tag in soup.find_all(LAYOUT_TAGS):
         tag.decompose()
 
     # Remove common header/footer classes and IDs
     for selector in [
-        {"id": re.compile(r"(header|footer|nav|menu|sidebar|cookie|banner)", re.I)},
-        {"class_": re.compile(r"(header|footer|nav|menu|sidebar|cookie|banner|top-bar|bottom-bar)", re.I)},
-        {"role": re.compile(r"(banner|navigation|contentinfo)", re.I)},
+        {"id": BOILERPLATE_ID_RE},
+        {"class_": BOILERPLATE_CLASS_RE},
+        {"role": BOILERPLATE_ROLE_RE},
     ]:
         for tag in soup.find_all(**selector):
             tag.decompose()
 
     # Remove elements with common footer/header data attributes
-    for tag in soup.find_all(attrs={"data-section": re.compile(r"(header|footer)", re.I)}):
+    for tag in soup.find_all(attrs={"data-section": DATA_SECTION_RE}):
         tag.decompose()
 
     # Prefer semantic main content containers
     main_content = (
         soup.find("main") or
         soup.find("article") or
-        soup.find(id=re.compile(r"(main|content|primary)", re.I)) or
-        soup.find(class_=re.compile(r"(main-content|page-content|entry-content|post-content)", re.I)) or
+        soup.find(id=MAIN_ID_RE) or
+        soup.find(class_=MAIN_CLASS_RE) or
         soup.find(role="main") or
         soup.body
     )
 
     if not main_content:
-        return ""
+        return None
 
     # Final cleanup: remove any remaining nav-like elements inside main
-    for tag in main_content.find_all(class_=re.compile(r"(breadcrumb|pagination|share|social)", re.I)):
+    for tag in main_content.find_all(class_=INNER_NAV_CLASS_RE):
         tag.decompose()
 
-    return str(main_content)
+    return main_content
 
-OUT_DIR = url_to_dl_folder(START_URL)
+SIMHASH_WORD_RE = re.compile(r"\w+")
+SIMHASH_MULTIPLIERS = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F))  # odd 64-bit constants, one per shingle position
 
-async def crawl():
-    global count, count_total
+def languages_from_soup(soup, base_url: str, domain: str) -> tuple[str | None, dict[str, str]]:
+    """(<html lang>, {hreflang: canonical same-site URL} of <link rel="alternate" hreflang>)."""
+    lang = soup.html.get("lang") if soup.html else None
+    pairs = [(tag["hreflang"], tag["href"]) for tag in soup.find_all("link", rel="alternate", hreflang=True, href=True)]
+    return languages_from_pairs(lang, pairs, base_url, domain)
 
-    os.makedirs(OUT_DIR, exist_ok=True)
+def languages_from_pairs(lang: str | None, pairs, base_url: str, domain: str) -> tuple[str | None, dict[str, str]]:
+    """Normalised (lang, {hreflang: URL}) from the raw lang attribute and (hreflang, href) pairs."""
+    alternates = {}
+    for hreflang, href in pairs:
+        url = site_url(href, base_url, domain)
+        if url:
+            alternates[hreflang.strip().lower()] = url
+    return (lang.strip().lower() or None) if lang else None, alternates
 
-    visited = set()
-    to_visit = [(START_URL, 0)]
-    domain = urlparse(START_URL).netloc
-    if FULL_SCRAPE:
-        for sitemap_url in get_sitemap_urls(START_URL, domain):
-            to_visit.append((sitemap_url, 1))
-    else:
-        print(f"🔍 First-level scrape: home page + pages linked from it")
+def simhash(text: str) -> int | None:
+    """
+    64-bit SimHash of text over word 3-gram shingles (None below NEAR_DUP_MIN_WORDS words).
+    Each distinct word is hashed once; the shingle hashes are mixed from them with NumPy, and
+    the per-bit votes counted over the (shingles x 64) bit matrix.
+    """
+    words = SIMHASH_WORD_RE.findall(text.lower())
+    if len(words) < NEAR_DUP_MIN_WORDS:
+        return None
+    vocab = {}
+    ids = np.fromiter((vocab.setdefault(word, len(vocab)) for word in words), dtype=np.intp, count=len(words))
+    word_hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little") for word in vocab),
+        dtype="<u8", count=len(vocab),
+    )[ids]
+    with np.errstate(over="ignore"):  # uint64 arithmetic wraps around on purpose
+        h = word_hashes[:-2] * SIMHASH_MULTIPLIERS[0] + word_hashes[1:-1] * SIMHASH_MULTIPLIERS[1] + word_hashes[2:]
+        # splitmix64 finalizer, so every bit of the shingle hash depends on all three words
+        h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        hashes = np.unique(h ^ (h >> np.uint64(31)))  # repeated shingles vote once
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 > len(hashes)
+    return int(np.packbits(votes, bitorder="little").view("<u8")[0])
+
+def convert_page(html: str, base_url: str, domain: str, want_links: bool = True) -> dict:
+    """
+    Single parse per page: links are collected from the full tree first (nav menus included),
+    then the same tree is stripped down to the main content and converted to Markdown directly,
+    without serialising and re-parsing it. Returns {"markdown", "links", "canonical", "lang",
+    "alternates", "simhash"}.
+    """
+    soup = BeautifulSoup(html, HTML_PARSER)
+    links = links_from_soup(soup, base_url, domain) if want_links else set()
+    canonical = canonical_from_soup(soup, base_url, domain) if FOLLOW_CANONICAL else None
+    lang, alternates = languages_from_soup(soup, base_url, domain) if LANGUAGE_FILTER else (None, {})
+    markdown = markdown_from_main(main_content_from_soup(soup))
+    return {"markdown": markdown, "links": links, "canonical": canonical, "lang": lang, "alternates": alternates,
+            "simhash": simhash(markdown) if NEAR_DUP_DETECTION else None}
+
+def markdown_from_main(main_content) -> str:
+    markdown = MD_CONVERTER.convert_soup(main_content) if main_content else ""
+    # Clean up excessive whitespace
+    return EXCESS_NEWLINES_RE.sub("\n\n", markdown).strip()
+
+def convert_extracted(extracted: dict, base_url: str, domain: str, want_links: bool = True) -> dict:
+    """
+    convert_page() for the output of EXTRACT_MAIN_JS: the browser already stripped the page down
+    to its main content, so only that small subtree is parsed. Same return shape as convert_page().
+    """
+    soup = BeautifulSoup(extracted["html"], HTML_PARSER) if extracted["html"] else None
+    links = links_from_hrefs(extracted["links"], base_url, domain) if want_links else set()
+    canonical = site_url(extracted["canonical"], base_url, domain) if FOLLOW_CANONICAL and extracted["canonical"] else None
+    lang, alternates = languages_from_pairs(extracted["lang"], extracted["alternates"], base_url, domain) if LANGUAGE_FILTER else (None, {})
+    markdown = markdown_from_main(soup)
+    return {"markdown": markdown, "links": links, "canonical": canonical, "lang": lang, "alternates": alternates,
+            "simhash": simhash(markdown) if NEAR_DUP_DETECTION else None}
+
+# Off-loop execution: set up by crawl(); convert_page() falls back to running inline without them
+convert_pool = None  # ProcessPoolExecutor for convert_page()
+convert_slots = None  # asyncio.Semaphore bounding pages in flight to the pool
+file_writer = None  # single-thread executor doing all .md writes
+html_archive = None  # HtmlArchive when ARCHIVE_HTML, appended to on the writer thread
+
+async def convert_in_pool(html: str | dict, url: str, domain: str, want_links: bool = True) -> dict:
+    """
+    Run convert_page() in the process pool so parsing never blocks navigation on the event loop.
+    A dict is an in-browser extraction result and goes through convert_extracted() instead.
+    """
+    convert = convert_extracted if isinstance(html, dict) else convert_page
+    if convert_pool is None:
+        return convert(html, url, domain, want_links)
+    async with convert_slots:
+        return await asyncio.get_running_loop().run_in_executor(convert_pool, convert, html, url, domain, want_links)
 
-    async with async_playwright() as p:
-        launch_opts = {"headless": True}
-        if SCRAPE_PROXY:
-            proxy_info = _parse_proxy(SCRAPE_PROXY)
-            # Chromium doesn't support authenticated SOCKS5 - use HTTP instead
-            pw_server = proxy_info["server"].replace("socks5://", "http://")
-            launch_opts["proxy"] = {
-                "server": pw_server,
-                "username": proxy_info["username"],
-                "password": proxy_info["password"],
-            }
-            print(f"🔒 Using proxy: {pw_server}")
-        browser = await p.chromium.launch(**launch_opts)
-        context = await browser.new_context()
+def write_markdown(outfile: str, url: str, markdown: str) -> None:
+    os.makedirs(os.path.dirname(outfile), exist_ok=True)
+    with open(outfile, "w", encoding="utf-8") as f:
+        f.write(f"<!-- Source: {url} -->\n\n{markdown}")
+
+def extract_links(html: str, base_url: str, domain: str) -> set[str]:
+    return links_from_soup(BeautifulSoup(html, HTML_PARSER), base_url, domain)
+
+def extract_main_content(html: str) -> str:
+    main_content = main_content_from_soup(BeautifulSoup(html, HTML_PARSER))
+    return str(main_content) if main_content else ""
+
+# Rules for EXTRACT_MAIN_JS (in browser_page.py): the patterns main_content_from_soup() uses
+EXTRACT_RULES = {
+    "junk": JUNK_TAGS, "layout": LAYOUT_TAGS,
+    "boilerplate_id": BOILERPLATE_ID_RE.pattern, "boilerplate_class": BOILERPLATE_CLASS_RE.pattern,
+    "boilerplate_role": BOILERPLATE_ROLE_RE.pattern, "data_section": DATA_SECTION_RE.pattern,
+    "main_id": MAIN_ID_RE.pattern, "main_class": MAIN_CLASS_RE.pattern,
+    "inner_nav_class": INNER_NAV_CLASS_RE.pattern, "min_text": JS_MIN_TEXT_CHARS,
+}
+extract_bytes = {"pages": 0, "dom": 0, "shipped": 0}  # EXTRACT_IN_BROWSER: full DOM vs what crossed to Python (chars)
+
+def browser_launch_opts() -> dict:
+    """Chromium launch options for a crawl: headless, through SCRAPE_PROXY if set."""
+    launch_opts = {"headless": True}
+    if SCRAPE_PROXY:
+        proxy_info = _parse_proxy(SCRAPE_PROXY)
+        # Chromium doesn't support authenticated SOCKS5 - use HTTP instead
+        pw_server = proxy_info["server"].replace("socks5://", "http://")
+        launch_opts["proxy"] = {
+            "server": pw_server,
+            "username": proxy_info["username"],
+            "password": proxy_info["password"],
+        }
+        print(f"🔒 Using proxy: {pw_server}")
+    return launch_opts
+
+def renderer_rss(root_pid: int) -> int:
+    """Bytes of RSS held by the Chromium renderer processes below root_pid."""
+    try:
+        procs = psutil.Process(root_pid).children(recursive=True)
+    except psutil.Error:
+        return 0
+    total = 0
+    for proc in procs:
+        try:
+            if "--type=renderer" in proc.cmdline():
+                total += proc.memory_info().rss
+        except psutil.Error:
+            pass
+    return total
+
+class BrowserPool:
+    """
+    The crawl's browser pages, one slot per fetch worker. A slot's page is replaced before its next
+    navigation once it has done RECYCLE_PAGE_AFTER of them, crashed or was closed. A context is
+    retired after RECYCLE_CONTEXT_AFTER navigations, and every context once the renderers' RSS
+    passes RENDERER_RSS_MB_MAX; its slots then move to fresh contexts one by one and it is closed
+    with its last page (the daemon's shared context is only left, never closed). On the daemon the
+    renderers also serve other runs, so their RSS is not this crawl's and is not watched. A
+    disconnected browser is relaunched through launch.
+    """
+
+    def __init__(self, launch, site_host: str, slots: int):
+        self.launch = launch  # async () -> (browser, shared_context), see open_browser()
+        self.site_host = site_host
+        self.browser = None
+        self.shared_context = None
+        self.slots = [None] * slots  # {"page", "inflight", "context", "navs", "crashed"} per fetch worker
+        self.contexts = {}  # live context -> {"navs", "pages", "retire"}
+        self.blocking_stats = []  # install_request_blocking() stats of every page
+        self.lock = asyncio.Lock()
+        self.navs = 0
+        self.recycled = defaultdict(int)  # pages replaced per reason ("page", "context", "memory", "crash")
+        self.contexts_closed = 0
+        self.relaunches = 0
+        self.rss = 0
+        self.peak_rss = 0
+
+    async def open(self) -> None:
+        self.browser, self.shared_context = await self.launch()
+        contexts = [self.shared_context] if self.shared_context is not None else []
+        while len(contexts) < max(1, CONTEXT_POOL_SIZE):
+            contexts.append(await self.browser.new_context())
+        for context in contexts:
+            await self._add_context(context)
+        for i in range(len(self.slots)):
+            self.slots[i] = await self._new_slot(contexts[i % len(contexts)])
+
+    async def close(self) -> None:
+        if self.browser is not None and self.browser.is_connected():
+            await close_browser(self.browser, self.shared_context, [slot["page"] for slot in self.slots if slot])
+
+    async def _add_context(self, context) -> None:
+        self.contexts[context] = {"navs": 0, "pages": 0, "retire": None}
+
+    async def _new_slot(self, context) -> dict:
         page = await context.new_page()
+        # Per page, also because the daemon's context is shared with other runs
+        self.blocking_stats.append(await install_request_blocking(page, self.site_host))
+        slot = {"page": page, "inflight": track_network(page), "context": context, "navs": 0, "crashed": False}
+        page.on("crash", lambda _: slot.update(crashed=True))
+        self.contexts[context]["pages"] += 1
+        return slot
+
+    async def _fresh_context(self):
+        """A live, non-retired context for a moving slot: a new one until CONTEXT_POOL_SIZE are live."""
+        live = [c for c, info in self.contexts.items() if not info["retire"]]
+        if len(live) >= max(1, CONTEXT_POOL_SIZE):
+            return min(live, key=lambda c: self.contexts[c]["pages"])
+        context = await self.browser.new_context()
+        await self._add_context(context)
+        return context
+
+    def _recycle_reason(self, slot: dict) -> str | None:
+        info = self.contexts.get(slot["context"])
+        if info is None or slot["crashed"] or slot["page"].is_closed():
+            return "crash"
+        if info["retire"]:
+            return info["retire"]
+        if RECYCLE_PAGE_AFTER and slot["navs"] >= RECYCLE_PAGE_AFTER:
+            return "page"
+        return None
 
-        while to_visit and len(visited) < MAX_PAGES:
-            url, depth = to_visit.pop(0)
-            if url in visited:
-                continue
+    async def _replace(self, worker_id: int, reason: str) -> None:
+        slot = self.slots[worker_id]
+        if not self.browser.is_connected():
+            print("  💥 Browser disconnected, relaunching")
+            self.relaunches += 1
+            self.contexts = {}
+            self.browser, self.shared_context = await self.launch()
+        try:
+            await slot["page"].close()
+        except Exception:
+            pass  # crashed or already gone with its context
+        old = self.contexts.get(slot["context"])
+        if old is not None:
+            old["pages"] -= 1
+        target = slot["context"] if old is not None and not old["retire"] else await self._fresh_context()
+        self.slots[worker_id] = await self._new_slot(target)
+        self.recycled[reason] += 1
+        if old is not None and old["retire"] and old["pages"] == 0:
+            del self.contexts[slot["context"]]
+            self.contexts_closed += 1
+            if slot["context"] is not self.shared_context:
+                try:
+                    await slot["context"].close()
+                except Exception:
+                    pass
+
+    def _check_memory(self) -> None:
+        self.rss = renderer_rss(os.getpid())
+        self.peak_rss = max(self.peak_rss, self.rss)
+        if self.rss <= RENDERER_RSS_MB_MAX * 1024 * 1024:
+            return
+        retiring = [info for info in self.contexts.values() if not info["retire"]]
+        for info in retiring:
+            info["retire"] = "memory"
+        if retiring:
+            print(f"  🧹 Renderer RSS {self.rss / 1024 / 1024:.0f} MB over {RENDERER_RSS_MB_MAX} MB, recycling {len(retiring)} context(s)")
+
+    async def acquire(self, worker_id: int):
+        """(page, inflight) for worker_id's next navigation, replacing its page or context first if due."""
+        async with self.lock:
+            reason = self._recycle_reason(self.slots[worker_id])
+            if reason:
+                await self._replace(worker_id, reason)
+            slot = self.slots[worker_id]
+            slot["navs"] += 1
+            info = self.contexts[slot["context"]]
+            info["navs"] += 1
+            if RECYCLE_CONTEXT_AFTER and info["navs"] >= RECYCLE_CONTEXT_AFTER and not info["retire"]:
+                info["retire"] = "context"
+            self.navs += 1
+            # The daemon's renderers are shared with other runs: their RSS says nothing about ours
+            if RENDERER_RSS_MB_MAX and self.shared_context is None and self.navs % RSS_CHECK_EVERY == 0:
+                self._check_memory()
+        return slot["page"], slot["inflight"]
+
+    def line(self) -> str:
+        recycled = ", ".join(f"{reason} {n:,}" for reason, n in sorted(self.recycled.items())) or "none"
+        rss = ("renderer RSS not watched (shared daemon)" if self.shared_context is not None
+               else f"renderer RSS {self.rss / 1024 / 1024:.0f} MB (peak {self.peak_rss / 1024 / 1024:.0f} MB)")
+        return (f"Browser: {self.navs:,} navigations, pages recycled ({recycled}), {self.contexts_closed:,} context(s) closed, "
+                f"{self.relaunches:,} relaunch(es), {rss}")
+
+# Empty client-side app mount points (React, Vue, Next, Nuxt, Gatsby, Svelte)
+SPA_ROOT_RE = re.compile(r"<div[^>]+id=[\"'](root|app|__next|__nuxt|___gatsby|svelte)[\"'][^>]*>\s*</div>", re.I)
+NOSCRIPT_JS_RE = re.compile(r"<noscript[^>]*>[^<]{0,200}(enable|requires?|turn on|activate)[^<]{0,40}javascript", re.I)
+WHITESPACE_RE = re.compile(r"\s+")
+
+def make_http_session():
+    """Pooled keep-alive session for the HTTP tier, honouring SCRAPE_PROXY."""
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(4, PAGE_POOL_SIZE * 2))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "User-Agent": HTTP_USER_AGENT,
+        "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.9",
+    })
+    if SCRAPE_PROXY:
+        session.proxies = {"http": SCRAPE_PROXY, "https": SCRAPE_PROXY}
+    return session
+
+def fetch_http(session, url: str, headers: dict = None):
+    """Blocking GET used by the HTTP tier (run in a thread). Returns the response, or None on error."""
+    try:
+        return session.get(url, headers=headers, timeout=HTTP_TIMEOUT, allow_redirects=True)
+    except Exception as e:
+        if verbose:
+            print(f"  ! HTTP tier failed for {url}: {e}")
+        return None
 
-            # Skip fetching if the URL is a known non-HTML resource (pdf, video, etc.)
-            if should_skip_url(url):
-                print(f"  ↩️  Skipping non-HTML resource: {url}")
-                continue
+def needs_javascript(html: str, markdown: str) -> str | None:
+    """
+    Heuristic check on server-rendered HTML and the markdown converted from its main content.
+    Returns why the page needs a browser, or None if the raw HTML already holds the content.
+    """
+    text = WHITESPACE_RE.sub(" ", markdown).strip()
+    if len(text) < JS_MIN_TEXT_CHARS:
+        return f"only {len(text)} chars of text"
+    if SPA_ROOT_RE.search(html):
+        return "empty SPA root"
+    # Many server-rendered sites carry a generic noscript notice, so only trust it on thin pages
+    if len(text) < JS_MIN_TEXT_CHARS * 3 and NOSCRIPT_JS_RE.search(html):
+        return "noscript hint"
+    return None
+
+def host_tier(host_stats: dict, host: str) -> str | None:
+    """
+    Learned fetch mode for a host: "http" (static, skip the JS check), "browser" (always needs JS,
+    skip the HTTP attempt) or None (still learning).
+    """
+    stats = host_stats[host]
+    if stats["static"] >= HOST_LEARN_AFTER and stats["escalated"] == 0:
+        return "http"
+    if stats["escalated"] >= HOST_LEARN_AFTER and stats["static"] == 0:
+        return "browser"
+    return None
+
+class HostThrottle:
+    """
+    Token bucket pacing requests to one host at `rate` per second (bursts of up to MAX_PER_HOST),
+    adapted AIMD-style from every response: the rate grows by about RATE_INCREASE req/s per
+    second while answers are healthy, and is multiplied by RATE_DECREASE on 429/503 or when the
+    smoothed latency rises RATE_LATENCY_FACTOR above the best seen. Latency is tracked per tier,
+    since a browser navigation is always far slower than a plain GET to the same host and would
+    otherwise read as an overloaded server. Retry-After pauses the host.
+    robots.txt Crawl-delay / Request-rate caps the rate.
+    """
+
+    def __init__(self, host: str, robots: RobotFileParser = None):
+        self.host = host
+        self.max_rate = RATE_MAX
+        self.crawl_delay = None
+        if robots is not None:
+            self.crawl_delay = robots.crawl_delay(ROBOTS_AGENT)
+            request_rate = robots.request_rate(ROBOTS_AGENT)
+            if self.crawl_delay:
+                self.max_rate = min(self.max_rate, HOST_RATE_SHARE / float(self.crawl_delay))
+            if request_rate:
+                self.max_rate = min(self.max_rate, HOST_RATE_SHARE * request_rate.requests / request_rate.seconds)
+        self.rate = min(RATE_START, self.max_rate)
+        self.burst = 1 if self.crawl_delay else MAX_PER_HOST
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.latency = {}  # tier ("http" / "browser") -> EWMA, seconds
+        self.best_latency = {}  # tier -> lowest EWMA seen
+        self.last_decrease = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.lowest_rate = self.rate
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+            elif self.tokens >= 1:
+                self.tokens -= 1
+                self.requests += 1
+                return
+            else:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def record(self, status: int | None, latency: float, retry_after: str = None, tier: str = "http") -> None:
+        """Feed back one response (status None = connection error) of the given fetch tier and adapt the rate."""
+        now = time.monotonic()
+        if status in THROTTLE_STATUSES:
+            self.throttled += 1
+            if retry_after and retry_after.strip().isdigit():
+                self.paused_until = max(self.paused_until, now + min(int(retry_after), 600))
+            self._decrease(now)
+            return
+        if status is None:
+            return
+        smoothed = latency if tier not in self.latency else 0.8 * self.latency[tier] + 0.2 * latency
+        self.latency[tier] = smoothed
+        self.best_latency[tier] = min(self.best_latency.get(tier, smoothed), smoothed)
+        if smoothed > self.best_latency[tier] * RATE_LATENCY_FACTOR and smoothed > 0.2:
+            self._decrease(now)
+        else:
+            self.rate = min(self.max_rate, self.rate + RATE_INCREASE / max(self.rate, 1.0))
+
+    def _decrease(self, now: float) -> None:
+        if now - self.last_decrease >= 1.0:
+            self.rate = max(RATE_MIN, self.rate * RATE_DECREASE)
+            self.lowest_rate = min(self.lowest_rate, self.rate)
+            self.last_decrease = now
+
+    def line(self) -> str:
+        delay = f", Crawl-delay {self.crawl_delay}s" if self.crawl_delay else ""
+        return (f"{self.host}: {self.requests:,} requests, now {self.rate:.1f} req/s (lowest {self.lowest_rate:.1f}, "
+                f"cap {self.max_rate:.1f}{delay}), {self.throttled:,} throttled (429/503)")
+
+OUT_DIR = None  # set in __main__ from START_URL
+
+# ---------------------------------------------------------------------------
+# Persistent crawl state (resume / retries)
+# ---------------------------------------------------------------------------
+
+def state_db_path(out_dir: str, shard: int = None) -> str:
+    """
+    SQLite state file kept next to the output folder, e.g. /Users/nic/dl/kaltura-website.crawl.sqlite
+    (kaltura-website.crawl.3.sqlite for shard 3 of a --processes crawl).
+    """
+    return f"{out_dir.rstrip('/')}.crawl{'' if shard is None else f'.{shard}'}.sqlite"
 
-            count_total += 1
+class CrawlState:
+    """
+    Frontier, visited set and per-URL outcome persisted to SQLite, so a crashed or interrupted
+    crawl can continue with --resume. The history table outlives runs: it keeps the sitemap
+    lastmod, ETag, Last-Modified, content hash and outgoing links of every page written, which
+    --incremental uses to skip unchanged pages. Writes are batched and committed every CHECKPOINT_EVERY
+    updates or CHECKPOINT_SECONDS (and on close). Page status is one of:
+      queued    discovered, not fetched yet
+      fetching  in flight (re-queued on resume)
+      retry     failed, will be retried after next_attempt
+      ok        written to outfile
+      unchanged same as the previous run (--incremental), existing outfile kept
+      alias     redirects or declares rel=canonical to another URL (canonical), written under that one
+      failed    gave up after MAX_RETRIES attempts
+    """
 
-            print(f"→ Fetching #{count_total}: {url}")
-            visited.add(url)
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                depth INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                retries INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL DEFAULT 0,
+                content_hash TEXT,
+                outfile TEXT,
+                error TEXT,
+                updated REAL
+            );
+            CREATE INDEX IF NOT EXISTS pages_status ON pages (status);
+            CREATE TABLE IF NOT EXISTS history (
+                url TEXT PRIMARY KEY,
+                lastmod TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                outfile TEXT,
+                links TEXT,
+                updated REAL
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        if "canonical" not in {row[1] for row in self.db.execute("PRAGMA table_info(pages)")}:
+            self.db.execute("ALTER TABLE pages ADD COLUMN canonical TEXT")  # state files from before aliases
+        if not resume:
+            self.db.execute("DELETE FROM pages")
+        self.pending_writes = 0
+        self.last_checkpoint = time.time()
+        self.db.commit()
+
+    def _write(self, sql: str, params: tuple) -> None:
+        self.db.execute(sql, params)
+        self.pending_writes += 1
+        if self.pending_writes >= CHECKPOINT_EVERY or time.time() - self.last_checkpoint >= CHECKPOINT_SECONDS:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        self.db.commit()
+        self.pending_writes = 0
+        self.last_checkpoint = time.time()
+
+    def close(self) -> None:
+        self.checkpoint()
+        self.db.close()
+
+    def set_meta(self, key: str, value: str) -> None:
+        self._write("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def get_meta(self, key: str) -> str | None:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def enqueue(self, url: str, depth: int) -> None:
+        self._write("INSERT OR IGNORE INTO pages (url, depth, updated) VALUES (?, ?, ?)", (url, depth, time.time()))
+
+    def mark_fetching(self, url: str) -> None:
+        self._write("UPDATE pages SET status = 'fetching', updated = ? WHERE url = ?", (time.time(), url))
+
+    def mark_ok(self, url: str, content_hash: str, outfile: str, lastmod: str = None, etag: str = None,
+                last_modified: str = None, links: set[str] = None) -> None:
+        self._write(
+            "UPDATE pages SET status = 'ok', content_hash = ?, outfile = ?, error = NULL, updated = ? WHERE url = ?",
+            (content_hash, outfile, time.time(), url),
+        )
+        self._write(
+            "INSERT OR REPLACE INTO history (url, lastmod, etag, last_modified, content_hash, outfile, links, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (url, lastmod, etag, last_modified, content_hash, outfile, "\n".join(sorted(links or ())), time.time()),
+        )
+
+    def mark_unchanged(self, url: str, lastmod: str = None) -> None:
+        self._write("UPDATE pages SET status = 'unchanged', updated = ? WHERE url = ?", (time.time(), url))
+        if lastmod:
+            self._write("UPDATE history SET lastmod = ?, updated = ? WHERE url = ?", (lastmod, time.time(), url))
+
+    def previous(self, url: str) -> dict | None:
+        """What the last run that wrote url recorded about it, or None if it is new."""
+        row = self.db.execute(
+            "SELECT lastmod, etag, last_modified, content_hash, outfile, links FROM history WHERE url = ?", (url,)
+        ).fetchone()
+        if not row:
+            return None
+        keys = ("lastmod", "etag", "last_modified", "content_hash", "outfile", "links")
+        prev = dict(zip(keys, row))
+        prev["links"] = set(filter(None, (prev["links"] or "").split("\n")))
+        return prev
+
+    def removed_urls(self) -> list[tuple[str, str | None]]:
+        """
+        (url, outfile) of pages written by an earlier run that this run never reached or found to
+        be an alias. outfile is None when a page of this run owns the same file.
+        """
+        removed = self.db.execute(
+            "SELECT url, outfile FROM history WHERE url NOT IN (SELECT url FROM pages WHERE status != 'alias')"
+        ).fetchall()
+        live = {row[0] for row in self.db.execute(
+            "SELECT outfile FROM history WHERE url IN (SELECT url FROM pages WHERE status IN ('ok', 'unchanged'))"
+        )}
+        return [(url, None if outfile in live else outfile) for url, outfile in removed]
+
+    def reached_urls(self) -> set[str]:
+        """URLs this run reached as pages of their own (any status but alias)."""
+        return {row[0] for row in self.db.execute("SELECT url FROM pages WHERE status != 'alias'")}
+
+    def history_outfiles(self) -> dict[str, str]:
+        """{url: outfile} of every page written by this or an earlier run."""
+        return dict(self.db.execute("SELECT url, outfile FROM history").fetchall())
+
+    def forget(self, urls: list[str]) -> None:
+        for url in urls:
+            self._write("DELETE FROM history WHERE url = ?", (url,))
+
+    def mark_alias(self, url: str, canonical: str) -> None:
+        self._write("UPDATE pages SET status = 'alias', canonical = ?, updated = ? WHERE url = ?", (canonical, time.time(), url))
+
+    def mark_skipped(self, url: str) -> None:
+        self._write("UPDATE pages SET status = 'skipped', updated = ? WHERE url = ?", (time.time(), url))
+
+    def mark_failed(self, url: str, error: str) -> bool:
+        """Record a failed attempt. Returns True if the URL will be retried later."""
+        retries = (self.db.execute("SELECT retries FROM pages WHERE url = ?", (url,)).fetchone() or (0,))[0] + 1
+        if retries < MAX_RETRIES:
+            next_attempt = time.time() + RETRY_BACKOFF * 2 ** (retries - 1)
+            self._write(
+                "UPDATE pages SET status = 'retry', retries = ?, next_attempt = ?, error = ?, updated = ? WHERE url = ?",
+                (retries, next_attempt, error[:500], time.time(), url),
+            )
+            return True
+        self._write(
+            "UPDATE pages SET status = 'failed', retries = ?, error = ?, updated = ? WHERE url = ?",
+            (retries, error[:500], time.time(), url),
+        )
+        return False
+
+    def frontier(self) -> list[tuple[str, int]]:
+        """URLs still to fetch when resuming: queued or interrupted mid-fetch (retries wait for due_retries())."""
+        return self.db.execute(
+            "SELECT url, depth FROM pages WHERE status IN ('queued', 'fetching') ORDER BY rowid"
+        ).fetchall()
+
+    def retry_urls(self) -> list[str]:
+        return [row[0] for row in self.db.execute("SELECT url FROM pages WHERE status = 'retry'")]
+
+    def done_urls(self) -> set[str]:
+        return {row[0] for row in self.db.execute("SELECT url FROM pages WHERE status IN ('ok', 'unchanged', 'alias', 'failed', 'skipped')")}
+
+    def due_retries(self) -> tuple[list[tuple[str, int]], float | None]:
+        """Return (retries due now, seconds until the next one is due or None if there are none)."""
+        now = time.time()
+        due = self.db.execute(
+            "SELECT url, depth FROM pages WHERE status = 'retry' AND next_attempt <= ?", (now,)
+        ).fetchall()
+        row = self.db.execute("SELECT MIN(next_attempt) FROM pages WHERE status = 'retry' AND next_attempt > ?", (now,)).fetchone()
+        return due, (row[0] - now) if row and row[0] else None
+
+    def written_outfiles(self) -> dict[str, str]:
+        """{url: outfile} of the pages this run wrote or kept unchanged."""
+        return dict(self.db.execute(
+            "SELECT url, outfile FROM history WHERE url IN (SELECT url FROM pages WHERE status IN ('ok', 'unchanged'))"
+        ).fetchall())
+
+    def counts(self) -> dict:
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM pages GROUP BY status").fetchall())
+
+render_waits = []  # measured render wait (ms) per fetched page
+tier_counts = defaultdict(int)  # pages served per fetch tier ("http" / "browser")
+change_counts = defaultdict(int)  # --incremental: pages "added" / "changed" / "unchanged"
+
+async def fetch_with_http_tier(session, url: str, host_stats: dict, domain: str, want_links: bool,
+                               prev: dict = None, throttle: HostThrottle = None) -> dict | None:
+    """
+    Try the HTTP tier for url. Returns None to escalate to the browser, otherwise a dict:
+      {"throttled": status}                    host answered 429/503: back off, retry the URL later
+      {"unchanged": True}                      conditional GET answered 304 (prev validators match)
+      {"page", "html", "final_url", "etag", "last_modified"}
+                                               server-rendered HTML is good enough; page is the
+                                               convert_page() result, so the HTML is parsed once
+    With prev (--incremental: conditional_validators()) a conditional GET is sent even for
+    browser-only hosts, since a 304 saves the render. Updates the per-host statistics and paces
+    the request through throttle.
+    """
+    host = urlparse(url).netloc
+    mode = host_tier(host_stats, host) if HTTP_FIRST else "browser"
+    headers = {}
+    if prev and prev.get("etag"):
+        headers["If-None-Match"] = prev["etag"]
+    if prev and prev.get("last_modified"):
+        headers["If-Modified-Since"] = prev["last_modified"]
+    if mode == "browser" and not headers:
+        return None
 
+    if throttle is not None:
+        await throttle.acquire()
+    sent = time.monotonic()
+    resp = await asyncio.to_thread(fetch_http, session, url, headers)
+    if throttle is not None:
+        throttle.record(resp.status_code if resp is not None else None, time.monotonic() - sent,
+                        resp.headers.get("retry-after") if resp is not None else None)
+    if resp is not None and resp.status_code in THROTTLE_STATUSES:
+        return {"throttled": resp.status_code}
+    if resp is not None and resp.status_code == 304:
+        return {"unchanged": True}
+    if mode == "browser":
+        return None
+    if resp is None or resp.status_code >= 400 or "html" not in resp.headers.get("content-type", "html"):
+        # Blocked, erroring or not HTML over plain HTTP - let the browser have a go
+        host_stats[host]["escalated"] += 1
+        return None
+
+    if not resp.encoding or resp.encoding.lower() == "iso-8859-1":
+        # requests falls back to latin-1 when the header has no charset
+        resp.encoding = resp.apparent_encoding
+    html = resp.text
+    converted = await convert_in_pool(html, resp.url, domain, want_links)
+    if mode != "http":
+        reason = needs_javascript(html, converted["markdown"])
+        if reason:
+            if verbose:
+                print(f"  ↗️  Needs browser ({reason})")
+            host_stats[host]["escalated"] += 1
+            return None
+    host_stats[host]["static"] += 1
+    return {
+        "page": converted,
+        "html": html,
+        "final_url": resp.url,
+        "etag": resp.headers.get("etag"),
+        "last_modified": resp.headers.get("last-modified"),
+    }
+
+def previous_outfile_exists(prev: dict | None) -> bool:
+    """The .md file the run that recorded prev wrote is still in OUT_DIR."""
+    return bool(prev and prev["outfile"] and os.path.exists(os.path.join(OUT_DIR, prev["outfile"])))
+
+def is_unchanged_by_lastmod(prev: dict, lastmod: str | None) -> bool:
+    """Sitemap shortcut: same <lastmod> as the run that wrote the (still existing) .md file."""
+    return bool(prev and lastmod and prev["lastmod"] == lastmod and previous_outfile_exists(prev))
+
+def conditional_validators(prev: dict | None) -> dict | None:
+    """
+    The ETag / Last-Modified of prev for a conditional GET, or None once its .md file is gone:
+    a 304 would record the page as unchanged and the deleted file would never be written again.
+    """
+    if not previous_outfile_exists(prev):
+        return None
+    return {"etag": prev["etag"], "last_modified": prev["last_modified"]}
+
+# ---------------------------------------------------------------------------
+# Raw HTML archive (WARC) and --reconvert
+# ---------------------------------------------------------------------------
+
+def archive_path(out_dir: str, shard: int = None) -> str:
+    """WARC file kept next to the output folder, e.g. /Users/nic/dl/kaltura-website.warc.gz (.3.warc.gz for shard 3)"""
+    return f"{out_dir.rstrip('/')}{'' if shard is None else f'.{shard}'}.warc.gz"
+
+class HtmlArchive:
+    """
+    Append-only WARC 1.1 archive of the HTML each page was converted from (the rendered DOM for
+    browser fetches), one gzip member per record so any record can be read on its own from its
+    offset. Response metadata (tier, depth, ETag, Last-Modified) goes into X-Crawl-* fields.
+    Not thread-safe: all appends happen on the single writer thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        is_new = not os.path.exists(path)
+        self.f = open(path, "ab")
+        self.records = 0
+        self.bytes_in = 0
+        if is_new:
+            self._write_record("warcinfo", None, b"software: website2md.py\r\nformat: WARC File Format 1.1\r\n",
+                               "application/warc-fields", {})
+
+    def _write_record(self, warc_type: str, url: str | None, payload: bytes, content_type: str, extra: dict) -> None:
+        headers = [
+            "WARC/1.1",
+            f"WARC-Type: {warc_type}",
+            f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>",
+            f"WARC-Date: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}",
+        ]
+        if url:
+            headers.append(f"WARC-Target-URI: {url}")
+        headers.append(f"Content-Type: {content_type}")
+        headers += [f"{key}: {value}" for key, value in extra.items() if value is not None]
+        headers.append(f"Content-Length: {len(payload)}")
+        record = ("\r\n".join(headers) + "\r\n\r\n").encode("utf-8") + payload + b"\r\n\r\n"
+        self.f.write(gzip.compress(record, compresslevel=6))
+
+    def append(self, url: str, html: str, meta: dict) -> None:
+        payload = html.encode("utf-8")
+        self._write_record("resource", url, payload, "text/html; charset=utf-8",
+                           {f"X-Crawl-{key}": value for key, value in meta.items()})
+        self.records += 1
+        self.bytes_in += len(payload)
+
+    def close(self) -> None:
+        self.f.close()
+
+def _parse_warc_record(record: bytes) -> tuple[dict, bytes]:
+    head, _, rest = record.partition(b"\r\n\r\n")
+    headers = {}
+    for line in head.decode("utf-8", errors="replace").split("\r\n")[1:]:
+        key, _, value = line.partition(":")
+        headers[key.strip()] = value.strip()
+    return headers, rest[:int(headers.get("Content-Length", len(rest)))]
+
+def iter_archive(path: str):
+    """Yield (offset, headers, payload) for every record, reading one gzip member at a time."""
+    with open(path, "rb") as f:
+        offset = 0
+        pending = b""
+        while True:
+            decomp = zlib.decompressobj(wbits=31)
+            parts = []
+            consumed = 0
+            while not decomp.eof:
+                chunk = pending or f.read(1 << 16)
+                pending = b""
+                if not chunk:
+                    return
+                parts.append(decomp.decompress(chunk))
+                consumed += len(chunk)
+            pending = decomp.unused_data
+            consumed -= len(pending)
+            headers, payload = _parse_warc_record(b"".join(parts))
+            yield offset, headers, payload
+            offset += consumed
+
+def read_archive_record(path: str, offset: int) -> tuple[dict, bytes]:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        decomp = zlib.decompressobj(wbits=31)
+        parts = []
+        while not decomp.eof:
+            chunk = f.read(1 << 16)
+            if not chunk:
+                break
+            parts.append(decomp.decompress(chunk))
+    return _parse_warc_record(b"".join(parts))
+
+def reconvert_record(path: str, offset: int, out_dir: str, domain: str) -> tuple[str, int]:
+    """Process-pool job: rebuild one .md file from an archived record. Returns (outfile, chars)."""
+    headers, payload = read_archive_record(path, offset)
+    url = headers["WARC-Target-URI"]
+    converted = convert_page(payload.decode("utf-8", errors="replace"), url, domain, want_links=False)
+    relative_outfile = clean_filepath(url)
+    write_markdown(os.path.join(out_dir, relative_outfile), url, converted["markdown"])
+    return relative_outfile, len(converted["markdown"])
+
+def reconvert_from_archive(out_dir: str, start_url: str) -> int:
+    """
+    --reconvert: rebuild every .md file under out_dir from the archived HTML (latest record per
+    URL) in parallel, without fetching anything. Returns the number of pages written.
+    """
+    path = archive_path(out_dir)
+    # A --processes crawl leaves one archive per shard; a URL only ever lives in one of them
+    paths = [p for p in [path] + sorted(glob.glob(f"{out_dir.rstrip('/')}.[0-9]*.warc.gz")) if os.path.exists(p)]
+    if not paths:
+        print(f"❌ No archive at {path} (crawl with --archive first)")
+        return 0
+
+    latest = {}
+    for path in paths:
+        for offset, headers, _ in iter_archive(path):
+            if headers.get("WARC-Type") == "resource":
+                latest[headers["WARC-Target-URI"]] = (path, offset)
+    print(f"📦 {len(latest):,} archived pages in {', '.join(paths)}, reconverting with {CONVERT_WORKERS} process(es)")
+
+    domain = urlparse(start_url).netloc.lower()
+    written = 0
+    with ProcessPoolExecutor(max_workers=CONVERT_WORKERS, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(reconvert_record, path, offset, out_dir, domain) for path, offset in latest.values()]
+        for future in as_completed(futures):
             try:
-                await page.goto(url, wait_until="domcontentloaded", timeout=60000)
-                # Give JS a moment to render dynamic content
-                await page.wait_for_timeout(3000)
-                html = await page.content()
+                relative_outfile, chars = future.result()
             except Exception as e:
-                print(f"  ! Failed: {e}")
+                print(f"  ! Reconvert failed: {e}")
                 continue
+            written += 1
+            if verbose:
+                print(f"  ✓ {relative_outfile} ({chars:,} chars)")
+    print(f"\n✅ Reconverted {written:,}/{len(latest):,} pages into {out_dir}")
+    return written
+
+# ---------------------------------------------------------------------------
+# Site-wide boilerplate learning
+# ---------------------------------------------------------------------------
+
+MD_BLOCK_SPLIT_RE = re.compile(r"\n\s*\n")
+
+def boilerplate_path(out_dir: str) -> str:
+    """Learned block hashes kept next to the output folder, e.g. /Users/nic/dl/kaltura-website.boilerplate.npy"""
+    return f"{out_dir.rstrip('/')}.boilerplate.npy"
+
+def split_md_file(text: str) -> tuple[str, list[str]]:
+    """(<!-- Source --> header or "", markdown blocks) of a written .md file."""
+    header = ""
+    if text.startswith("<!-- Source:"):
+        header, _, text = text.partition("\n")
+    return header, [block.strip("\n") for block in MD_BLOCK_SPLIT_RE.split(text) if block.strip()]
+
+def block_hashes(blocks: list[str]) -> np.ndarray:
+    """64-bit hash per block (whitespace-insensitive); headings hash to 0 so they are never stripped."""
+    return np.fromiter(
+        (0 if block.lstrip().startswith("#") else
+         int.from_bytes(hashlib.blake2b(WHITESPACE_RE.sub(" ", block).strip().encode("utf-8"), digest_size=8).digest(), "little")
+         for block in blocks),
+        dtype=np.uint64, count=len(blocks),
+    )
 
-            main_html = extract_main_content(html)
-            markdown = md(main_html, heading_style="ATX", strip=["a"])
+def strip_site_boilerplate(out_dir: str) -> None:
+    """
+    Site-level pass over the written .md files: hash every block (paragraph, list, table...)
+    of every page, count on how many pages each hash appears with np.unique, and strip blocks
+    found on at least BOILERPLATE_MIN_SHARE of the pages (and BOILERPLATE_MIN_PAGES) from all
+    of them. Learned hashes are kept in boilerplate_path(out_dir) and stripped on later runs
+    too, since files kept by --incremental have already lost them and no longer count.
+    """
+    md_files = sorted(
+        os.path.join(root, name) for root, _, names in os.walk(out_dir) for name in names if name.endswith(".md")
+    )
+    known = np.load(boilerplate_path(out_dir)) if os.path.exists(boilerplate_path(out_dir)) else np.empty(0, np.uint64)
+    if len(md_files) < BOILERPLATE_MIN_PAGES and not len(known):
+        return
+
+    # Pass 1: hashes only, so memory does not grow with the site's text
+    per_page = []
+    for path in md_files:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            per_page.append(np.unique(block_hashes(split_md_file(f.read())[1])))
+    hashes, pages = np.unique(np.concatenate(per_page) if per_page else np.empty(0, np.uint64), return_counts=True)
+    threshold = max(BOILERPLATE_MIN_PAGES, math.ceil(BOILERPLATE_MIN_SHARE * len(md_files)))
+    learned = hashes[(pages >= threshold) & (hashes != 0)]
+    known = np.union1d(known, learned)
+    if not len(known):
+        print(f"🧹 No site-wide boilerplate blocks found in {len(md_files):,} pages")
+        return
+
+    # Pass 2: rewrite the pages that contain any of them
+    removed_chars = total_chars = rewritten = 0
+    for path, page_hashes in zip(md_files, per_page):
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            text = f.read()
+        total_chars += len(text)
+        if not np.isin(page_hashes, known).any():
+            continue
+        header, blocks = split_md_file(text)
+        keep = ~np.isin(block_hashes(blocks), known)
+        body = "\n\n".join(block for block, kept in zip(blocks, keep) if kept)
+        new_text = f"{header}\n\n{body}" if header else body
+        removed_chars += len(text) - len(new_text)
+        rewritten += 1
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(new_text)
+    np.save(boilerplate_path(out_dir), known)
+    share = removed_chars / total_chars * 100 if total_chars else 0
+    print(f"🧹 Boilerplate: {len(learned):,} block(s) on >= {threshold:,} of {len(md_files):,} pages "
+          f"({len(known):,} known), stripped from {rewritten:,} page(s): -{removed_chars:,} chars ({share:.1f}%)")
+
+# ---------------------------------------------------------------------------
+# Crawl pipeline: frontier -> fetch -> convert -> write, with link discovery feeding back
+# ---------------------------------------------------------------------------
+
+class StageStats:
+    """Throughput, utilisation and input queue depth of one pipeline stage."""
+
+    def __init__(self, name: str, workers: int, queue: asyncio.Queue):
+        self.name = name
+        self.workers = workers
+        self.queue = queue
+        self.items = 0
+        self.busy = 0.0  # seconds spent working, summed over the stage's workers
+        self.max_depth = 0
+        self.started = time.monotonic()
+
+    def record(self, seconds: float) -> None:
+        self.items += 1
+        self.busy += seconds
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def utilization(self) -> float:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return self.busy / (elapsed * self.workers)
+
+    def line(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return (f"{self.name:<8} x{self.workers:<3} queue {self.queue.qsize():>5} (max {self.max_depth:>5})  "
+                f"{self.items:>7,} items  {self.items / elapsed:6.2f}/s  {self.utilization() * 100:5.1f}% busy")
+
+def url_fingerprint(url: str) -> int:
+    """64-bit fingerprint of a URL (never 0, which marks an empty slot in UrlFingerprintSet)."""
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+def shard_of(url: str, shards: int) -> int:
+    """Crawl process owning a canonical URL in a --processes crawl."""
+    return url_fingerprint(url) % shards
+
+class UrlFingerprintSet:
+    """
+    Exact-membership URL set storing 64-bit fingerprints in an open-addressing NumPy table
+    (linear probing, kept at most half full) instead of URL strings: 16-32 bytes per URL
+    whatever the URL length. Two URLs sharing a fingerprint (odds ~n^2/2^65) count as one.
+    """
 
-            # Clean up excessive whitespace
-            markdown = re.sub(r"\n{3,}", "\n\n", markdown).strip()
+    def __init__(self, capacity: int = 1 << 16):
+        self.table = np.zeros(capacity, dtype=np.uint64)
+        self.mask = capacity - 1
+        self.count = 0
+
+    def _find(self, fp: int) -> tuple[int, bool]:
+        slot = fp & self.mask
+        while True:
+            value = int(self.table[slot])
+            if value == fp:
+                return slot, True
+            if value == 0:
+                return slot, False
+            slot = (slot + 1) & self.mask
+
+    def __contains__(self, url: str) -> bool:
+        return self._find(url_fingerprint(url))[1]
+
+    def add(self, url: str) -> None:
+        fp = url_fingerprint(url)
+        slot, found = self._find(fp)
+        if found:
+            return
+        self.table[slot] = fp
+        self.count += 1
+        if self.count * 2 > len(self.table):
+            self._grow()
+
+    def _grow(self) -> None:
+        old = self.table[self.table != 0]
+        self.table = np.zeros(len(self.table) * 2, dtype=np.uint64)
+        self.mask = len(self.table) - 1
+        for fp in old.tolist():
+            self.table[self._find(fp)[0]] = fp
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return self.table.nbytes
+
+class BloomFilter:
+    """
+    Fixed-size URL set for crawls too large even for fingerprints: m bits and k hash positions
+    (double hashing of one blake2b digest) sized for BLOOM_CAPACITY URLs at BLOOM_FP_RATE.
+    No false negatives; a false positive makes the crawler treat an unseen URL as seen.
+    len() counts adds that set at least one new bit.
+    """
 
-            relative_outfile = clean_filepath(url)
-            outfile = os.path.join(OUT_DIR, relative_outfile)
-            os.makedirs(os.path.dirname(outfile), exist_ok=True)
+    def __init__(self, capacity: int = None, fp_rate: float = None):
+        capacity, fp_rate = capacity or BLOOM_CAPACITY, fp_rate or BLOOM_FP_RATE
+        self.m = max(64, int(math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2)))
+        self.k = max(1, round(self.m / capacity * math.log(2)))
+        self.bits = bytearray((self.m + 7) // 8)  # bytearray indexing is much faster than NumPy scalars here
+        self.count = 0
+
+    def _positions(self, url: str) -> list[int]:
+        digest = hashlib.blake2b(url.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.m for i in range(self.k)]
+
+    def __contains__(self, url: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(url))
+
+    def add(self, url: str) -> None:
+        new = False
+        for pos in self._positions(url):
+            if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                self.bits[pos >> 3] |= 1 << (pos & 7)
+                new = True
+        self.count += new
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.bits)
+
+def make_url_set():
+    """Visited/seen set for the pipeline, per URL_SET_MODE. All three support add, in and len."""
+    if URL_SET_MODE == "bloom":
+        return BloomFilter()
+    if URL_SET_MODE == "hash":
+        return UrlFingerprintSet()
+    return set()
+
+def url_set_bytes(urls) -> int:
+    if isinstance(urls, set):
+        return sys.getsizeof(urls) + sum(sys.getsizeof(url) for url in urls)
+    return urls.nbytes
+
+class LinkGraph:
+    """
+    Site link graph kept as integer arrays instead of dicts of strings: each URL gets a node id,
+    each crawled page's outgoing links are appended to growing int32 src/dst edge arrays, and a
+    CSR view (indptr, indices) is built from them when ranking or exporting. PageRank is updated
+    every PAGERANK_EVERY pages during the crawl, warm-started from the previous ranks, so the
+    frontier can favour central pages; frontier URLs are nodes without outgoing edges yet.
+    """
 
-            with open(outfile, "w", encoding="utf-8") as f:
-                f.write(f"<!-- Source: {url} -->\n\n{markdown}")
+    def __init__(self):
+        self.ids = {}  # url -> node id
+        self.urls = []  # node id -> url
+        self.src = np.empty(4096, dtype=np.int32)
+        self.dst = np.empty(4096, dtype=np.int32)
+        self.edges = 0
+        self.in_links = np.zeros(4096, dtype=np.int32)  # live in-degree per node
+        self.pages = 0  # nodes whose outgoing links are known
+        self.rank = np.empty(0)
+        self.pages_at_rank = 0
+
+    def node(self, url: str) -> int:
+        node = self.ids.get(url)
+        if node is None:
+            node = self.ids[url] = len(self.urls)
+            self.urls.append(url)
+            if node >= len(self.in_links):
+                self.in_links = np.concatenate([self.in_links, np.zeros(len(self.in_links), dtype=np.int32)])
+        return node
+
+    def add_page(self, url: str, links) -> None:
+        src = self.node(url)
+        targets = [self.node(link) for link in links if link != url]
+        needed = self.edges + len(targets)
+        if needed > len(self.src):
+            size = max(needed, 2 * len(self.src))
+            self.src = np.resize(self.src, size)
+            self.dst = np.resize(self.dst, size)
+        self.src[self.edges:needed] = src
+        self.dst[self.edges:needed] = targets
+        np.add.at(self.in_links, targets, 1)
+        self.edges = needed
+        self.pages += 1
+
+    def csr(self) -> tuple[np.ndarray, np.ndarray]:
+        """(indptr, indices): the targets of node i are indices[indptr[i]:indptr[i + 1]]."""
+        src, dst = self.src[:self.edges], self.dst[:self.edges]
+        order = np.argsort(src, kind="stable")
+        indptr = np.zeros(len(self.urls) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(self.urls)), out=indptr[1:])
+        return indptr, dst[order]
+
+    def in_degree(self) -> np.ndarray:
+        return self.in_links[:len(self.urls)]
+
+    @property
+    def nbytes(self) -> int:
+        """Arrays plus an estimate for the url <-> id maps (which hold the URL strings)."""
+        strings = sum(sys.getsizeof(url) for url in self.urls)
+        return (self.src.nbytes + self.dst.nbytes + self.in_links.nbytes + self.rank.nbytes
+                + strings + sys.getsizeof(self.urls) + sys.getsizeof(self.ids))
+
+    def inlinks(self, url: str) -> int:
+        node = self.ids.get(url)
+        return 0 if node is None else int(self.in_links[node])
+
+    def update_rank(self, tol: float = 1e-6, max_iter: int = 100) -> int:
+        """Power-iteration PageRank over the graph so far. Returns the number of iterations."""
+        n = len(self.urls)
+        if not n:
+            return 0
+        indptr, indices = self.csr()
+        out_degree = np.diff(indptr)
+        dangling = out_degree == 0
+        rank = np.full(n, 1.0 / n)
+        if len(self.rank):
+            # Warm start: previous ranks for known nodes, average rank for new ones
+            rank[:len(self.rank)] = self.rank * len(self.rank) / n
+            rank /= rank.sum()
+        iterations = 0
+        for iterations in range(1, max_iter + 1):
+            share = np.divide(rank, out_degree, out=np.zeros(n), where=~dangling)
+            new = PAGERANK_DAMPING * np.bincount(indices, weights=np.repeat(share, out_degree), minlength=n)
+            new += (1 - PAGERANK_DAMPING + PAGERANK_DAMPING * rank[dangling].sum()) / n
+            delta = np.abs(new - rank).sum()
+            rank = new
+            if delta < tol:
+                break
+        self.rank = rank
+        self.pages_at_rank = self.pages
+        return iterations
+
+    def importance(self, url: str) -> float:
+        """PageRank relative to the average page (1.0), or 1.0 before the first update / for new URLs."""
+        node = self.ids.get(url)
+        if node is None or node >= len(self.rank):
+            return 1.0
+        return float(self.rank[node] * len(self.rank))
+
+    def export(self, path: str) -> None:
+        """Save the CSR arrays, URLs, in-degree and ranks as a compressed .npz."""
+        indptr, indices = self.csr()
+        np.savez_compressed(path, indptr=indptr, indices=indices, urls=np.array(self.urls, dtype=object),
+                            in_degree=self.in_degree(), rank=self.rank)
+
+def link_graph_path(out_dir: str) -> str:
+    """Link graph kept next to the output folder, e.g. /Users/nic/dl/kaltura-website.links.npz"""
+    return f"{out_dir.rstrip('/')}.links.npz"
+
+def export_page_ranks(graph: LinkGraph, outfiles: dict[str, str], out_dir: str) -> None:
+    """
+    Write <out_dir>/.page_rank.json ({outfile: {"url", "rank", "in_degree"}}) for the pages written,
+    which aggregate_md_files() uses to put the most central pages first, and the full graph to
+    link_graph_path(out_dir).
+    """
+    graph.update_rank()
+    in_degree = graph.in_degree()
+    ranks = {}
+    for url, outfile in outfiles.items():
+        node = graph.ids.get(url)
+        if node is not None and outfile:
+            ranks[outfile] = {"url": url, "rank": round(graph.importance(url), 4), "in_degree": int(in_degree[node])}
+    with open(os.path.join(out_dir, PAGE_RANK_FILE), "w", encoding="utf-8") as f:
+        json.dump(ranks, f, indent=1)
+    graph.export(link_graph_path(out_dir))
+    top = sorted(ranks.values(), key=lambda r: -r["rank"])[:5]
+    print(f"🕸️  Link graph: {len(graph.urls):,} URLs, {graph.edges:,} links -> {link_graph_path(out_dir)}")
+    for r in top:
+        print(f"   {r['rank']:6.2f}x  {r['in_degree']:>5,} in  {r['url']}")
+
+LANG_PREFIX_RE = re.compile(r"^/([a-z]{2})(?:[-_]([a-z]{2,4}))?(?=/|$)", re.I)
+
+def primary_language(tag: str) -> str:
+    """en-US / en_gb / EN -> en"""
+    return tag.replace("_", "-").split("-")[0].lower()
+
+class LanguageFilter:
+    """
+    Keeps the crawl to the wanted languages (WANTED_LANGUAGES, or the start page's language).
+    A URL's language comes from its path prefix (/de/, /fr-ca/) when the prefix is one of
+    LANGUAGE_PATH_CODES or was seen in an hreflang alternate of the site; a page's from its
+    <html lang>. URLs in other languages are pruned before they are queued or fetched, and the
+    hreflang alternates of a kept page are recorded as its aliases so they are never queued.
+    """
 
-            count += 1
+    def __init__(self, wanted: set[str] = None):
+        self.wanted = {primary_language(lang) for lang in wanted} if wanted else None
+        self.codes = set(LANGUAGE_PATH_CODES)
+        self.settled = bool(self.wanted)  # wanted is final: given, learned, or the start page had no language
+        self.pruned = 0
+        self.aliased = 0
+
+    def path_language(self, url: str) -> str | None:
+        match = LANG_PREFIX_RE.match(urlsplit(url).path)
+        if match and match.group(1).lower() in self.codes:
+            return match.group(1).lower()
+        return None
 
-            if FULL_SCRAPE or depth == 0:
-                new_links = extract_links(html, url, domain)
-                for link in new_links:
-                    if link not in visited:
-                        to_visit.append((link, depth + 1))
+    def learn(self, url: str, lang: str | None, alternates: dict[str, str]) -> None:
+        """Pick up language path prefixes from hreflang, and the wanted language from the start page."""
+        for tag, alternate in alternates.items():
+            match = LANG_PREFIX_RE.match(urlsplit(alternate).path)
+            if match and match.group(1).lower() == primary_language(tag):
+                self.codes.add(match.group(1).lower())
+        if not self.settled:
+            lang = lang or self.path_language(url)
+            if lang:
+                self.wanted = {primary_language(lang)}
+                self.settled = True
+                print(f"🌐 Keeping language: {', '.join(sorted(self.wanted))}")
+
+    def unwanted(self, url: str) -> bool:
+        lang = self.path_language(url)
+        return bool(self.wanted and lang and lang not in self.wanted)
+
+    def unwanted_page(self, lang: str | None) -> bool:
+        return bool(self.wanted and lang and primary_language(lang) not in self.wanted)
+
+    def wanted_alternate(self, alternates: dict[str, str]) -> str | None:
+        return next((url for tag, url in alternates.items()
+                     if tag != "x-default" and primary_language(tag) in (self.wanted or ())), None)
+
+    def unwanted_alternates(self, alternates: dict[str, str]) -> list[str]:
+        return [url for tag, url in alternates.items()
+                if tag != "x-default" and self.wanted and primary_language(tag) not in self.wanted]
+
+TEMPLATE_ID_RE = re.compile(r"^(?=[0-9a-f-]*\d)[0-9a-f-]{16,}$", re.I)  # hashes, uuids
+TEMPLATE_NUMBER_RE = re.compile(r"\d+")
+TRAP_DIGITS_RE = re.compile(r"\d")
+
+def is_ancestor_url(target: str, url: str) -> bool:
+    """True if target is the site root or a parent path of url (and not url itself), e.g. / or /docs/ for /docs/a."""
+    target_parts, parts = urlsplit(target), urlsplit(url)
+    if target_parts.netloc != parts.netloc or target_parts.query or target_parts.path == parts.path:
+        return False
+    ancestor = target_parts.path.rstrip("/") + "/"
+    return ancestor == "/" or parts.path.startswith(ancestor)
+
+def url_template(url: str) -> str:
+    """URL with numbers, ids and query values wildcarded: /blog/2024/05/page/3?p=9 -> /blog/{n}/{n}/page/{n}?p={v}"""
+    parts = urlsplit(url)
+    segments = [
+        "{id}" if TEMPLATE_ID_RE.match(segment) else TEMPLATE_NUMBER_RE.sub("{n}", segment)
+        for segment in parts.path.split("/")
+    ]
+    query = "&".join(f"{key}={{v}}" for key, _ in parse_qsl(parts.query, keep_blank_values=True))
+    return "/".join(segments) + (f"?{query}" if query else "")
 
-        await browser.close()
+class TrapDetector:
+    """
+    Guards the page budget against infinite URL spaces (calendars, faceted search, endless
+    pagination, relative-link loops). check() runs when a URL is about to be queued and rejects
+    paths deeper than TRAP_MAX_PATH_DEPTH, paths repeating a segment more than
+    TRAP_MAX_SEGMENT_REPEATS times, and URLs beyond TRAP_MAX_PER_TEMPLATE for their template
+    (except URLs the site lists in its sitemap: catalogs of /product/{n} are real pages).
+    record_content() watches the converted pages of each template: once TRAP_DUPLICATE_SAMPLE
+    have been seen and TRAP_DUPLICATE_RATIO of them are duplicates (digits ignored, so calendar
+    days with the same empty listing match), the whole template is treated as a trap. Pages under
+    TRAP_MIN_WORDS words are not counted: empty renders would all match each other.
+    """
+
+    def __init__(self):
+        self.per_template = defaultdict(int)  # template -> URLs queued
+        self.content = {}  # template -> [pages seen, set of content hashes]
+        self.trapped = set()  # templates judged to be traps by their content
+        self.pruned = defaultdict(int)  # (reason, template) -> URLs pruned
+
+    def _prune(self, reason: str, template: str) -> str:
+        self.pruned[(reason, template)] += 1
+        return reason
+
+    def check(self, url: str, listed: bool = False) -> str | None:
+        """
+        Why url should not be queued, or None. Counts it against its template when accepted.
+        listed (in the sitemap) skips the template cap; only its content can make it a trap.
+        """
+        segments = [segment for segment in urlsplit(url).path.split("/") if segment]
+        template = url_template(url)
+        if len(segments) > TRAP_MAX_PATH_DEPTH:
+            return self._prune("deep path", template)
+        if segments and max(segments.count(segment) for segment in set(segments)) > TRAP_MAX_SEGMENT_REPEATS:
+            return self._prune("repeating segments", template)
+        if template in self.trapped:
+            return self._prune("duplicate content", template)
+        if TRAP_MAX_PER_TEMPLATE and not listed and self.per_template[template] >= TRAP_MAX_PER_TEMPLATE:
+            return self._prune("template cap", template)
+        self.per_template[template] += 1
+        return None
+
+    def is_trapped(self, url: str) -> bool:
+        """For URLs queued before their template was found to be a trap."""
+        template = url_template(url)
+        if template in self.trapped:
+            self._prune("duplicate content", template)
+            return True
+        return False
+
+    def record_content(self, url: str, markdown: str) -> bool:
+        """Record a converted page. Returns True when this page tips its template into a trap."""
+        template = url_template(url)
+        if template in self.trapped or self.per_template[template] < TRAP_DUPLICATE_SAMPLE:
+            return False
+        if len(markdown.split()) < TRAP_MIN_WORDS:
+            return False
+        seen = self.content.setdefault(template, [0, set()])
+        seen[0] += 1
+        seen[1].add(hashlib.sha1(TRAP_DIGITS_RE.sub("", markdown).encode("utf-8")).digest())
+        if seen[0] >= TRAP_DUPLICATE_SAMPLE and (seen[0] - len(seen[1])) / seen[0] >= TRAP_DUPLICATE_RATIO:
+            self.trapped.add(template)
+            del self.content[template]
+            return True
+        return False
+
+    def report(self) -> None:
+        if not self.pruned:
+            return
+        print(f"🪤 Crawl traps: {sum(self.pruned.values()):,} URL(s) pruned")
+        for (reason, template), n in sorted(self.pruned.items(), key=lambda kv: -kv[1])[:10]:
+            print(f"   {n:>7,}  {reason:<18}  {template}")
+
+class SimHashIndex:
+    """
+    LSH index over page SimHashes. The 64 bits are split into NEAR_DUP_MAX_BITS + 1 bands; two
+    hashes within NEAR_DUP_MAX_BITS bits of each other must agree exactly on at least one band
+    (pigeonhole), so only pages sharing a band value are compared.
+    """
+
+    def __init__(self, max_bits: int = None):
+        self.max_bits = NEAR_DUP_MAX_BITS if max_bits is None else max_bits
+        bands = self.max_bits + 1
+        edges = [64 * i // bands for i in range(bands + 1)]
+        self.bands = [(start, (1 << (end - start)) - 1) for start, end in zip(edges, edges[1:])]
+        self.tables = [defaultdict(list) for _ in self.bands]
+        self.hashes = []
+        self.urls = []
+
+    def find(self, value: int) -> str | None:
+        """URL of an indexed page within max_bits of value, or None."""
+        for (shift, mask), table in zip(self.bands, self.tables):
+            for doc in table.get((value >> shift) & mask, ()):
+                if (self.hashes[doc] ^ value).bit_count() <= self.max_bits:
+                    return self.urls[doc]
+        return None
+
+    def add(self, url: str, value: int) -> None:
+        doc = len(self.urls)
+        self.urls.append(url)
+        self.hashes.append(value)
+        for (shift, mask), table in zip(self.bands, self.tables):
+            table[(value >> shift) & mask].append(doc)
+
+def frontier_score(url: str, depth: int, inlinks: int = 0, sitemap_priority: float = None,
+                   pagerank: float = 1.0) -> float:
+    """
+    Fetch priority of a queued URL, higher first: shallow pages, high sitemap <priority> (0.5 when
+    absent), many inbound links, high PageRank (relative to the average page, see LinkGraph.importance)
+    and PATH_PRIORITY prefixes win, each scaled by FRONTIER_WEIGHTS.
+    """
+    path = urlparse(url).path
+    prefixes = [prefix for prefix in PATH_PRIORITY if path == prefix or path.startswith(prefix.rstrip("/") + "/")]
+    return (
+        - FRONTIER_WEIGHTS["depth"] * depth
+        + FRONTIER_WEIGHTS["sitemap"] * (0.5 if sitemap_priority is None else sitemap_priority)
+        + FRONTIER_WEIGHTS["inlinks"] * math.log1p(inlinks)
+        + FRONTIER_WEIGHTS["pagerank"] * math.log(max(pagerank, 1e-3))
+        + FRONTIER_WEIGHTS["path"] * (PATH_PRIORITY[max(prefixes, key=len)] if prefixes else 0.0)
+    )
+
+class Frontier:
+    """
+    Priority frontier for the fetch stage: a heap of (-score, seq, url) plus a dict of pending URLs
+    for O(1) membership. score(url, depth) is called on push and whenever a pending URL gains an
+    inbound link or a shorter depth; the old heap entry is left in place and skipped when popped
+    (lazy deletion), and the heap is rebuilt once stale entries outnumber live ones. Equal scores
+    pop in FIFO order. get() waits like asyncio.Queue.get().
+    """
+
+    def __init__(self, score):
+        self.score = score
+        self.heap = []
+        self.pending = {}  # url -> [depth, score of its live heap entry]
+        self.seq = 0
+        self.ready = asyncio.Event()
+
+    def qsize(self) -> int:
+        return len(self.pending)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self.pending
+
+    def _push(self, url: str, depth: int) -> None:
+        score = self.score(url, depth)
+        self.pending[url] = [depth, score]
+        self.seq += 1
+        heapq.heappush(self.heap, (-score, self.seq, url))
+        if len(self.heap) > 2 * len(self.pending) + 1000:
+            self.heap = [(-entry[1], seq, url) for seq, (url, entry) in enumerate(self.pending.items())]
+            heapq.heapify(self.heap)
+        self.ready.set()
+
+    def put(self, url: str, depth: int) -> None:
+        self._push(url, depth)
+
+    def rescore(self) -> None:
+        """Re-score every pending URL (after a PageRank update) and rebuild the heap."""
+        self.heap = []
+        for url, entry in self.pending.items():
+            entry[1] = self.score(url, entry[0])
+            self.seq += 1
+            self.heap.append((-entry[1], self.seq, url))
+        heapq.heapify(self.heap)
+
+    def reprioritize(self, url: str, depth: int) -> None:
+        """Re-score a pending URL (new inbound link, or found at depth)."""
+        old_depth, old_score = self.pending[url]
+        depth = min(depth, old_depth)
+        if self.score(url, depth) != old_score:
+            self._push(url, depth)
+
+    async def get(self) -> tuple[str, int]:
+        while not self.pending:
+            self.ready.clear()
+            await self.ready.wait()
+        while True:
+            neg_score, _, url = heapq.heappop(self.heap)
+            entry = self.pending.get(url)
+            if entry is not None and entry[1] == -neg_score:
+                del self.pending[url]
+                return url, entry[0]
+
+class PageFetcher:
+    """
+    The download half of the fetch stage, shared by a local crawl and the worker nodes of a
+    distributed one (crawl_worker()): HTTP tier first, else a BrowserPool page, paced per host by a
+    HostThrottle and capped at MAX_PER_HOST. Crawl policy (what to fetch, what a result means)
+    stays with CrawlPipeline.
+    """
+
+    def __init__(self, domain: str, session, robots: RobotFileParser = None):
+        self.domain = domain
+        self.session = session
+        self.robots = robots  # for the start host's Crawl-delay / Request-rate
+        self.browsers = None  # BrowserPool, set by the owner once it is open
+        # Per-host cap on top of the global cap given by the page pool size
+        self.host_limits = defaultdict(lambda: asyncio.Semaphore(MAX_PER_HOST))
+        self.host_stats = defaultdict(lambda: {"static": 0, "escalated": 0})
+        self.throttles = {}  # host -> HostThrottle
+
+    def throttle(self, host: str) -> HostThrottle:
+        if host not in self.throttles:
+            self.throttles[host] = HostThrottle(host, self.robots if host == self.domain else None)
+        return self.throttles[host]
+
+    async def fetch(self, slot: int, url: str, want_links: bool, prev: dict = None) -> dict:
+        """
+        Download url with page slot `slot` of the BrowserPool when it needs the browser. Returns:
+          {"error": message}                       failed or throttled, worth a retry later
+          {"unchanged": True}                      conditional GET answered 304
+          {"tier", "final_url", "etag", "last_modified", ...}
+                                                   "converted" + "html" from the HTTP tier, or "html" /
+                                                   "extracted" (EXTRACT_IN_BROWSER) + "waited" (ms) from the browser
+        """
+        fetched = None
+        host = urlparse(url).netloc
+        if HTTP_FIRST or prev:
+            async with self.host_limits[host]:
+                fetched = await fetch_with_http_tier(self.session, url, self.host_stats, self.domain, want_links, prev,
+                                                     self.throttle(host))
+
+        if fetched and fetched.get("throttled"):
+            return {"error": f"HTTP {fetched['throttled']} (throttled)"}
+        if fetched and fetched.get("unchanged"):
+            return {"unchanged": True}
+        if fetched:
+            return {"tier": "http", "converted": fetched["page"], "html": fetched["html"], "final_url": fetched["final_url"],
+                    "etag": fetched["etag"], "last_modified": fetched["last_modified"]}
+
+        outcome = {"tier": "browser", "final_url": url, "etag": None, "last_modified": None}
+        try:
+            async with self.host_limits[host]:
+                throttle = self.throttle(host)
+                await throttle.acquire()
+                page, inflight = await self.browsers.acquire(slot)
+                nav_start = time.monotonic()
+                response = await page.goto(url, wait_until="domcontentloaded", timeout=60000)
+                status = response.status if response is not None else 200
+                throttle.record(status, time.monotonic() - nav_start,
+                                response.headers.get("retry-after") if response is not None else None, tier="browser")
+                if status in THROTTLE_STATUSES:
+                    raise RuntimeError(f"HTTP {status} (throttled)")
+                # Give JS a moment to render dynamic content
+                outcome["waited"] = await wait_for_render(page, inflight, nav_start)
+                if EXTRACT_IN_BROWSER:
+                    extracted = await page.evaluate(EXTRACT_MAIN_JS, EXTRACT_RULES)
+                    outcome["extracted"] = extracted
+                    extract_bytes["pages"] += 1
+                    extract_bytes["dom"] += extracted["dom_chars"]
+                    extract_bytes["shipped"] += len(extracted["html"]) + sum(len(href) for href in extracted["links"])
+                else:
+                    outcome["html"] = await page.content()
+                outcome["final_url"] = page.url
+        except Exception as e:
+            return {"error": str(e)}
+
+        if response is not None:
+            outcome.update(etag=response.headers.get("etag"), last_modified=response.headers.get("last-modified"))
+        return outcome
+
+class CrawlPipeline:
+    """
+    The crawl as explicit stages connected by asyncio queues, each with its own concurrency:
+      fetch    PAGE_POOL_SIZE workers (one BrowserPool page slot each) reading the priority frontier (Frontier),
+               or, coordinating a distributed crawl (start_remote()), URL leases handed to remote workers
+      convert  CONVERT_STAGE_WORKERS tasks feeding the process pool, queue bounded by CONVERT_QUEUE_SIZE
+      write    WRITE_WORKERS tasks on the writer thread, queue bounded by WRITE_QUEUE_SIZE
+      links    LINK_WORKERS tasks deduplicating discovered links into the frontier, bounded by LINKS_QUEUE_SIZE
+    A full queue blocks the stage feeding it (backpressure), so a slow stage shows up as a deep
+    input queue and high utilisation in the stage report. Completion is tracked with a count of
+    work units in flight anywhere in the pipeline; drain() waits for it to reach zero.
+    """
+
+    def __init__(self, state: CrawlState, domain: str, session, sitemap: dict, robots: RobotFileParser = None,
+                 shard: tuple[int, int] = None):
+        self.state = state
+        self.shard = shard  # (index, count) in a --processes crawl: URLs of other shards go to the outbox
+        self.outbox = []  # (url, depth) owned by other shards, handed to the ShardCoordinator
+        self.domain = domain
+        self.fetcher = PageFetcher(domain, session, robots)
+        self.sitemap = sitemap  # url -> {"lastmod", "priority"} from get_sitemap_urls()
+        self.visited = make_url_set()  # URLs claimed by a fetch worker (or adopted as a canonical URL)
+        self.seen = make_url_set()  # URLs ever put on the frontier, so each is queued once
+        self.retrying = set()  # failed URLs re-queued by requeue_retries(), allowed past visited once
+        self.dedup_counts = defaultdict(int)  # "link" (repeat enqueues dropped), "redirect" / "canonical" aliases
+        self.graph = LinkGraph() if LINK_GRAPH else None  # link graph so far (frontier priority, exported at the end)
+        self.frontier = Frontier(self._score)
+        self.convert_q = asyncio.Queue(maxsize=CONVERT_QUEUE_SIZE)
+        self.write_q = asyncio.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self.links_q = asyncio.Queue(maxsize=LINKS_QUEUE_SIZE)
+        self.host_stats = self.fetcher.host_stats
+        self.robots = robots
+        self.throttles = self.fetcher.throttles
+        self.traps = TrapDetector()
+        self.near_dups = SimHashIndex()
+        self.languages = LanguageFilter(WANTED_LANGUAGES) if LANGUAGE_FILTER else None
+        self.held = []  # (url, depth, retry) with a language-like path prefix, queued once the wanted language is known
+        self.stats = {
+            "fetch": StageStats("fetch", PAGE_POOL_SIZE, self.frontier),
+            "convert": StageStats("convert", CONVERT_STAGE_WORKERS, self.convert_q),
+            "write": StageStats("write", WRITE_WORKERS, self.write_q),
+            "links": StageStats("links", LINK_WORKERS, self.links_q),
+        }
+        self.active = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.tasks = []
+        self.browsers = None  # BrowserPool, set by start()
+        self.broker = None  # crawl_broker broker, set by start_remote()
+        self.leases = {}  # lease id -> {"items": {url: item}, "seq", "deadline"}, out with remote workers
+        self.lease_seq = 0  # order in which leases were queued
+        self.lease_counts = defaultdict(int)  # "expired" leases, "stale" results that came back after expiry
+        self.worker_counts = defaultdict(int)  # results per remote worker
+
+    # -- work accounting ------------------------------------------------------
+
+    def _begin(self) -> None:
+        self.active += 1
+        self.idle.clear()
+
+    def _end(self) -> None:
+        self.active -= 1
+        if self.held and self.active == len(self.held):
+            # Nothing else in flight, so the start page will not tell the wanted language any more
+            self.release_held()
+        if self.active == 0:
+            self.idle.set()
+
+    def add(self, url: str, depth: int, retry: bool = False) -> None:
+        """
+        Put a (canonical) URL on the frontier and in the persisted state, unless it was queued
+        before (retry=True re-queues a failed URL).
+        """
+        if retry:
+            self.retrying.add(url)
+        elif url in self.seen:
+            self.dedup_counts["link"] += 1
+            if url in self.frontier:
+                self.frontier.reprioritize(url, depth)
+            return
+        self.seen.add(url)
+        if self.shard is not None and shard_of(url, self.shard[1]) != self.shard[0]:
+            self.outbox.append((url, depth))
+            return
+        if self.languages is not None and not self.languages.settled and depth > 0 and LANG_PREFIX_RE.match(urlsplit(url).path):
+            # Sitemap URLs arrive before the start page is converted: /de/... waits until its language can be judged
+            self.state.enqueue(url, depth)
+            self._begin()
+            self.held.append((url, depth, retry))
+            return
+        if not self._admissible(url, depth, retry):
+            return
+        self.state.enqueue(url, depth)
+        self._begin()
+        self.frontier.put(url, depth)
+
+    def release_held(self) -> None:
+        """Queue the URLs add() held back until the wanted language was known, dropping the unwanted ones."""
+        held, self.held = self.held, []
+        self.languages.settled = True
+        for url, depth, retry in held:
+            if self._admissible(url, depth, retry):
+                self.frontier.put(url, depth)
+            else:
+                self.state.mark_skipped(url)
+                self._end()
+
+    def _admissible(self, url: str, depth: int, retry: bool = False) -> bool:
+        """Crawl policy checks of add(): robots.txt, other-language paths and crawl traps."""
+        if self.robots is not None and not self.robots.can_fetch(ROBOTS_AGENT, url):
+            self.dedup_counts["robots"] += 1
+            if verbose:
+                print(f"  🤖 Disallowed by robots.txt: {url}")
+            return False
+        if self.languages is not None:
+            if depth == 0:
+                self.languages.learn(url, None, {})
+            elif self.languages.unwanted(url):
+                self.languages.pruned += 1
+                return False
+        if depth > 0 and not retry and self.traps.check(url, listed=url in self.sitemap):
+            return False
+        return True
+
+    def _score(self, url: str, depth: int) -> float:
+        if self.graph is None:
+            return frontier_score(url, depth, 0, self.sitemap.get(url, {}).get("priority"))
+        return frontier_score(url, depth, self.graph.inlinks(url), self.sitemap.get(url, {}).get("priority"),
+                              self.graph.importance(url))
+
+    async def _put_links(self, url: str, links: set[str], depth: int) -> None:
+        if links:
+            self._begin()
+            await self.links_q.put((url, links, depth))
+
+    # -- stages ---------------------------------------------------------------
+
+    async def fetch_worker(self, worker_id: int) -> None:
+        while True:
+            url, depth = await self.frontier.get()
+            forwarded = False
+            try:
+                start = time.monotonic()
+                item = await self._fetch(worker_id, url, depth)
+                if item is not None:
+                    self.stats["fetch"].record(time.monotonic() - start)
+                    await self.convert_q.put(item)
+                    forwarded = True
+            except Exception as e:
+                # Keep the worker alive: a dead worker would shrink the page pool for good
+                print(f"  ! Error fetching {url}: {e}")
+                self.state.mark_failed(url, str(e))
+            finally:
+                if not forwarded:
+                    self._end()
+
+    async def _fetch(self, worker_id: int, url: str, depth: int) -> dict | None:
+        """Fetch one frontier URL. Returns the item for the convert stage, or None if there is nothing to convert."""
+        item = await self._claim(f"w{worker_id}", url, depth)
+        if item is None:
+            return None
+        outcome = await self.fetcher.fetch(worker_id, url, item["expand"], conditional_validators(item["prev"]))
+        return item if await self._apply(item, outcome) else None
+
+    async def _claim(self, label: str, url: str, depth: int) -> dict | None:
+        """
+        Crawl policy for a frontier URL about to be fetched (page budget, skips, sitemap lastmod).
+        Returns its item, marked as fetching, or None if it is not to be fetched.
+        """
+        global count_total
+
+        # Retries were counted against MAX_PAGES on their first attempt
+        if url not in self.retrying and (url in self.visited or len(self.visited) >= MAX_PAGES):
+            return None
+        self.retrying.discard(url)
+
+        # Skip fetching if the URL is a known non-HTML resource (pdf, video, etc.)
+        if should_skip_url(url):
+            print(f"  ↩️  Skipping non-HTML resource: {url}")
+            self.state.mark_skipped(url)
+            return None
+
+        if self.traps.is_trapped(url) or (depth > 0 and self.languages is not None and self.languages.unwanted(url)):
+            self.state.mark_skipped(url)
+            return None
+
+        count_total += 1
+        self.visited.add(url)
+        self.state.mark_fetching(url)
+        expand = FULL_SCRAPE or depth == 0
+        prev = self.state.previous(url) if INCREMENTAL else None
+        lastmod = self.sitemap.get(url, {}).get("lastmod")
+        item = {"url": url, "depth": depth, "expand": expand, "prev": prev, "lastmod": lastmod,
+                "etag": None, "last_modified": None, "html": None, "converted": None, "tier": "browser",
+                "final_url": url}
+
+        if is_unchanged_by_lastmod(prev, lastmod):
+            print(f"→ [{label}] Unchanged #{count_total} (sitemap lastmod): {url}")
+            change_counts["unchanged"] += 1
+            self.state.mark_unchanged(url, lastmod)
+            if expand:
+                await self._put_links(url, prev["links"], depth + 1)
+            return None
+
+        print(f"→ [{label}] Fetching #{count_total}: {url}")
+        return item
+
+    async def _apply(self, item: dict, outcome: dict) -> bool:
+        """Record a PageFetcher.fetch() outcome on item. Returns True if the item goes on to the convert stage."""
+        url = item["url"]
+        if "error" in outcome:
+            self._fail(url, outcome["error"])
+            return False
+        if outcome.get("unchanged"):
+            print("  = Not modified (304)")
+            change_counts["unchanged"] += 1
+            self.state.mark_unchanged(url, item["lastmod"])
+            if item["expand"]:
+                await self._put_links(url, item["prev"]["links"], item["depth"] + 1)
+            return False
+        converted = outcome.get("converted")
+        item.update(tier=outcome["tier"], final_url=outcome["final_url"], etag=outcome["etag"],
+                    last_modified=outcome["last_modified"], converted=converted, extracted=outcome.get("extracted"),
+                    # Until conversion the browser HTML is the page; after it only the archive wants it
+                    html=outcome.get("html") if html_archive or converted is None else None)
+        tier_counts[outcome["tier"]] += 1
+        if "waited" in outcome:
+            render_waits.append(outcome["waited"])
+            if verbose:
+                print(f"  ⏱️  Rendered in {outcome['waited']}ms")
+        return True
+
+    # -- remote fetch stage (distributed crawl coordinator) ---------------------
+
+    async def dispatch_worker(self) -> None:
+        """Claim frontier URLs and lease them to the workers in batches of up to LEASE_BATCH."""
+        while True:
+            await self.lease_slots.acquire()
+            batch = []
+            # Wait for the first URL only: a short batch beats holding URLs back from idle workers
+            while len(batch) < LEASE_BATCH and (not batch or self.frontier.qsize()):
+                url, depth = await self.frontier.get()
+                try:
+                    item = await self._claim("lease", url, depth)
+                except Exception as e:
+                    print(f"  ! Error fetching {url}: {e}")
+                    self.state.mark_failed(url, str(e))
+                    item = None
+                if item is None:
+                    self._end()
+                    continue
+                item["leased"] = time.monotonic()
+                batch.append(item)
+            lease = uuid.uuid4().hex
+            task = {
+                "lease": lease, "domain": self.domain, "scheme": urlparse(batch[0]["url"]).scheme, "archive": bool(html_archive),
+                "urls": [{"url": item["url"], "expand": item["expand"],
+                          "prev": conditional_validators(item["prev"])}
+                         for item in batch],
+            }
+            await self.broker.put_task(task)
+            self.lease_seq += 1
+            # No deadline while it waits in the task queue: the clock starts when a worker takes it
+            self.leases[lease] = {"items": {item["url"]: item for item in batch}, "seq": self.lease_seq, "deadline": None}
+
+    def _settle(self, lease: str) -> None:
+        del self.leases[lease]
+        self.lease_slots.release()
+
+    def _taken(self, lease: str) -> None:
+        """A worker acknowledged taking lease: start its clock."""
+        if lease in self.leases:
+            self.leases[lease]["deadline"] = time.monotonic() + LEASE_SECONDS
+
+    async def collect_worker(self) -> None:
+        """Turn worker results into convert-stage items; any result also renews its lease."""
+        while True:
+            result = await self.broker.get_result(timeout=1)
+            if result is None:
+                continue
+            if result.get("taken"):
+                self._taken(result["lease"])
+                continue
+            lease = self.leases.get(result["lease"])
+            item = lease["items"].pop(result["url"], None) if lease else None
+            if item is None:
+                # Its lease expired and the URL went back on the frontier
+                self.lease_counts["stale"] += 1
+                continue
+            lease["deadline"] = time.monotonic() + LEASE_SECONDS
+            if not lease["items"]:
+                self._settle(result["lease"])
+            self.worker_counts[result["worker"]] += 1
+            outcome = result["outcome"]
+            if outcome.get("converted"):
+                outcome["converted"]["links"] = set(outcome["converted"]["links"])
+            forwarded = False
+            try:
+                if await self._apply(item, outcome):
+                    self.stats["fetch"].record(time.monotonic() - item.pop("leased"))
+                    await self.convert_q.put(item)
+                    forwarded = True
+            except Exception as e:
+                print(f"  ! Error fetching {item['url']}: {e}")
+                self.state.mark_failed(item["url"], str(e))
+            finally:
+                if not forwarded:
+                    self._end()
+
+    async def expire_worker(self) -> None:
+        """Take back taken leases with no result for LEASE_SECONDS (worker gone); their URLs fail and are retried."""
+        while True:
+            await asyncio.sleep(min(LEASE_SECONDS / 4, 5))
+            waiting = sorted((entry["seq"], lease) for lease, entry in self.leases.items() if entry["deadline"] is None)
+            queued = await self.broker.pending_tasks()
+            now = time.monotonic()
+            # The task queue is FIFO: unacknowledged leases beyond those still queued were taken by a
+            # worker that died before acknowledging (or the acknowledgement beat the lease's registration)
+            for _, lease in waiting[:max(0, len(waiting) - queued)]:
+                if lease in self.leases and self.leases[lease]["deadline"] is None:
+                    self.leases[lease]["deadline"] = now + LEASE_SECONDS
+            for lease, entry in list(self.leases.items()):
+                if entry["deadline"] is None or entry["deadline"] > now:
+                    continue
+                self._settle(lease)
+                self.lease_counts["expired"] += 1
+                print(f"  ⌛ Lease {lease[:8]} expired with {len(entry['items'])} URL(s) outstanding")
+                for url in entry["items"]:
+                    self._fail(url, "lease expired (worker lost)")
+                    self._end()
+
+    def _fail(self, url: str, error: str) -> None:
+        if self.state.mark_failed(url, error):
+            print(f"  ! Failed (will retry later): {error}")
+        else:
+            print(f"  ! Failed: {error}")
+
+    async def convert_worker(self) -> None:
+        while True:
+            item = await self.convert_q.get()
+            forwarded = False
+            try:
+                start = time.monotonic()
+                if item["converted"] is None:
+                    item["converted"] = await convert_in_pool(item.get("extracted") or item["html"], item["final_url"],
+                                                              self.domain, item["expand"])
+                if item.get("extracted"):
+                    # Only the main content exists on the Python side; archive that
+                    item["html"] = item.pop("extracted")["html"]
+                if not html_archive:
+                    item["html"] = None  # only the archive needs it past this point
+                self.stats["convert"].record(time.monotonic() - start)
+                if FOLLOW_CANONICAL and not self._resolve_alias(item):
+                    continue
+                if self.languages is not None and not self._check_language(item):
+                    continue
+                if self.traps.record_content(item["url"], item["converted"]["markdown"]):
+                    print(f"  🪤 Crawl trap: pages like {url_template(item['url'])} repeat the same content, pruning the rest")
+                if not self._check_near_duplicate(item):
+                    if NEAR_DUP_EXPAND_LINKS:
+                        await self._put_links(item["url"], item["converted"]["links"], item["depth"] + 1)
+                    continue
+                await self._put_links(item["url"], item["converted"]["links"], item["depth"] + 1)
+                await self.write_q.put(item)
+                forwarded = True
+            except Exception as e:
+                print(f"  ! Error converting {item['url']}: {e}")
+                self.state.mark_failed(item["url"], str(e))
+            finally:
+                if not forwarded:
+                    self._end()
+
+    def _resolve_alias(self, item: dict) -> bool:
+        """
+        Point item at the canonical URL its page declares (rel=canonical) or was redirected to, when
+        that differs from the URL fetched. Returns False if the canonical URL was already fetched,
+        in which case this copy is dropped instead of written twice. A rel=canonical to the site
+        root or to an ancestor path (a misconfigured template), or to a URL the crawl policy of
+        add() rejects, is ignored and the page is written under its own URL.
+        """
+        url = item["url"]
+        target, kind = item["converted"]["canonical"], "canonical"
+        if target and is_ancestor_url(target, url):
+            if verbose:
+                print(f"  ⤳ Ignoring rel=canonical to ancestor {target}")
+            self.dedup_counts["bad canonical"] += 1
+            target = None
+        if not target:
+            target = canonicalize_url(item["final_url"], self.domain, urlparse(item["final_url"]).scheme)
+            kind = "redirect"
+        if target == url or urlparse(target).netloc != self.domain or should_skip_url(target):
+            return True
+        if target not in self.visited and not self._admissible(target, item["depth"]):
+            return True
 
+        self.state.mark_alias(url, target)
+        self.dedup_counts[kind] += 1
+        if target in self.visited:
+            if verbose:
+                print(f"  ⤳ {kind.capitalize()} {target} already fetched, not writing {url}")
+            return False
+        # Claim the canonical URL so its own frontier entry (if any) is not fetched again
+        self.visited.add(target)
+        self.seen.add(target)
+        self.state.enqueue(target, item["depth"])
+        item["url"] = target
+        item["lastmod"] = self.sitemap.get(target, {}).get("lastmod", item["lastmod"])
+        if INCREMENTAL:
+            item["prev"] = self.state.previous(target)
+        if verbose:
+            print(f"  ⤳ {kind.capitalize()}: writing as {target}")
+        return True
+
+    def _check_language(self, item: dict) -> bool:
+        """
+        Returns False if the page is in an unwanted language (it becomes an alias of its wanted
+        hreflang alternate, which is queued, or is skipped). Otherwise records the page's unwanted
+        hreflang alternates as its aliases, so they are never queued, and returns True.
+        """
+        url, page = item["url"], item["converted"]
+        alternates = page.get("alternates") or {}
+        self.languages.learn(url, page.get("lang") if item["depth"] == 0 else None, alternates)
+        if item["depth"] == 0 or self.languages.wanted:
+            self.release_held()
+        if item["depth"] > 0 and self.languages.unwanted_page(page.get("lang")):
+            target = self.languages.wanted_alternate(alternates)
+            if target and target != url:
+                self.state.mark_alias(url, target)
+                self.add(target, item["depth"])
+            else:
+                self.state.mark_skipped(url)
+            self.languages.pruned += 1
+            if verbose:
+                print(f"  🌐 Not in {', '.join(sorted(self.languages.wanted))} ({page.get('lang')}), not writing {url}")
+            return False
+        for alternate in self.languages.unwanted_alternates(alternates):
+            if alternate != url and alternate not in self.seen:
+                self.seen.add(alternate)
+                self.state.enqueue(alternate, item["depth"] + 1)
+                self.state.mark_alias(alternate, url)
+                self.languages.aliased += 1
+        return True
+
+    def _check_near_duplicate(self, item: dict) -> bool:
+        """
+        Look the page's SimHash up in the LSH index. Returns False (and records the URL as an alias
+        of the first copy) when an already converted page is a near-duplicate, True otherwise.
+        """
+        value = item["converted"].get("simhash")
+        if value is None:
+            return True
+        original = self.near_dups.find(value)
+        if original is None or original == item["url"]:
+            self.near_dups.add(item["url"], value)
+            return True
+        self.state.mark_alias(item["url"], original)
+        self.dedup_counts["near-duplicate"] += 1
+        if verbose:
+            print(f"  ≈ Near-duplicate of {original}, not writing {item['url']}")
+        return False
+
+    async def write_worker(self) -> None:
+        global count
+
+        while True:
+            item = await self.write_q.get()
+            try:
+                start = time.monotonic()
+                url, prev = item["url"], item["prev"]
+                markdown, links = item["converted"]["markdown"], item["converted"]["links"]
+                content_hash = hashlib.sha1(markdown.encode("utf-8")).hexdigest()
+                relative_outfile = clean_filepath(url)
+                outfile = os.path.join(OUT_DIR, relative_outfile)
+
+                if prev and prev["content_hash"] == content_hash and os.path.exists(outfile):
+                    # Re-rendered but identical: keep the existing file, refresh the validators
+                    change_counts["unchanged"] += 1
+                else:
+                    if file_writer is not None:
+                        await asyncio.get_running_loop().run_in_executor(file_writer, write_markdown, outfile, url, markdown)
+                    else:
+                        write_markdown(outfile, url, markdown)
+                    change_counts["changed" if prev else "added"] += 1
+                    count += 1
+
+                if html_archive and item["html"]:
+                    meta = {"Tier": item["tier"], "Depth": item["depth"], "ETag": item["etag"],
+                            "Last-Modified": item["last_modified"]}
+                    await asyncio.get_running_loop().run_in_executor(file_writer, html_archive.append, url, item["html"], meta)
+
+                self.state.mark_ok(url, content_hash, relative_outfile, item["lastmod"], item["etag"],
+                                   item["last_modified"], links)
+                self.stats["write"].record(time.monotonic() - start)
+            except Exception as e:
+                print(f"  ! Failed to write {item['url']}: {e}")
+                self.state.mark_failed(item["url"], str(e))
+            finally:
+                self._end()
+
+    async def links_worker(self) -> None:
+        while True:
+            url, links, depth = await self.links_q.get()
+            try:
+                start = time.monotonic()
+                if self.graph is not None:
+                    self.graph.add_page(url, links)
+                for link in links:
+                    self.add(link, depth)
+                if self.graph is not None and self.graph.pages - self.graph.pages_at_rank >= PAGERANK_EVERY:
+                    self.graph.update_rank()
+                    self.frontier.rescore()
+                self.stats["links"].record(time.monotonic() - start)
+            finally:
+                self._end()
+
+    # -- lifecycle ------------------------------------------------------------
+
+    def start(self, browsers: BrowserPool) -> None:
+        self.browsers = self.fetcher.browsers = browsers
+        self.stats["fetch"].workers = len(browsers.slots)
+        self._start_stages([asyncio.create_task(self.fetch_worker(i)) for i in range(len(browsers.slots))])
+
+    def start_remote(self, broker) -> None:
+        """Coordinator of a distributed crawl: the fetch stage leases URLs to crawl_worker() nodes through broker."""
+        self.broker = broker
+        self.lease_slots = asyncio.Semaphore(LEASE_MAX_OUTSTANDING)
+        self.stats["fetch"].workers = LEASE_MAX_OUTSTANDING * LEASE_BATCH
+        self._start_stages([asyncio.create_task(self.dispatch_worker()), asyncio.create_task(self.collect_worker()),
+                            asyncio.create_task(self.expire_worker())])
+
+    def _start_stages(self, fetch_tasks: list) -> None:
+        for stats in self.stats.values():
+            stats.started = time.monotonic()
+        self.tasks = fetch_tasks
+        self.tasks += [asyncio.create_task(self.convert_worker()) for _ in range(CONVERT_STAGE_WORKERS)]
+        self.tasks += [asyncio.create_task(self.write_worker()) for _ in range(WRITE_WORKERS)]
+        self.tasks += [asyncio.create_task(self.links_worker()) for _ in range(LINK_WORKERS)]
+        if verbose and STAGE_REPORT_EVERY:
+            self.tasks.append(asyncio.create_task(self._report_progress()))
+
+    async def drain(self) -> None:
+        """Wait until every queued URL has gone through all stages (including the links it produced)."""
+        await self.idle.wait()
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def _report_progress(self) -> None:
+        while True:
+            await asyncio.sleep(STAGE_REPORT_EVERY)
+            print(f"\n📊 Pipeline after {time.monotonic() - self.stats['fetch'].started:.0f}s:")
+            for stats in self.stats.values():
+                print(f"   {stats.line()}")
+            print(f"   {self.memory_line()}")
+            if self.browsers is not None:
+                print(f"   {self.browsers.line()}")
+
+    def memory_line(self) -> str:
+        """Memory held by the URL structures, and the process peak RSS."""
+        mb = 1024 * 1024
+        graph = self.graph.nbytes if self.graph is not None else 0
+        # ru_maxrss is in KB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+        return (f"Memory: seen {len(self.seen):,} URLs in {url_set_bytes(self.seen) / mb:.1f} MB ({URL_SET_MODE}), "
+                f"visited {url_set_bytes(self.visited) / mb:.1f} MB, frontier {self.frontier.qsize():,} pending, "
+                f"link graph {graph / mb:.1f} MB, peak RSS {peak / mb:.0f} MB")
+
+    def report(self) -> None:
+        print("📊 Pipeline stages:")
+        for stats in self.stats.values():
+            print(f"   {stats.line()}")
+        bottleneck = max(self.stats.values(), key=lambda s: s.utilization())
+        print(f"   Busiest stage: {bottleneck.name} ({bottleneck.utilization() * 100:.0f}% busy)")
+        print(f"   {self.memory_line()}")
+        if self.browsers is not None:
+            print(f"   {self.browsers.line()}")
+        if self.dedup_counts:
+            print(f"🔗 URL dedup: {self.dedup_counts['link']:,} repeat link(s) not re-queued, "
+                  f"{self.dedup_counts['redirect']:,} redirect and {self.dedup_counts['canonical']:,} rel=canonical alias(es) "
+                  f"({self.dedup_counts['bad canonical']:,} rel=canonical to the root or a parent ignored), "
+                  f"{self.dedup_counts['near-duplicate']:,} near-duplicate(s), {self.dedup_counts['robots']:,} disallowed by robots.txt")
+        if self.languages is not None and (self.languages.pruned or self.languages.aliased):
+            print(f"🌐 Languages: keeping {', '.join(sorted(self.languages.wanted or ())) or 'all'}: "
+                  f"{self.languages.pruned:,} other-language URL(s) pruned, {self.languages.aliased:,} hreflang alternate(s) aliased")
+        for throttle in self.throttles.values():
+            print(f"🚦 {throttle.line()}")
+        if self.broker is not None:
+            print(f"🛰️  Remote workers: {len(self.worker_counts)} via {self.broker.url}, "
+                  f"{self.lease_counts['expired']:,} lease(s) expired, {self.lease_counts['stale']:,} late result(s) ignored")
+            for worker, n in sorted(self.worker_counts.items()):
+                print(f"   {worker}: {n:,} URL(s)")
+        self.traps.report()
+
+# ---------------------------------------------------------------------------
+# Multi-process (sharded) crawl
+# ---------------------------------------------------------------------------
+
+def shards_db_path(out_dir: str) -> str:
+    """Coordinator queue of a --processes crawl, e.g. /Users/nic/dl/kaltura-website.shards.sqlite"""
+    return f"{out_dir.rstrip('/')}.shards.sqlite"
+
+class ShardCoordinator:
+    """
+    SQLite queue shared by the crawl processes of a --processes crawl. Every canonical URL belongs
+    to shard_of(url): a process hands the links it does not own to the queue (INSERT OR IGNORE, so
+    a URL is queued once across all processes) and claims the pending rows of its own shard, which
+    it alone reads. The crawl is over when every shard reports idle and nothing is pending, read
+    in one snapshot, since a process only goes idle after pushing its outbox.
+    """
+
+    def __init__(self, path: str, shards: int, reset: bool = False):
+        self.path = path
+        self.shards = shards
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS queue (
+                url TEXT PRIMARY KEY,
+                depth INTEGER NOT NULL,
+                shard INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                lastmod TEXT,
+                priority REAL
+            );
+            CREATE INDEX IF NOT EXISTS queue_shard ON queue (shard, status);
+            CREATE TABLE IF NOT EXISTS workers (shard INTEGER PRIMARY KEY, idle INTEGER NOT NULL DEFAULT 0, stats TEXT);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        if reset:
+            self.db.executescript("DELETE FROM queue; DELETE FROM workers; DELETE FROM meta;")
+            self.db.execute("INSERT INTO meta (key, value) VALUES ('shards', ?)", (str(shards),))
+        self.db.commit()
+
+    def get_meta(self, key: str) -> str | None:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def push(self, urls, sitemap: dict = None) -> None:
+        """Queue (url, depth) pairs for their owning shards, with their sitemap lastmod / priority."""
+        sitemap = sitemap or {}
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO queue (url, depth, shard, lastmod, priority) VALUES (?, ?, ?, ?, ?)",
+                [(url, depth, shard_of(url, self.shards), sitemap.get(url, {}).get("lastmod"),
+                  sitemap.get(url, {}).get("priority")) for url, depth in urls],
+            )
+
+    def claim(self, shard: int, limit: int = None) -> list[tuple]:
+        """
+        Take up to limit pending (url, depth, lastmod, priority) rows of shard, shallowest first.
+        The shard stops being idle in the same transaction, so no other process can see nothing
+        pending and every shard idle in between and finish early.
+        """
+        with self.db:
+            rows = self.db.execute(
+                "SELECT url, depth, lastmod, priority FROM queue WHERE shard = ? AND status = 'pending' ORDER BY depth LIMIT ?",
+                (shard, limit or SHARD_CLAIM_BATCH),
+            ).fetchall()
+            self.db.executemany("UPDATE queue SET status = 'taken' WHERE url = ?", [(row[0],) for row in rows])
+            if rows:
+                self.db.execute("INSERT INTO workers (shard, idle) VALUES (?, 0) ON CONFLICT (shard) DO UPDATE SET idle = 0", (shard,))
+        return rows
+
+    def release(self, shard: int) -> None:
+        """Hand a restarted shard its claimed rows again (its pipeline skips the ones it already did)."""
+        with self.db:
+            self.db.execute("UPDATE queue SET status = 'pending' WHERE shard = ? AND status = 'taken'", (shard,))
+            self.set_idle(shard, False)
+
+    def abandon(self, shard: int) -> int:
+        """Drop a shard that keeps crashing, so the others can finish. Returns the URLs dropped."""
+        with self.db:
+            dropped = self.db.execute("DELETE FROM queue WHERE shard = ? AND status = 'pending'", (shard,)).rowcount
+            self.set_idle(shard, True)
+        return dropped
+
+    def set_idle(self, shard: int, idle: bool) -> None:
+        with self.db:
+            self.db.execute("INSERT INTO workers (shard, idle) VALUES (?, ?) ON CONFLICT (shard) DO UPDATE SET idle = excluded.idle",
+                            (shard, int(idle)))
+
+    def pending(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM queue WHERE status = 'pending'").fetchone()[0]
+
+    def finished(self) -> bool:
+        idle, pending = self.db.execute(
+            "SELECT (SELECT COUNT(*) FROM workers WHERE idle = 1), (SELECT COUNT(*) FROM queue WHERE status = 'pending')"
+        ).fetchone()
+        return idle >= self.shards and pending == 0
+
+    def put_stats(self, shard: int, stats: dict) -> None:
+        with self.db:
+            self.db.execute("INSERT INTO workers (shard, stats) VALUES (?, ?) ON CONFLICT (shard) DO UPDATE SET stats = excluded.stats",
+                            (shard, json.dumps(stats)))
+
+    def all_stats(self) -> dict[int, dict]:
+        return {shard: json.loads(stats) for shard, stats in self.db.execute("SELECT shard, stats FROM workers WHERE stats IS NOT NULL")}
+
+    def close(self) -> None:
+        self.db.close()
+
+async def exchange_with_coordinator(pipeline: CrawlPipeline, coordinator: ShardCoordinator) -> None:
+    """
+    Main loop of one process of a --processes crawl, instead of drain() + requeue_retries(): hand
+    links owned by other shards to the coordinator, feed this shard's URLs (and due retries) to the
+    pipeline, and return once every shard is idle with nothing pending anywhere.
+    """
+    shard = pipeline.shard[0]
+    languages = pipeline.languages
+    while True:
+        # The shard owning the start page learns the wanted language; the others adopt it
+        if languages is not None and languages.wanted and not coordinator.get_meta("languages"):
+            coordinator.set_meta("languages", ",".join(sorted(languages.wanted)))
+        elif languages is not None and not languages.wanted and coordinator.get_meta("languages"):
+            languages.wanted = set(coordinator.get_meta("languages").split(","))
+            pipeline.release_held()
+        outbox, pipeline.outbox = pipeline.outbox, []
+        if outbox:
+            coordinator.push(outbox)
+        claimed = coordinator.claim(shard)
+        for url, depth, lastmod, priority in claimed:
+            if lastmod or priority is not None:
+                pipeline.sitemap[url] = {"lastmod": lastmod, "priority": priority}
+            pipeline.add(url, depth)
+        due, wait = pipeline.state.due_retries() if pipeline.idle.is_set() else ([], None)
+        if due:
+            print(f"\n🔁 Retrying {len(due):,} failed URL(s)")
+        for url, depth in due:
+            pipeline.add(url, depth, retry=True)
+        # No await since the outbox was emptied, so nothing can have been queued in between
+        busy = bool(claimed or due or pipeline.outbox) or not pipeline.idle.is_set() or wait is not None
+        coordinator.set_idle(shard, not busy)
+        if not busy and coordinator.finished():
+            return
+        await asyncio.sleep(SHARD_POLL_SECONDS)
+
+SETTING_TYPES = (bool, int, float, str, tuple, list, dict, set, frozenset, type(None))
+
+def runtime_settings() -> dict:
+    """
+    The upper-case settings of this module and of browser_page as they are now (defaults, CLI
+    flags or a caller's overrides), for crawl_shard() to restore in its fresh interpreter.
+    """
+    def settings_of(module) -> dict:
+        return {name: value for name, value in vars(module).items() if name.isupper() and isinstance(value, SETTING_TYPES)}
+    return {"website2md": settings_of(sys.modules[__name__]), "browser_page": settings_of(browser_page)}
+
+def crawl_shard(shard: int, shards: int, settings: dict, resume: bool) -> None:
+    """Entry point of one crawl process of crawl_sharded(), in a fresh "spawn" interpreter."""
+    global MAX_PAGES, CONVERT_WORKERS, RATE_START, RATE_MIN, RATE_MAX, HOST_RATE_SHARE
+    globals().update(settings["website2md"])
+    for name, value in settings["browser_page"].items():
+        setattr(browser_page, name, value)
+    # Split the page budget, the CPUs and every host's request rate between the processes
+    MAX_PAGES = -(-MAX_PAGES // shards)
+    CONVERT_WORKERS = max(1, CONVERT_WORKERS // shards)
+    RATE_START, RATE_MIN, RATE_MAX = RATE_START / shards, RATE_MIN / shards, RATE_MAX / shards
+    HOST_RATE_SHARE = 1 / shards
+    browser_daemon.USE_BROWSER_DAEMON = False  # one browser per process
+    try:
+        asyncio.run(crawl(resume=resume, shard=(shard, shards)))
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+def merge_shard_page_ranks(shards: int) -> None:
+    """Rebuild the site's link graph from every shard's state file and export one page ranking."""
+    graph = LinkGraph()
+    outfiles = {}
+    for shard in range(shards):
+        state = CrawlState(state_db_path(OUT_DIR, shard), resume=True)
+        for url in state.done_urls():
+            prev = state.previous(url)
+            if prev and prev["links"]:
+                graph.add_page(url, prev["links"])
+        outfiles.update(state.written_outfiles())
+        state.close()
+    export_page_ranks(graph, outfiles, OUT_DIR)
+
+def report_shards(coordinator: ShardCoordinator) -> None:
+    """Merged totals of the per-process stats each shard left in the coordinator."""
+    global count, count_total
+
+    stats = coordinator.all_stats()
+    merged = defaultdict(lambda: defaultdict(int))
+    for shard_stats in stats.values():
+        for key in ("counts", "tiers", "changes"):
+            for name, n in shard_stats[key].items():
+                merged[key][name] += n
+    count = sum(s["count"] for s in stats.values())
+    count_total = sum(s["count_total"] for s in stats.values())
     mode = "full recursive crawl" if FULL_SCRAPE else "first-level only (home + linked pages)"
-    print(f"\n✅ Done! Saved {count}/{count_total} pages to {OUT_DIR} [{mode}]")
+    print(f"\n✅ All {len(stats)} processes done! Saved {count:,}/{count_total:,} pages to {OUT_DIR} [{mode}]")
+    for shard, s in sorted(stats.items()):
+        print(f"   shard {shard}: {s['count']:,}/{s['count_total']:,} pages in {s['seconds']:.0f}s "
+              f"({s['tiers'].get('http', 0):,} via HTTP, {s['tiers'].get('browser', 0):,} via browser)")
+    if merged["counts"].get("failed"):
+        print(f"⚠️  {merged['counts']['failed']:,} URL(s) failed after {MAX_RETRIES} attempts (see {state_db_path(OUT_DIR, 0)} etc.)")
+    renders = sum(s["renders"] for s in stats.values())
+    if renders:
+        print(f"⏱️  Render wait: avg {sum(s['render_ms'] for s in stats.values()) / renders:.0f}ms over {renders:,} pages")
+    if INCREMENTAL:
+        changes = merged["changes"]
+        changes["removed"] = change_counts["removed"]  # counted over all shards by report_removed_shard_pages()
+        print(f"🔄 Changes: {changes['added']:,} added, {changes['changed']:,} changed, "
+              f"{changes['unchanged']:,} unchanged, {changes['removed']:,} removed")
+    if HTTP_FIRST:
+        print(f"⚡ Fetch tiers: {merged['tiers']['http']:,} via HTTP, {merged['tiers']['browser']:,} via browser")
+
+def crawl_sharded(processes: int, resume: bool = False) -> None:
+    """
+    --processes N: crawl with N processes, each with its own browser, convert pool, HTML archive
+    and state file (state_db_path(OUT_DIR, shard)), all writing into the one OUT_DIR. URLs are
+    sharded by canonical URL hash through a ShardCoordinator, so each is fetched by exactly one
+    process; crashed processes are restarted from their state file. Resuming needs the same N.
+    """
+    os.makedirs(OUT_DIR, exist_ok=True)
+    path = shards_db_path(OUT_DIR)
+    coordinator = ShardCoordinator(path, processes)
+    stored = int(coordinator.get_meta("shards") or 0)
+    if resume and stored and stored != processes:
+        print(f"❌ {path} belongs to a crawl with --processes {stored}, resume with the same number")
+        coordinator.close()
+        sys.exit(1)
+
+    if resume and stored:
+        for shard in range(processes):
+            coordinator.release(shard)
+        print(f"♻️  Resuming sharded crawl from {path}: {coordinator.pending():,} URL(s) pending in the coordinator")
+    else:
+        coordinator.close()
+        coordinator = ShardCoordinator(path, processes, reset=True)
+        domain = urlparse(START_URL).netloc.lower()
+        seeds = {canonicalize_url(START_URL, domain): 0}
+        sitemap = {}
+        if FULL_SCRAPE:
+            session = make_http_session()
+            robots = load_robots(session, f"{urlparse(START_URL).scheme}://{domain}")
+            sitemap = get_sitemap_urls(START_URL, domain, session, robots)
+            for url in sitemap:
+                seeds.setdefault(url, 1)
+        else:
+            print("🔍 First-level scrape: home page + pages linked from it")
+        coordinator.push(seeds.items(), sitemap)
+
+    settings = runtime_settings()
+    mp = multiprocessing.get_context("spawn")
+
+    def launch(shard: int, resume_shard: bool):
+        proc = mp.Process(target=crawl_shard, args=(shard, processes, settings, resume_shard), name=f"crawl-shard-{shard}")
+        proc.start()
+        return proc
+
+    print(f"🧩 Sharded crawl: {processes} processes coordinated through {path}")
+    procs = {shard: launch(shard, resume) for shard in range(processes)}
+    restarts = abandoned = 0
+    try:
+        while procs:
+            for shard, proc in list(procs.items()):
+                proc.join(timeout=1)
+                if proc.is_alive():
+                    continue
+                del procs[shard]
+                if proc.exitcode == 0:
+                    continue
+                if restarts < SHARD_MAX_RESTARTS:
+                    restarts += 1
+                    print(f"💥 Shard {shard} exited with code {proc.exitcode}, restarting it from {state_db_path(OUT_DIR, shard)}")
+                    coordinator.release(shard)
+                    procs[shard] = launch(shard, True)
+                else:
+                    abandoned += 1
+                    print(f"💥 Shard {shard} exited with code {proc.exitcode}, giving up on it: "
+                          f"{coordinator.abandon(shard):,} pending URL(s) dropped")
+    except KeyboardInterrupt:
+        # The shards got the same SIGINT and save their state; wait for them before leaving
+        for proc in procs.values():
+            proc.join()
+        coordinator.close()
+        raise
+
+    # Only a complete crawl tells which pages are gone: no shard lost, none stopped by its page budget
+    stats = coordinator.all_stats()
+    if INCREMENTAL and FULL_SCRAPE and not abandoned and len(stats) == processes and all(s["complete"] for s in stats.values()):
+        report_removed_shard_pages(processes)
+    report_shards(coordinator)
+    coordinator.close()
+    if LINK_GRAPH:
+        merge_shard_page_ranks(processes)
+
+# ---------------------------------------------------------------------------
+# Distributed crawl: worker nodes (the coordinator is crawl() with a broker)
+# ---------------------------------------------------------------------------
+
+async def fetch_for_lease(fetcher: PageFetcher, slot: int, entry: dict, archive: bool) -> dict:
+    """Fetch and convert one leased URL into a JSON-safe PageFetcher outcome for the coordinator."""
+    url = entry["url"]
+    print(f"→ [w{slot}] Fetching: {url}")
+    try:
+        outcome = await fetcher.fetch(slot, url, entry["expand"], entry["prev"])
+        if "tier" in outcome and outcome.get("converted") is None:
+            extracted = outcome.pop("extracted", None)
+            outcome["converted"] = await convert_in_pool(extracted or outcome["html"], outcome["final_url"],
+                                                         fetcher.domain, entry["expand"])
+            if extracted:
+                outcome["html"] = extracted["html"]
+    except Exception as e:
+        outcome = {"error": str(e)}
+    if "error" in outcome:
+        print(f"  ! Failed: {outcome['error']}")
+    if "tier" in outcome:
+        if not archive:
+            outcome["html"] = None
+        outcome["converted"]["links"] = sorted(outcome["converted"]["links"])
+    return outcome
+
+async def crawl_worker(broker, name: str = None) -> None:
+    """
+    --worker: a node of a distributed crawl. Takes leases from the broker, fetches and converts
+    each URL like a local crawl (HTTP tier, else its own BrowserPool) and sends back markdown,
+    links and validators one result at a time. Taking a lease is acknowledged first, which starts
+    its LEASE_SECONDS clock on the coordinator; every result renews it. Serves up to
+    PAGE_POOL_SIZE leases at once and returns when the coordinator marks the crawl finished.
+    Each node paces hosts on its own, so size RATE_MAX for the number of nodes.
+    """
+    global convert_pool, convert_slots
+
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    own_pool = convert_pool is None
+    if own_pool:
+        convert_pool = ProcessPoolExecutor(max_workers=CONVERT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        convert_slots = asyncio.Semaphore(CONVERT_WORKERS * 2)
+    session = make_http_session()
+    fetchers = {}  # domain -> PageFetcher, opened on the first lease for that site
+    opening = asyncio.Lock()
+    served = defaultdict(int)
+
+    async with async_playwright() as p:
+        launch_opts = browser_launch_opts()
+
+        async def fetcher_for(task: dict) -> PageFetcher:
+            async with opening:
+                domain = task["domain"]
+                if domain not in fetchers:
+                    robots = load_robots(session, f"{task['scheme']}://{domain}") if RESPECT_ROBOTS else None
+                    fetcher = PageFetcher(domain, session, robots)
+                    fetcher.browsers = BrowserPool(lambda: open_browser(p, launch_opts), domain, max(1, PAGE_POOL_SIZE))
+                    await fetcher.browsers.open()
+                    fetchers[domain] = fetcher
+                    print(f"🧵 Serving {domain}: {len(fetcher.browsers.slots)} pages")
+                return fetchers[domain]
+
+        async def serve(slot: int) -> None:
+            while True:
+                task = await broker.get_task(timeout=WORKER_POLL_SECONDS)
+                if task is None:
+                    if await broker.finished():
+                        return
+                    continue
+                await broker.put_result({"lease": task["lease"], "worker": name, "taken": True})
+                fetcher = await fetcher_for(task)
+                for entry in task["urls"]:
+                    outcome = await fetch_for_lease(fetcher, slot, entry, task["archive"])
+                    await broker.put_result({"lease": task["lease"], "url": entry["url"], "worker": name, "outcome": outcome})
+                    served["error" if "error" in outcome else "ok"] += 1
+
+        print(f"🛰️  Worker {name} waiting for leases via {broker.url}")
+        try:
+            await asyncio.gather(*(serve(slot) for slot in range(max(1, PAGE_POOL_SIZE))))
+        finally:
+            for fetcher in fetchers.values():
+                await fetcher.browsers.close()
+            if own_pool:
+                convert_pool.shutdown(cancel_futures=True)
+                convert_pool = None
+
+    print(f"\n✅ Worker {name} done: {served['ok']:,} URL(s) fetched, {served['error']:,} failed")
+
+async def requeue_retries(pipeline: CrawlPipeline) -> None:
+    """Once the pipeline has drained, feed failed URLs back in as their backoff expires."""
+    state = pipeline.state
+    while True:
+        due, wait = state.due_retries()
+        if due:
+            print(f"\n🔁 Retrying {len(due):,} failed URL(s)")
+            for url, depth in due:
+                pipeline.add(url, depth, retry=True)
+            await pipeline.drain()
+            continue
+        if wait is None:
+            return
+        state.checkpoint()
+        print(f"⏳ Next retry in {wait:.0f}s")
+        await asyncio.sleep(wait)
+
+def report_removed_pages(state: CrawlState) -> None:
+    """
+    --incremental: pages written by an earlier run that this run did not reach any more. Only
+    meaningful after a complete full crawl, so crawl() calls it only then.
+    """
+    removed = state.removed_urls()
+    delete_removed_pages(removed)
+    state.forget([url for url, _ in removed])
+
+def report_removed_shard_pages(shards: int) -> None:
+    """
+    --incremental --processes N: removed pages over every shard's state at once, once all shards
+    are done. Which shard owns a URL changes with N, and a shard writes canonical URLs that other
+    shards own, so one shard's history cannot tell a removed page from one another shard reached.
+    History left by earlier runs with another N (or without --processes) is included.
+    """
+    current = [state_db_path(OUT_DIR, shard) for shard in range(shards)]
+    earlier = sorted(set(glob.glob(f"{glob.escape(OUT_DIR.rstrip('/'))}.crawl.*.sqlite")) - set(current))
+    if os.path.exists(state_db_path(OUT_DIR)):
+        earlier.append(state_db_path(OUT_DIR))
+    states = [CrawlState(path, resume=True) for path in current + earlier]
+    reached, live, removed = set(), set(), {}
+    for state in states[:shards]:
+        reached |= state.reached_urls()
+        live.update(state.written_outfiles().values())
+    for state in states:
+        for url, outfile in state.history_outfiles().items():
+            if url not in reached:
+                removed[url] = outfile
+    delete_removed_pages([(url, None if outfile in live else outfile) for url, outfile in sorted(removed.items())])
+    for state in states:
+        state.forget(list(removed))
+        state.close()
+
+def delete_removed_pages(removed: list[tuple[str, str | None]]) -> None:
+    """Report (url, outfile) pairs of removed pages and delete their .md files (outfile None = keep the file)."""
+    if not removed:
+        return
+    print(f"🗑️  {len(removed):,} page(s) removed from the site since the last run")
+    for url, outfile in removed:
+        if verbose:
+            print(f"  - {url}")
+        if INCREMENTAL_DELETE_REMOVED and outfile and os.path.exists(os.path.join(OUT_DIR, outfile)):
+            os.remove(os.path.join(OUT_DIR, outfile))
+    change_counts["removed"] = len(removed)
+
+async def crawl(resume: bool = False, shard: tuple[int, int] = None, broker_url: str = None):
+    """
+    Crawl START_URL into OUT_DIR; shard = (index, count) when running as one process of
+    crawl_sharded(), broker_url to coordinate a distributed crawl instead of fetching locally.
+    """
+    global convert_pool, convert_slots, file_writer, html_archive
 
-asyncio.run(crawl())
+    os.makedirs(OUT_DIR, exist_ok=True)
 
-# Aggregate output
+    crawl_start = time.monotonic()
+    index = shard[0] if shard else None
+    state = CrawlState(state_db_path(OUT_DIR, index), resume=resume)
+    domain = urlparse(START_URL).netloc.lower()
+    start_url = canonicalize_url(START_URL, domain)
+    session = make_http_session() if HTTP_FIRST or INCREMENTAL else None
+    origin = f"{urlparse(start_url).scheme}://{domain}"
+    robots = load_robots(session or make_http_session(), origin) if RESPECT_ROBOTS or FULL_SCRAPE else None
+    # Sharded: the coordinator was seeded with the sitemap and hands out its lastmod / priority
+    sitemap = get_sitemap_urls(START_URL, domain, session, robots) if FULL_SCRAPE and not shard else {}
+    pipeline = CrawlPipeline(state, domain, session, sitemap, robots if RESPECT_ROBOTS else None, shard)
+    coordinator = ShardCoordinator(shards_db_path(OUT_DIR), shard[1]) if shard else None
+    broker = make_broker(broker_url) if broker_url else None
+    if shard and pipeline.languages is not None:
+        pipeline.languages.learn(start_url, None, {})  # the start page may belong to another shard
+
+    frontier = state.frontier() if resume else []
+    retries = state.retry_urls() if resume else []
+    if frontier or retries or (resume and shard):
+        for url in state.done_urls():
+            pipeline.visited.add(url)
+            pipeline.seen.add(url)
+            prev = state.previous(url) if pipeline.graph is not None else None
+            if prev and prev["links"]:
+                pipeline.graph.add_page(url, prev["links"])
+        # Failed URLs keep their backoff: requeue_retries() / exchange_with_coordinator() feed them in when due
+        for url in retries:
+            pipeline.visited.add(url)
+            pipeline.seen.add(url)
+        for url, depth in frontier:
+            pipeline.add(url, depth)
+        print(f"♻️  Resuming from {state.path}: {len(pipeline.visited) - len(retries):,} done, {len(frontier):,} in frontier, "
+              f"{len(retries):,} waiting to retry")
+    elif shard:
+        state.set_meta("start_url", START_URL)
+    else:
+        if resume:
+            print(f"♻️  Nothing to resume in {state.path}, starting fresh")
+        state.set_meta("start_url", START_URL)
+        pipeline.add(start_url, 0)
+        if FULL_SCRAPE:
+            for sitemap_url in sitemap:
+                pipeline.add(sitemap_url, 1)
+        else:
+            print("🔍 First-level scrape: home page + pages linked from it")
+        state.checkpoint()
+
+    if INCREMENTAL:
+        print("🔄 Incremental: skipping pages unchanged since the last run")
+    if URL_SET_MODE != "set" and LINK_GRAPH and not index:
+        print(f"⚠️  URL_SET_MODE = {URL_SET_MODE!r} only shrinks the seen/visited sets: the link graph and the "
+              f"frontier still hold URL strings (LINK_GRAPH = False drops the graph's)")
+
+    # CPU-bound conversion in worker processes ("spawn" so children never inherit the browser
+    # driver's threads), disk writes on one background thread
+    convert_pool = ProcessPoolExecutor(max_workers=CONVERT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    convert_slots = asyncio.Semaphore(CONVERT_WORKERS * 2)
+    file_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="md-writer")
+    print(f"⚙️  Converting in {CONVERT_WORKERS} process(es), writing on a background thread")
+    if ARCHIVE_HTML:
+        html_archive = HtmlArchive(archive_path(OUT_DIR, index))
+        print(f"📦 Archiving HTML to {html_archive.path}")
+
+    # A coordinator renders nothing itself, so it needs no browser
+    async with async_playwright() if broker is None else contextlib.nullcontext() as p:
+        browsers = local_worker = None
+        if broker is None:
+            launch_opts = browser_launch_opts()
+            browsers = BrowserPool(lambda: open_browser(p, launch_opts), domain, max(1, PAGE_POOL_SIZE))
+            await browsers.open()
+            print(f"🧵 Page pool: {len(browsers.slots)} pages across {len(browsers.contexts)} context(s), max {MAX_PER_HOST} per host")
+            pipeline.start(browsers)
+        else:
+            # Leases of an earlier coordinator are unknown to this one; their URLs are back in the frontier
+            await broker.reset()
+            print(f"🛰️  Coordinating remote workers via {broker.url}: leases of {LEASE_BATCH} URLs, "
+                  f"{LEASE_MAX_OUTSTANDING} out at a time, {LEASE_SECONDS}s to report back")
+            pipeline.start_remote(broker)
+            if isinstance(broker, InProcessBroker):
+                local_worker = asyncio.create_task(crawl_worker(broker))
 
-FINAL_DIR = url_to_final_folder(START_URL)
+        try:
+            if coordinator is not None:
+                await exchange_with_coordinator(pipeline, coordinator)
+            else:
+                await pipeline.drain()
+                await requeue_retries(pipeline)
+            # Sharded: crawl_sharded() does this over all shards once every one has finished
+            if INCREMENTAL and FULL_SCRAPE and len(pipeline.visited) < MAX_PAGES and not shard:
+                report_removed_pages(state)
+        finally:
+            await pipeline.stop()
+            if broker is not None:
+                await broker.finish()
+                if local_worker is not None:
+                    await asyncio.gather(local_worker, return_exceptions=True)
+                await broker.close()
+            # Flush pending .md writes before recording the state as final
+            file_writer.shutdown(wait=True)
+            convert_pool.shutdown(cancel_futures=True)
+            if html_archive:
+                html_archive.close()
+            if pipeline.graph is not None and not shard:
+                export_page_ranks(pipeline.graph, state.written_outfiles(), OUT_DIR)
+            # Commit whatever was done, including on Ctrl-C, so --resume can pick it up
+            final_counts = state.counts()
+            state.close()
+
+        if browsers is not None:
+            await browsers.close()
+
+    if coordinator is not None:
+        coordinator.put_stats(index, {
+            "count": count, "count_total": count_total, "counts": final_counts, "tiers": dict(tier_counts),
+            "changes": dict(change_counts), "render_ms": sum(render_waits), "renders": len(render_waits),
+            "seconds": time.monotonic() - crawl_start, "complete": len(pipeline.visited) < MAX_PAGES,
+        })
+        coordinator.close()
 
-aggregate_md_files(OUT_DIR, FINAL_DIR + ".md", START_URL)
+    mode = "full recursive crawl" if FULL_SCRAPE else "first-level only (home + linked pages)"
+    print(f"\n✅ Done! Saved {count}/{count_total} pages to {OUT_DIR} [{mode}]")
+    if final_counts.get("failed"):
+        print(f"⚠️  {final_counts['failed']:,} URL(s) failed after {MAX_RETRIES} attempts (see {state.path})")
+    pipeline.report()
+    if html_archive and html_archive.records:
+        print(f"📦 Archived {html_archive.records:,} pages: {html_archive.bytes_in / 1024 / 1024:.1f} MB of HTML -> "
+              f"{os.path.getsize(html_archive.path) / 1024 / 1024:.1f} MB in {html_archive.path} (total)")
+    if render_waits:
+        waits = sorted(render_waits)
+        print(f"⏱️  Render wait: avg {sum(waits) / len(waits):.0f}ms, median {waits[len(waits) // 2]}ms, max {waits[-1]}ms")
+    if extract_bytes["pages"]:
+        print(f"✂️  In-browser extraction: {extract_bytes['shipped'] / 1024 / 1024:.1f} MB shipped instead of "
+              f"{extract_bytes['dom'] / 1024 / 1024:.1f} MB of DOM over {extract_bytes['pages']:,} pages "
+              f"({1 - extract_bytes['shipped'] / max(extract_bytes['dom'], 1):.0%} less)")
+    if INCREMENTAL:
+        print(f"🔄 Changes: {change_counts['added']:,} added, {change_counts['changed']:,} changed, "
+              f"{change_counts['unchanged']:,} unchanged, {change_counts['removed']:,} removed")
+    if browsers is not None:
+        print_blocking_report(browsers.blocking_stats)
+    if HTTP_FIRST:
+        print(f"⚡ Fetch tiers: {tier_counts['http']:,} via HTTP, {tier_counts['browser']:,} via browser")
+        for host, stats in pipeline.host_stats.items():
+            learned = host_tier(pipeline.host_stats, host)
+            if learned:
+                print(f"   {host}: learned '{learned}' ({stats['static']} static, {stats['escalated']} escalated)")
 
 ########################################################################################################
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Crawl a website and save its pages as Markdown')
+    parser.add_argument('--url', help='Start URL (default: URL of the active Chrome tab)')
+    parser.add_argument('--resume', action='store_true', help='Continue the previous crawl of this site from its state file')
+    parser.add_argument('--incremental', action='store_true', help='Only re-render pages changed since the last run (sitemap lastmod, ETag, Last-Modified, content hash)')
+    parser.add_argument('--archive', action='store_true', help='Also store fetched HTML in <OUT_DIR>.warc.gz')
+    parser.add_argument('--reconvert', action='store_true', help='Rebuild all .md files from the HTML archive instead of crawling')
+    parser.add_argument('--processes', type=int, default=CRAWL_PROCESSES, help='Crawl with N processes, each with its own browser, sharding URLs by hash')
+    parser.add_argument('--broker', default=BROKER_URL, help='Distributed crawl: coordinate worker nodes through this broker (redis://host:port/db, or memory:// for one local worker)')
+    parser.add_argument('--worker', action='store_true', help='Run as a worker node of the distributed crawl on --broker')
+    args = parser.parse_args()
+    INCREMENTAL = INCREMENTAL or args.incremental
+    ARCHIVE_HTML = ARCHIVE_HTML or args.archive
+
+    if args.worker:
+        if not args.broker:
+            print("\n❌ --worker needs --broker", file=sys.stderr)
+            sys.exit(1)
+        try:
+            asyncio.run(crawl_worker(make_broker(args.broker)))
+        except KeyboardInterrupt:
+            print(f"\n⏸️  Worker interrupted; the coordinator re-queues its leases after {LEASE_SECONDS}s.")
+            sys.exit(130)
+        sys.exit(0)
+
+    START_URL = args.url or get_chrome_active_tab_url()
+    if not START_URL:
+        print("\n❌ No start URL (pass --url or open the site in Chrome)", file=sys.stderr)
+        sys.exit(1)
+    OUT_DIR = url_to_dl_folder(START_URL)
+
+    try:
+        if args.reconvert:
+            if not reconvert_from_archive(OUT_DIR, START_URL):
+                sys.exit(1)
+        elif args.broker:
+            asyncio.run(crawl(resume=args.resume, broker_url=args.broker))
+        elif args.processes > 1:
+            crawl_sharded(args.processes, resume=args.resume)
+        else:
+            asyncio.run(crawl(resume=args.resume))
+    except KeyboardInterrupt:
+        print(f"\n⏸️  Interrupted. State saved to {state_db_path(OUT_DIR)} - run again with --resume to continue.")
+        sys.exit(130)
+
+    if BOILERPLATE_LEARNING:
+        strip_site_boilerplate(OUT_DIR)
+
+    # Aggregate output
+
+    FINAL_DIR = url_to_final_folder(START_URL)
+
+    aggregate_md_files(OUT_DIR, FINAL_DIR + ".md", START_URL)
+
     print('\n\n-------------------------------')
     print(f"\ncount_row:\t{count_row:,}")
     print(f"count_total:\t{count_total:,}")
@@ -375,4 +3377,4 @@ if __name__ == '__main__':
     elif run_time < 3600:
         print(f'\n{os.path.basename(__file__)} finished in {round(run_time/60)}mns at {datetime.now().strftime("%H:%M:%S")}.\n')
     else:
-        print(f'\n{os.path.basename(__file__)} finished in {round(run_time/3600, 2)}hrs at {datetime.now().strftime("%H:%M:%S")}.\n')
\ No newline at end of file
+        print(f'\n{os.path.basename(__file__)} finished in {round(run_time/3600, 2)}hrs at {datetime.now().strftime("%H:%M:%S")}.\n')
@@ -60,6 +60,7 @@ from bs4 import BeautifulSoup
 from markdownify import markdownify as md
 
 from aggregate_md import aggregate_md_files
+from browser_page import track_network, wait_for_render, EXTRACT_MAIN_JS  # render wait settings: RENDER_* there
 
 # Define a set of file extensions to skip (non-HTML resources).
 SKIP_EXTENSIONS = {
@@ -131,6 +132,10 @@ def get_chrome_active_tab_url():
 START_URL = get_chrome_active_tab_url()
 
 MAX_PAGES = 10000  # safety limit
+# Strip each page to its main content inside the cloud browser (EXTRACT_MAIN_JS) and ship only that,
+# instead of the whole DOM from page.content() over the Browserbase connection
+EXTRACT_IN_BROWSER = True
+EXTRACT_MIN_TEXT_CHARS = 200  # less main-content text than this = EXTRACT_MAIN_JS picks the block with the most <p> text
 
 count = 0
 count_total = 0
@@ -175,12 +180,11 @@ def clean_filepath(url: str) -> str:
     else:
         return filename_md
 
-def extract_links(html: str, base_url: str, domain: str) -> set[str]:
-    soup = BeautifulSoup(html, "html.parser")
+def links_from_hrefs(hrefs, base_url: str, domain: str) -> set[str]:
     links = set()
 
-    for a in soup.find_all("a", href=True):
-        href = a["href"].strip()
+    for href in hrefs:
+        href = href.strip()
         if href.startswith(("mailto:", "tel:", "#", "javascript:")):
             continue
 
@@ -194,31 +198,54 @@ def extract_links(html: str, base_url: str, domain: str) -> set[str]:
 
     return links
 
+def extract_links(html: str, base_url: str, domain: str) -> set[str]:
+    soup = BeautifulSoup(html, "html.parser")
+    return links_from_hrefs((a["href"] for a in soup.find_all("a", href=True)), base_url, domain)
+
+# Boilerplate selectors, shared by extract_main_content() and EXTRACT_MAIN_JS (as EXTRACT_RULES)
+JUNK_TAGS = ["script", "style", "noscript", "svg", "iframe"]
+LAYOUT_TAGS = ["header", "footer", "nav"]
+BOILERPLATE_ID_RE = re.compile(r"(header|footer|nav|menu|sidebar|cookie|banner)", re.I)
+BOILERPLATE_CLASS_RE = re.compile(r"(header|footer|nav|menu|sidebar|cookie|banner|top-bar|bottom-bar)", re.I)
+BOILERPLATE_ROLE_RE = re.compile(r"(banner|navigation|contentinfo)", re.I)
+DATA_SECTION_RE = re.compile(r"(header|footer)", re.I)
+MAIN_ID_RE = re.compile(r"(main|content|primary)", re.I)
+MAIN_CLASS_RE = re.compile(r"(main-content|page-content|entry-content|post-content)", re.I)
+INNER_NAV_CLASS_RE = re.compile(r"(breadcrumb|pagination|share|social)", re.I)
+
+EXTRACT_RULES = {
+    "junk": JUNK_TAGS, "layout": LAYOUT_TAGS,
+    "boilerplate_id": BOILERPLATE_ID_RE.pattern, "boilerplate_class": BOILERPLATE_CLASS_RE.pattern,
+    "boilerplate_role": BOILERPLATE_ROLE_RE.pattern, "data_section": DATA_SECTION_RE.pattern,
+    "main_id": MAIN_ID_RE.pattern, "main_class": MAIN_CLASS_RE.pattern,
+    "inner_nav_class": INNER_NAV_CLASS_RE.pattern, "min_text": EXTRACT_MIN_TEXT_CHARS,
+}
+
 def extract_main_content(html: str) -> str:
     soup = BeautifulSoup(html, "html.parser")
 
-    for tag in soup(["script", "style", "noscript", "svg", "iframe"]):
+    for tag in soup(JUNK_TAGS):
         tag.decompose()
 
-    for tag in soup.find_all(["header", "footer", "nav"]):
+    for tag in soup.find_all(LAYOUT_TAGS):
         tag.decompose()
 
     for selector in [
-        {"id": re.compile(r"(header|footer|nav|menu|sidebar|cookie|banner)", re.I)},
-        {"class_": re.compile(r"(header|footer|nav|menu|sidebar|cookie|banner|top-bar|bottom-bar)", re.I)},
-        {"role": re.compile(r"(banner|navigation|contentinfo)", re.I)},
+        {"id": BOILERPLATE_ID_RE},
+        {"class_": BOILERPLATE_CLASS_RE},
+        {"role": BOILERPLATE_ROLE_RE},
     ]:
         for tag in soup.find_all(**selector):
             tag.decompose()
 
-    for tag in soup.find_all(attrs={"data-section": re.compile(r"(header|footer)", re.I)}):
+    for tag in soup.find_all(attrs={"data-section": DATA_SECTION_RE}):
         tag.decompose()
 
     main_content = (
         soup.find("main") or
         soup.find("article") or
-        soup.find(id=re.compile(r"(main|content|primary)", re.I)) or
-        soup.find(class_=re.compile(r"(main-content|page-content|entry-content|post-content)", re.I)) or
+        soup.find(id=MAIN_ID_RE) or
+        soup.find(class_=MAIN_CLASS_RE) or
         soup.find(role="main") or
         soup.body
     )
@@ -226,7 +253,7 @@ def extract_main_content(html: str) -> str:
     if not main_content:
         return ""
 
-    for tag in main_content.find_all(class_=re.compile(r"(breadcrumb|pagination|share|social)", re.I)):
+    for tag in main_content.find_all(class_=INNER_NAV_CLASS_RE):
         tag.decompose()
 
     return str(main_content)
@@ -254,6 +281,9 @@ async def crawl():
 
     async with Stagehand(stagehand_config) as stagehand:
         page = stagehand.page                     # Stagehand exposes a Playwright-compatible page
+        inflight = track_network(page)
+        render_waits = []
+        dom_chars = shipped_chars = 0
 
         while to_visit and len(visited) < MAX_PAGES:
             url = to_visit.pop(0)
@@ -270,15 +300,26 @@ async def crawl():
             visited.add(url)
 
             try:
+                nav_start = time.monotonic()
                 await page.goto(url, wait_until="domcontentloaded", timeout=60000)
                 # Give JS a moment to render dynamic content
-                await page.wait_for_timeout(3000)
-                html = await page.content()
+                waited = await wait_for_render(page, inflight, nav_start)
+                if EXTRACT_IN_BROWSER:
+                    extracted = await page.evaluate(EXTRACT_MAIN_JS, EXTRACT_RULES)
+                    main_html, hrefs = extracted["html"], extracted["links"]
+                    dom_chars += extracted["dom_chars"]
+                    shipped_chars += len(main_html) + sum(len(href) for href in hrefs)
+                else:
+                    html = await page.content()
+                    main_html = extract_main_content(html)
             except Exception as e:
                 print(f"  ! Failed: {e}")
                 continue
 
-            main_html = extract_main_content(html)
+            render_waits.append(waited)
+            if verbose:
+                print(f"  ⏱️  Rendered in {waited}ms")
+
             markdown = md(main_html, heading_style="ATX", strip=["a"])
 
             markdown = re.sub(r"\n{3,}", "\n\n", markdown).strip()
@@ -292,12 +333,18 @@ async def crawl():
 
             count += 1
 
-            new_links = extract_links(html, url, domain)
+            new_links = links_from_hrefs(hrefs, url, domain) if EXTRACT_IN_BROWSER else extract_links(html, url, domain)
             for link in new_links:
                 if link not in visited:
                     to_visit.append(link)
 
     print(f"\n✅ Done! Saved {count}/{count_total} pages to {OUT_DIR}")
+    if render_waits:
+        waits = sorted(render_waits)
+        print(f"⏱️  Render wait: avg {sum(waits) / len(waits):.0f}ms, median {waits[len(waits) // 2]}ms, max {waits[-1]}ms")
+    if dom_chars:
+        print(f"✂️  In-browser extraction: {shipped_chars / 1024 / 1024:.1f} MB shipped instead of "
+              f"{dom_chars / 1024 / 1024:.1f} MB of DOM ({1 - shipped_chars / dom_chars:.0%} less)")
 
 asyncio.run(crawl())
 
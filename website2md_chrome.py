@@ -59,6 +59,9 @@ from playwright.async_api import async_playwright
 from bs4 import BeautifulSoup
 from markdownify import markdownify as md
 
+from browser_daemon import open_browser
+from browser_page import track_network, wait_for_render, install_request_blocking, print_blocking_report  # settings: RENDER_*, BLOCK_* there
+
 # Removed aggregate_md import as the flattening is not used anymore.
 # from aggregate_md import aggregate_md_files
 
@@ -84,6 +87,7 @@ def get_chrome_active_tab_url():
 
 START_URL = get_chrome_active_tab_url()
 MAX_PAGES = 5000  # safety limit
+USE_BROWSER_DAEMON = False  # True = reuse the headless browser daemon when it runs (bot-sensitive sites may see the difference)
 
 count = 0
 count_total = 0
@@ -215,7 +219,11 @@ async def crawl():
     domain = urlparse(START_URL).netloc
 
     async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False)
+        if USE_BROWSER_DAEMON:
+            # Warm daemon browser when running (its own context keeps the UA/viewport below), else a visible one
+            browser, _ = await open_browser(p, {"headless": False})
+        else:
+            browser = await p.chromium.launch(headless=False)
         context = await browser.new_context(
             user_agent="Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
             viewport={"width": 1920, "height": 1080},
@@ -226,6 +234,9 @@ async def crawl():
         """)
 
         page = await context.new_page()
+        blocking_stats = await install_request_blocking(page, domain)
+        inflight = track_network(page)
+        render_waits = []
 
         while to_visit and len(visited) < MAX_PAGES:
             url = to_visit.pop(0)
@@ -238,13 +249,18 @@ async def crawl():
             visited.add(url)
 
             try:
+                nav_start = time.monotonic()
                 await page.goto(url, wait_until="domcontentloaded", timeout=60000)
-                await page.wait_for_timeout(3000)
+                waited = await wait_for_render(page, inflight, nav_start)
                 html = await page.content()
             except Exception as e:
                 print(f"  ! Failed: {e}")
                 continue
 
+            render_waits.append(waited)
+            if verbose:
+                print(f"  ⏱️  Rendered in {waited}ms")
+
             main_html = extract_main_content(html)
             markdown = md(main_html, heading_style="ATX", strip=["a"])
 
@@ -267,6 +283,10 @@ async def crawl():
         await browser.close()
 
     print(f"\n✅ Done! Saved {count}/{count_total} pages to {OUT_DIR}")
+    if render_waits:
+        waits = sorted(render_waits)
+        print(f"⏱️  Render wait: avg {sum(waits) / len(waits):.0f}ms, median {waits[len(waits) // 2]}ms, max {waits[-1]}ms")
+    print_blocking_report([blocking_stats])
 
 asyncio.run(crawl())
 